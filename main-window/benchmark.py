@@ -0,0 +1,193 @@
+#!/usr/bin/env python3
+#
+#   benchmark.py
+#   Benchmarks for building the main window menus and dispatching their actions. Run directly, e.g. python benchmark.py
+#   Using Python 3.6 and PySide2 v.5.12
+#
+#   Copyright (C) 2019 Robert Parker
+#
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with this program. If not, see <https://www.gnu.org/licenses/>.
+
+
+import sys
+import time
+import argparse
+from PySide2.QtWidgets import QApplication, QMainWindow, QMenuBar, QMenu, QAction
+from PySide2.QtCore import QCoreApplication
+from menus import MenuRegistry
+
+
+class LegacyMenuWindow(QMainWindow):
+    """MainWindow's menu building and signals as they were before the menu registry, kept for comparison"""
+
+    def __init__(self, menu_list, object_name="MainWindow"):
+        super().__init__()
+        self.menu_list = menu_list
+        self.menu_bar = QMenuBar(self)
+        self.menu_heads = {}
+        self.menu_items = {}
+        self.calls = 0
+        self.setup_menu(object_name)
+        self.menu_signals()
+
+    def menu_operations(self, head, item, subitem=None):
+        self.calls += 1
+
+    def menu_signals(self):
+        for head, option in self.menu_items.items():
+            for item, widget in option.items():
+                if type(widget) == list:
+                    for subitem, subwidget in widget[1].items():
+                        subwidget.triggered.connect(self.menu_connections(head, item, subitem))
+                else:
+                    widget.triggered.connect(self.menu_connections(head, item))
+
+    def menu_connections(self, head, item, subitem=None):
+        return lambda: self.menu_operations(head, item, subitem)
+
+    def setup_menu(self, object_name):
+        for head, items in self.menu_list.items():
+            self.menu_heads[head] = QMenu(self.menu_bar)
+            self.menu_bar.addAction(self.menu_heads[head].menuAction())
+            self.menu_items[head] = {}
+            for item in items:
+                if type(item) == str:
+                    if item == "-----":
+                        self.menu_heads[head].addSeparator()
+                    else:
+                        self.menu_items[head][item] = QAction(self)
+                        self.menu_heads[head].addAction(self.menu_items[head][item])
+                elif type(item) == list:
+                    root = item[0]
+                    self.menu_items[head][root] = []
+                    self.menu_items[head][root].append(QMenu(self.menu_heads[head]))
+                    self.menu_heads[head].addAction(self.menu_items[head][root][0].menuAction())
+                    self.menu_items[head][root].append({})
+                    for subitem in item[1]:
+                        self.menu_items[head][root][1][subitem] = QAction(self)
+                        self.menu_items[head][root][0].addAction(self.menu_items[head][root][1][subitem])
+
+        self.setMenuBar(self.menu_bar)
+
+        _translate = QCoreApplication.translate
+        for menu_head, widget in self.menu_heads.items():
+            widget.setTitle(_translate(object_name, menu_head))
+        for menu_head, menu_item in self.menu_items.items():
+            for item, widget in menu_item.items():
+                if type(widget) == list:
+                    widget[0].setTitle(_translate(object_name, item))
+                    for subitem, subwidget in widget[1].items():
+                        subwidget.setText(_translate(object_name, subitem))
+                else:
+                    if item != '-----':
+                        widget.setText(_translate(object_name, item))
+
+    def actions_to_trigger(self):
+        """Returns every action of the menus, in order"""
+
+        return [subwidget for option in self.menu_items.values() for widget in option.values()
+                for subwidget in widget[1].values()]
+
+
+def make_spec(heads, items, subitems):
+    """Returns a menu spec (see MainWindow.menu()) with heads x items x subitems actions"""
+
+    return {"Head {}".format(head): [["Item {}".format(item), ["Subitem {}".format(subitem)
+                                                             for subitem in range(subitems)]]
+                                     for item in range(items)]
+            for head in range(heads)}
+
+
+def best_time(function, repeat=5):
+    """Returns the shortest of several timings of function(), in milliseconds, and its last return value"""
+
+    times = []
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = function()
+        times.append((time.perf_counter() - start) * 1000)
+    return min(times), result
+
+
+def registry_window(spec, populate=False):
+    """Returns a window with a menu bar built from spec by a MenuRegistry, with every menu filled in if populate"""
+
+    window = QMainWindow()
+    window.calls = 0
+
+    def count(*path):
+        window.calls += 1
+
+    window.menus = MenuRegistry(default_handler=count)
+    window.menus.add_spec(spec)
+    window.menus.build(window.menuBar())
+    if populate:
+        for path, entry in window.menus.entries.items():
+            if entry.children is None:
+                window.menus.widget(path)
+    return window
+
+
+def triggers_per_second(window, actions, repeat=3):
+    """Returns the actions triggered per second through the window's menu connections"""
+
+    best = 0
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for action in actions:
+            action.trigger()
+        best = max(best, len(actions) / (time.perf_counter() - start))
+    assert window.calls >= len(actions)
+    return best
+
+
+def benchmark_menus(heads, items, subitems):
+    """Returns build times in ms and triggers/sec for the legacy menus and the registry"""
+
+    spec = make_spec(heads, items, subitems)
+    legacy_time, legacy = best_time(lambda: LegacyMenuWindow(spec))
+    lazy_time, _ = best_time(lambda: registry_window(spec))
+    full_time, window = best_time(lambda: registry_window(spec, populate=True))
+    registry_actions = [entry.widget for entry in window.menus.entries.values() if entry.children is None]
+    return {"build": (legacy_time, lazy_time, full_time),
+            "dispatch": (triggers_per_second(legacy, legacy.actions_to_trigger()),
+                         triggers_per_second(window, registry_actions))}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark building main window menus and dispatching their actions")
+    parser.add_argument("--heads", type=int, default=10, help="number of menu bar menus")
+    parser.add_argument("--items", type=int, default=10, help="number of submenus in each menu")
+    parser.add_argument("--subitems", type=int, default=10, help="number of actions in each submenu")
+    args = parser.parse_args()
+    app = QApplication.instance() or QApplication(sys.argv)
+
+    results = benchmark_menus(args.heads, args.items, args.subitems)
+    print("Menu bar build time in ms, {} actions".format(args.heads * args.items * args.subitems))
+    print("{:<20}{:>14}{:>14}{:>14}".format("Build", "Before", "After", "Speedup"))
+    legacy_time, lazy_time, full_time = results["build"]
+    print("{:<20}{:>14.2f}{:>14.2f}{:>13.2f}x".format("Menu bar", legacy_time, lazy_time, legacy_time / lazy_time))
+    print("{:<20}{:>14.2f}{:>14.2f}{:>13.2f}x".format("Every menu opened", legacy_time, full_time,
+                                                       legacy_time / full_time))
+    print()
+    print("Actions triggered per second, through to the menu handler")
+    print("{:<20}{:>14}{:>14}{:>14}".format("Dispatch", "Before", "After", "Speedup"))
+    before, after = results["dispatch"]
+    print("{:<20}{:>14,.0f}{:>14,.0f}{:>13.2f}x".format("trigger()", before, after, after / before))
+    app.processEvents()
+
+
+if __name__ == "__main__":
+    main()
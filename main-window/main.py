@@ -20,13 +20,13 @@
 #   along with this program. If not, see <https://www.gnu.org/licenses/>.
 
 
-from PySide2.QtWidgets import QMainWindow, QDesktopWidget, QMenuBar, QMenu, QAction, QStatusBar
-from PySide2.QtCore import QCoreApplication
-from PySide2.QtGui import QIcon
+from PySide2.QtWidgets import QMainWindow, QDesktopWidget, QMenuBar, QStatusBar
+from deferred import DeferredBuilder
+from menus import MenuRegistry, SEPARATOR
 
 
 class MainWindow(QMainWindow):
-    def __init__(self, title="", icon="", object_name="MainWindow"):
+    def __init__(self, title="", icon="", object_name="MainWindow", lazy=True):
         """
         Template for main window that sets window size and placement, creates menu and status bars, and handles menu
         signals.
@@ -34,6 +34,9 @@ class MainWindow(QMainWindow):
         :param title: str; Name to be displayed at the top of the window
         :param icon: str; file path to icon image file
         :param object_name: str; Name of main window object
+        :param lazy: bool; True to show the window first and build the menus (and any steps added with defer()) once
+        it has painted, False to build everything before the window is shown. Call build_menu() before using
+        menu_heads or self.menus.widget() in a subclass's __init__.
         """
 
         super().__init__()
@@ -41,15 +44,39 @@ class MainWindow(QMainWindow):
         self.screen = QDesktopWidget().availableGeometry()
         self.setup_template(title)
         if icon:
+            from PySide2.QtGui import QIcon  # Imported only when an icon is used
             self.setWindowIcon(QIcon(icon))
         self.menu_list = self.menu()
+        self.menus = MenuRegistry(object_name, self.menu_operations)  # Entries can be added before the menus are built
+        self.menus.add_spec(self.menu_list)
         self.menu_bar = QMenuBar(self)
+        self.setMenuBar(self.menu_bar)
         self.menu_heads = {}
-        self.menu_items = {}
-        self.setup_menu(object_name)
-        self.menu_signals()
+        self.menu_built = False
         self.status_bar = QStatusBar(self)
         self.setStatusBar(self.status_bar)
+        self.builder = DeferredBuilder(self)
+        self.defer(self.build_menu)
+        if not lazy:
+            self.builder.finish()
+
+    def defer(self, step):
+        """
+        Adds a construction step, a function taking no arguments, to run after the window first paints, e.g.
+        self.defer(lambda: self.setCentralWidget(HeavyWidget())) for a heavy child widget. Steps run in the order
+        added, one per pass of the event loop. See deferred.DeferredBuilder.
+        """
+
+        self.builder.add(step)
+
+    def build_menu(self):
+        """Builds the menus, now if they have not been built yet"""
+
+        if self.builder.pending(self.build_menu):
+            self.builder.build(self.build_menu)  # Runs this method again, no longer pending
+        elif not self.menu_built:
+            self.menu_built = True
+            self.setup_menu()
 
     def menu(self):
         """
@@ -61,7 +88,11 @@ class MainWindow(QMainWindow):
         {"Menu head": ["Menu item 1", "Menu item 2"]}
         {"Menu head": [["Menu item 1, ["Menu subitem 1", "Menu subitem 2"]], "Menu item 2"]}
         Notice that if subitems are desired, the format is to replace "Menu item" with ["Menu item", [subitems]]
+        Subitems can hold further ["Menu subitem", [subitems]] lists, to any depth
         For a line between menu items, specify five dashes, e.g. {"Menu head": ["Menu item 1", "-----", "Menu item 2"]}
+        Entries can also be added with self.menus.add(("Menu head", "Menu item"), handler), e.g. by plugins
+        For a keyboard shortcut, call self.menus.set_shortcut(("Menu head", "Menu item"), "Ctrl+K") after this method
+        has run, e.g. in a subclass's __init__; the item is then created with the menu bar rather than when opened
         """
 
         menu = {"File": ["Close"],
@@ -72,13 +103,15 @@ class MainWindow(QMainWindow):
                             ]}
         return menu
 
-    def menu_operations(self, head, item, subitem=None):
+    def menu_operations(self, head, item, subitem=None, *subitems):
         """
-        Re-implement this function to define what happens when each menu item is selected.
+        Re-implement this function to define what happens when each menu item is selected. It is called for items
+        without a handler of their own (see menus.MenuRegistry.add()).
         
         :param head: str, menu head name as defined in self.menu()
         :param item: str, menu item name as defined in self.menu()
-        :param head: str, menu subitem name, if applicable, as defined in self.menu()
+        :param subitem: str, menu subitem name, if applicable, as defined in self.menu()
+        :param subitems: str, names of any deeper subitems
         """
 
         if head == "File":
@@ -101,56 +134,40 @@ class MainWindow(QMainWindow):
         y = 0 if y < 0 else y
         self.move(x, y)
 
-    def menu_signals(self):
-        """Interprets the selection of a menu item or subitem and sends the appropriate signal via menu_connections"""
+    def setup_menu(self):
+        """
+        Builds the menu bar from self.menus in one pass. Only the menu heads are created here; each menu creates its
+        items the first time it opens, and every item is routed to its handler through one lookup table.
+        """
 
-        for head, option in self.menu_items.items():
-            for item, widget in option.items():
-                if type(widget) == list:  # Open a side menu for any menu item with a list of subitems
-                    for subitem, subwidget in widget[1].items():
-                        subwidget.triggered.connect(self.menu_connections(head, item, subitem))
-                else:
-                    widget.triggered.connect(self.menu_connections(head, item))
+        self.menus.build(self.menu_bar)
+        self.menu_heads = {entry.title: entry.widget for entry in self.menus.root.children}
 
-    def menu_connections(self, head, item, subitem=None):
-        """Redirects menu signals to the menu_operations function in the main window class. Leave this."""
-        return lambda: self.menu_operations(head, item, subitem)
+    @property
+    def menu_items(self):
+        """
+        The menu items as they were held before the MenuRegistry, kept for subclasses that still use them: menu head ->
+        {item: QAction, or [QMenu, {subitem: ...}] for an item with subitems}. Reading it builds the menus and
+        creates every item, so new code should use self.menus.widget(path) instead.
+        """
 
-    def setup_menu(self, object_name):
-        """Builds a dictionary of menu item instances based on the menu items specified in menu method"""
-
-        for head, items in self.menu_list.items():
-            self.menu_heads[head] = QMenu(self.menu_bar)
-            self.menu_bar.addAction(self.menu_heads[head].menuAction())
-            self.menu_items[head] = {}
-            for item in items:
-                if type(item) == str:
-                    if item == "-----":
-                        self.menu_heads[head].addSeparator()
-                    else:
-                        self.menu_items[head][item] = QAction(self)
-                        self.menu_heads[head].addAction(self.menu_items[head][item])
-                elif type(item) == list:
-                    root = item[0]
-                    self.menu_items[head][root] = []
-                    self.menu_items[head][root].append(QMenu(self.menu_heads[head]))
-                    self.menu_heads[head].addAction(self.menu_items[head][root][0].menuAction())
-                    self.menu_items[head][root].append({})
-                    for subitem in item[1]:
-                        self.menu_items[head][root][1][subitem] = QAction(self)
-                        self.menu_items[head][root][0].addAction(self.menu_items[head][root][1][subitem])
+        self.build_menu()
+        return {entry.title: self.legacy_items(entry) for entry in self.menus.root.children}
 
-        self.setMenuBar(self.menu_bar)
+    def legacy_items(self, menu_entry):
+        """Returns the menu_items dictionary of one menu, creating its items"""
+
+        items = {}
+        for entry in menu_entry.children:
+            if entry != SEPARATOR:
+                widget = self.menus.widget(entry.path)
+                items[entry.title] = widget if entry.children is None else [widget, self.legacy_items(entry)]
+        return items
 
-        _translate = QCoreApplication.translate
-        for menu_head, widget in self.menu_heads.items():
-            widget.setTitle(_translate(object_name, menu_head))
-        for menu_head, menu_item in self.menu_items.items():
-            for item, widget in menu_item.items():
-                if type(widget) == list:
-                    widget[0].setTitle(_translate(object_name, item))
-                    for subitem, subwidget in widget[1].items():
-                        subwidget.setText(_translate(object_name, subitem))
-                else:
-                    if item != '-----':
-                        widget.setText(_translate(object_name, item))
+    def menu_signals(self):
+        """Kept for subclasses that call it. Does nothing: setup_menu() routes every menu item to its handler."""
+
+    def menu_connections(self, head, item, subitem=None):
+        """Returns a function which calls menu_operations() for a menu item, kept for subclasses that still use it"""
+
+        return lambda: self.menu_operations(head, item, subitem)
@@ -0,0 +1,265 @@
+#!/usr/bin/env python3
+#
+#   menus.py
+#   Registry of menu entries, built into a menu bar in one pass with submenus filled in as they are first opened
+#   Using Python 3.6 and PySide2 v.5.12
+#
+#   Copyright (C) 2019 Robert Parker
+#
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with this program. If not, see <https://www.gnu.org/licenses/>.
+
+
+from PySide2.QtWidgets import QMenu, QAction
+from PySide2.QtCore import QCoreApplication
+
+SEPARATOR = "-----"  # Menu spec item drawn as a line between items
+
+
+class MenuEntry:
+    __slots__ = ["title", "path", "children", "index", "widget", "shortcut"]
+
+    def __init__(self, title, path, submenu):
+        """
+        One entry of a MenuRegistry: an action, or a menu holding further entries
+
+        :param title: str, text of the entry
+        :param path: tuple of str, titles from the menu bar down to this entry
+        :param submenu: bool, True for a menu, False for an action
+        """
+
+        self.title = title
+        self.path = path
+        self.children = [] if submenu else None  # Entries and SEPARATORs in order, for menus
+        self.index = {} if submenu else None  # Title -> child entry
+        self.widget = None  # QAction or LazyMenu, once created
+        self.shortcut = None  # Key sequence text of an action, e.g. "Ctrl+Q"
+
+
+class LazyMenu(QMenu):
+    def __init__(self, registry, entry, parent):
+        """
+        QMenu which asks its registry to create its actions and submenus the first time it is about to be shown,
+        so menus that are never opened cost one QMenu each
+
+        :param registry: MenuRegistry object
+        :param entry: MenuEntry of the menu
+        :param parent: parent widget
+        """
+
+        super().__init__(registry.translate(entry.title), parent)
+        self.registry = registry
+        self.entry = entry
+        self.populated = False
+        self.aboutToShow.connect(self.populate)
+
+    def populate(self):
+        """Creates the menu's entries, once"""
+
+        if not self.populated:
+            self.populated = True
+            self.aboutToShow.disconnect(self.populate)
+            self.registry.populate(self)
+
+
+class MenuRegistry:
+    def __init__(self, object_name="MainWindow", default_handler=None):
+        """
+        Holds the menu entries of a window as a tree of MenuEntry objects, filled from a menu spec (see
+        MainWindow.menu()) and by add(), e.g. from plugins, at any time. build() creates only the menu bar's menus;
+        each menu creates its own entries when first opened. The menu bar's triggered signal, which Qt emits for actions
+        at any depth, is the one connection made: dispatch() looks the action's path up, then the path's handler,
+        falling back to the default handler.
+
+        :param object_name: str, context used to translate entry titles
+        :param default_handler: callable taking the path's titles as arguments (e.g. MainWindow.menu_operations),
+        called for actions without a handler of their own
+        """
+
+        self.object_name = object_name
+        self.default_handler = default_handler
+        self.root = MenuEntry(None, (), True)
+        self.entries = {}  # Path -> MenuEntry, for every entry
+        self.handlers = {}  # Path -> callable taking no arguments
+        self.paths = {}  # QAction -> path, for every action created
+        self.menu_bar = None
+
+    def translate(self, title):
+        """Returns the translated text of an entry title"""
+
+        return QCoreApplication.translate(self.object_name, title)
+
+    def add_spec(self, spec):
+        """
+        Adds the entries of a menu spec in one pass. Items are titles, SEPARATOR, or [title, [items]] for a submenu,
+        nested to any depth.
+
+        :param spec: dict, menu head title -> list of items
+        """
+
+        for head, items in spec.items():
+            self.add_items(self.menu_entry((head,)), items)
+
+    def add_items(self, parent, items):
+        """Adds a list of spec items to a menu entry"""
+
+        for item in items:
+            if isinstance(item, str):
+                if item == SEPARATOR:
+                    self.add_child(parent, SEPARATOR)
+                else:
+                    self.add_child(parent, MenuEntry(item, parent.path + (item,), False))
+            else:
+                title, subitems = item
+                self.add_items(self.menu_entry(parent.path + (title,)), subitems)
+
+    def menu_entry(self, path):
+        """Returns the menu entry at path, adding it and any menus above it that are missing"""
+
+        entry = self.entries.get(path)
+        if entry is None:
+            parent = self.menu_entry(path[:-1]) if len(path) > 1 else self.root
+            entry = MenuEntry(path[-1], path, True)
+            self.add_child(parent, entry)
+        return entry
+
+    def add_child(self, parent, entry):
+        """Appends an entry or SEPARATOR to a menu entry, and to its menu if that has already been filled"""
+
+        if entry != SEPARATOR:
+            if entry.title in parent.index:
+                return
+            parent.index[entry.title] = entry
+            self.entries[entry.path] = entry
+        parent.children.append(entry)
+        if parent is self.root:
+            if self.menu_bar is not None:
+                self.menu_bar.addMenu(self.create(entry, self.menu_bar))
+        elif parent.widget is not None and parent.widget.populated:
+            self.add_widget(parent.widget, entry)
+
+    def add(self, path, handler=None, shortcut=None):
+        """
+        Adds an action, and any menus above it that are missing, e.g. add(("Tools", "Plugins", "Resize"), resize).
+        Adding a path that exists only replaces its handler.
+
+        :param path: tuple of str, titles from the menu bar down to the action
+        :param handler: callable taking no arguments, or None to use the default handler
+        :param shortcut: str, key sequence such as "Ctrl+R", or None for no shortcut (see set_shortcut())
+        """
+
+        if path not in self.entries:
+            self.add_child(self.menu_entry(path[:-1]), MenuEntry(path[-1], path, False))
+        self.set_handler(path, handler)
+        if shortcut is not None:
+            self.set_shortcut(path, shortcut)
+
+    def add_separator(self, path):
+        """Adds a separator at the end of the menu at path"""
+
+        self.add_child(self.menu_entry(path), SEPARATOR)
+
+    def set_handler(self, path, handler):
+        """Sets the function called when the action at path is triggered, or None for the default handler"""
+
+        if handler is None:
+            self.handlers.pop(path, None)
+        else:
+            self.handlers[path] = handler
+
+    def set_shortcut(self, path, shortcut):
+        """
+        Gives the action at path a keyboard shortcut. A shortcut only works once its action exists, so actions with
+        shortcuts are created, with the menus above them, when the menus are built rather than when first opened.
+
+        :param path: tuple of str, titles from the menu bar down to the action
+        :param shortcut: str, key sequence such as "Ctrl+Q", or None to remove the shortcut
+        """
+
+        entry = self.entries[path]
+        entry.shortcut = shortcut
+        if entry.widget is not None:
+            entry.widget.setShortcut(shortcut or "")
+        elif shortcut:
+            self.widget(path)  # Creates the action now if the menus have been built
+
+    def build(self, menu_bar):
+        """
+        Creates the menu bar's menus, and the actions which have shortcuts, and routes the menu bar's actions to
+        dispatch(). Other entries are created when their menu is first opened.
+        """
+
+        self.menu_bar = menu_bar
+        for entry in self.root.children:
+            menu_bar.addMenu(self.create(entry, menu_bar))
+        for path in [path for path, entry in self.entries.items() if entry.shortcut]:
+            self.widget(path)
+        menu_bar.triggered.connect(self.dispatch)
+
+    def create(self, entry, parent):
+        """Creates the widget of an entry: a LazyMenu for a menu, a QAction for an action"""
+
+        if entry.children is not None:
+            entry.widget = LazyMenu(self, entry, parent)
+        else:
+            entry.widget = QAction(self.translate(entry.title), parent)
+            if entry.shortcut:
+                entry.widget.setShortcut(entry.shortcut)
+            self.paths[entry.widget] = entry.path
+        return entry.widget
+
+    def populate(self, menu):
+        """Creates the entries of a LazyMenu, in one pass"""
+
+        for entry in menu.entry.children:
+            self.add_widget(menu, entry)
+
+    def add_widget(self, menu, entry):
+        """Creates an entry's widget and adds it to a menu"""
+
+        if entry == SEPARATOR:
+            menu.addSeparator()
+        elif entry.children is not None:
+            menu.addMenu(self.create(entry, menu))
+        else:
+            menu.addAction(self.create(entry, menu))
+
+    def widget(self, path):
+        """
+        Returns the QAction or QMenu of an entry, filling the menus above it if they have not been opened yet, or
+        None before build()
+        """
+
+        entry = self.entries[path]
+        if entry.widget is None and len(path) > 1:  # Menu bar menus only exist once build() has run
+            menu = self.widget(path[:-1])
+            if menu is None:
+                return None
+            menu.populate()
+        return entry.widget
+
+    def dispatch(self, action):
+        """Calls the handler of a triggered action, found by its path"""
+
+        path = self.paths.get(action)
+        if path is not None:  # None for actions added to the menus by other code
+            self.trigger(path)
+
+    def trigger(self, path):
+        """Calls the handler of the action at path, as if it had been triggered"""
+
+        handler = self.handlers.get(path)
+        if handler is not None:
+            handler()
+        elif self.default_handler is not None:
+            self.default_handler(*path)
@@ -21,12 +21,21 @@
 
 
 import sys
-from PySide2.QtWidgets import QApplication
-from main import MainWindow
+from startup_trace import StartupTracer
+
+tracer = StartupTracer.from_arguments(sys.argv)  # Opt in with --trace-startup[=path] or STARTUP_TRACE=path
+with tracer.span("imports"):
+    from PySide2.QtWidgets import QApplication
+    from main import MainWindow
 
 
 if __name__ == '__main__':
-    app = QApplication(sys.argv)
-    ex = MainWindow()
-    ex.show()
+    tracer.trace_methods(MainWindow, ["setup_template", "setup_menu"])
+    with tracer.span("QApplication"):
+        app = QApplication(sys.argv)
+    with tracer.span("MainWindow"):
+        ex = MainWindow()
+    with tracer.span("show"):
+        ex.show()
+    tracer.finish_on_paint(ex)
     sys.exit(app.exec_())
@@ -20,14 +20,15 @@
 #   along with this program. If not, see <https://www.gnu.org/licenses/>.
 
 
-import time
-from PySide2.QtCore import Qt
+from PySide2.QtCore import Qt, QElapsedTimer, QTimer, Signal
 from PySide2.QtGui import QPixmap
 from PySide2.QtWidgets import QSplashScreen, QVBoxLayout, QProgressBar, QLabel, QDesktopWidget
 
 
 class Splash(QSplashScreen):
-    def __init__(self, image, width=400, height=300):
+    closed = Signal()  # Emitted when the splash screen hides after loading finishes
+
+    def __init__(self, image, width=400, height=300, minimum_time=0):
         """
         Subclass of QSplashScreen that appears as the program loads. It sets up a background image,
         and includes a loading_update() method to update the loading progress bar and message.
@@ -35,37 +36,68 @@ class Splash(QSplashScreen):
         :image: str, file path to background image
         :width: int, specified width for splash screen
         :height: in, specified height for splash screen
+        :minimum_time: int, milliseconds the splash screen stays up at least, counted from when it was created. The
+        wait is a timer, so the event loop keeps running meanwhile.
         """
         super().__init__()
         self.width, self.height = width, height
+        self.minimum_time = minimum_time
         self.setFixedSize(self.width, self.height)
         self.setWindowFlag(Qt.WindowStaysOnTopHint, True)
         self.setPixmap(QPixmap(image).scaled(width, height))
         self.setup()
-        self.time_start = time.clock()
-        
+        self.elapsed = QElapsedTimer()
+        self.elapsed.start()
 
     def loading_update(self, percent, message):
         """
-        Call this method to tell the splash screen to update the prgoress bar and loading message.
+        Call this method to tell the splash screen to update the prgoress bar and loading message. At 100 percent
+        the splash screen closes, once it has been shown for minimum_time.
         
         :percent: int, percent of loading to show on progress bar
         :message: str, message to accompany progress bar, e.g. "Loading data"
         """
         
-        self.message_display.setText(message)
-        if percent == 100:
-            seconds = time.clock()
-            while seconds < 2.5:  # This sets the minimum time the splash screen should be shown
-                time.sleep(0.5)
-                seconds = time.clock()
-                status = round(seconds * 40, 0)  # Multiplier must be 100 divided by minimum time set above
-                self.bar.setValue(status)
-            self.hide()
-        else:
-            seconds = time.clock()
-            status = min(percent, round(seconds * 40, 0))
-            self.bar.setValue(status)
+        self.show_progress(percent, message)
+        if percent >= 100:
+            self.finish_loading()
+
+    def show_progress(self, percent, message):
+        """
+        Updates the progress bar and loading message without closing the splash screen
+
+        :percent: int, percent of loading to show on progress bar
+        :message: str, message to accompany progress bar, e.g. "Loading data"
+        """
+
+        if message:
+            self.message_display.setText(message)
+        self.bar.setValue(min(percent, 100))
+
+    def finish_loading(self, *args):
+        """Closes the splash screen once it has been shown for minimum_time. Takes and ignores signal arguments."""
+
+        QTimer.singleShot(max(0, self.minimum_time - self.elapsed.elapsed()), self.close_splash)
+
+    def close_splash(self):
+        """Hides the splash screen and emits closed"""
+
+        self.hide()
+        self.closed.emit()
+
+    def run_tasks(self, runner):
+        """
+        Shows the progress of a StartupRunner (startup.py) and starts it. The splash screen closes when the runner
+        emits finished (or after minimum_time), not when the bar reaches 100; if a task fails its error is shown and
+        the splash screen stays up, so connect runner.failed to report the error and quit.
+
+        :param runner: StartupRunner object with its tasks added
+        """
+
+        runner.progress.connect(self.show_progress)
+        runner.finished.connect(self.finish_loading)
+        runner.failed.connect(self.message_display.setText)
+        runner.start()
 
     def setup(self):
         """Sets up the layout of the splash screen"""
@@ -0,0 +1,180 @@
+#!/usr/bin/env python3
+#
+#   startup.py
+#   Runs the steps of program startup in order, on worker threads where possible, reporting weighted progress
+#   Using Python 3.6 and PySide2 v.5.12
+#
+#   Copyright (C) 2019 Robert Parker
+#
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with this program. If not, see <https://www.gnu.org/licenses/>.
+
+
+from PySide2.QtCore import QObject, QRunnable, QThreadPool, QTimer, Signal
+
+
+class TaskSignals(QObject):
+    """
+    Signals emitted by a StartupTask. The object is created on the GUI thread, so slots connected to it run on the
+    GUI thread even when the signals are emitted from a worker thread.
+    """
+
+    progress = Signal(float)  # Fraction of the task done, 0 to 1
+    finished = Signal(object)  # Return value of the task function
+    failed = Signal(str)  # Error message if the task function raised an exception
+
+
+class StartupTask(QRunnable):
+    def __init__(self, name, function, weight=1, message=None, background=True):
+        """
+        One step of startup, e.g. loading data, building models or constructing the main window. The function is
+        called as function(task) and its return value is kept in the runner's results under the task's name, where
+        later tasks can read it from task.results. A long task can call task.report() to move the progress bar.
+
+        :param name: str, key of the task's result in StartupRunner.results
+        :param function: callable taking the task
+        :param weight: number, share of the progress bar the task takes, relative to the other tasks' weights
+        :param message: str, message shown while the task runs, by default "<name>..."
+        :param background: bool, True to run the task on a worker thread. A background task must not create or touch
+        widgets; tasks which do (e.g. building the main window) must pass False to run on the GUI thread.
+        """
+
+        super().__init__()
+        self.setAutoDelete(False)  # Kept by the runner until its result has been handled
+        self.name = name
+        self.function = function
+        self.weight = weight
+        self.message = message if message is not None else "{}...".format(name)
+        self.background = background
+        self.results = {}  # Results of the tasks run before this one, set by the runner
+        self.signals = TaskSignals()
+
+    def run(self):
+        """Calls the task function. Reimplemented from QRunnable"""
+
+        try:
+            result = self.function(self)
+        except Exception as error:
+            self.signals.failed.emit("{}: {}".format(self.name, error))
+            return
+        self.signals.finished.emit(result)
+
+    def report(self, fraction):
+        """
+        Reports the fraction of the task done, from 0 to 1. Call from the task function. The runner keeps the total
+        below 100 percent until its finished signal, even when the last task reports 1.
+        """
+
+        self.signals.progress.emit(min(1.0, max(0.0, fraction)))
+
+
+class StartupRunner(QObject):
+    progress = Signal(int, str)  # Percent of all startup work done, message of the running task
+    finished = Signal(dict)  # Task name -> result, once every task has finished
+    failed = Signal(str)  # Error message of the task which failed; no further tasks are run
+
+    def __init__(self, pool=None):
+        """
+        Runs startup tasks one after another without blocking the event loop, so a splash screen stays responsive.
+        Background tasks run on a thread pool; GUI tasks are queued on the event loop, which repaints between tasks.
+        Progress is the weighted share of the work done, counting the progress reported by the running task.
+        See Splash.run_tasks().
+
+        :param pool: QThreadPool for the background tasks, or None for the global pool
+        """
+
+        super().__init__()
+        self.pool = pool or QThreadPool.globalInstance()
+        self.tasks = []
+        self.results = {}
+        self.current = None  # Index of the running task in self.tasks
+        self.done_weight = 0  # Total weight of the finished tasks
+
+    def add_task(self, name, function, weight=1, message=None, background=True):
+        """Adds a task to run after those already added and returns it. See StartupTask for the arguments."""
+
+        task = StartupTask(name, function, weight, message, background)
+        self.tasks.append(task)
+        return task
+
+    def total_weight(self):
+        """Returns the total weight of all tasks"""
+
+        return sum(task.weight for task in self.tasks) or 1
+
+    def start(self):
+        """Starts running the tasks, from the first"""
+
+        self.results = {}
+        self.done_weight = 0
+        self.current = -1
+        self.next_task()
+
+    def next_task(self):
+        """Starts the next task, or emits finished when every task is done"""
+
+        self.current += 1
+        if self.current == len(self.tasks):
+            self.current = None
+            self.progress.emit(100, "")
+            self.finished.emit(self.results)
+            return
+        task = self.tasks[self.current]
+        task.results = self.results
+        task.signals.progress.connect(self.task_progress)
+        task.signals.finished.connect(self.task_finished)
+        task.signals.failed.connect(self.task_failed)
+        self.report(0)
+        if task.background:
+            self.pool.start(task)
+        else:
+            QTimer.singleShot(0, task.run)  # Lets the event loop paint the progress before the task blocks it
+
+    def report(self, fraction):
+        """
+        Emits the progress of all the work, given the fraction of the running task done. Stays below 100 until every
+        task has finished, so 100 is only emitted just before finished.
+        """
+
+        task = self.tasks[self.current]
+        percent = 100 * (self.done_weight + task.weight * fraction) / self.total_weight()
+        self.progress.emit(min(99, int(percent)), task.message)
+
+    def task_progress(self, fraction):
+        """Relays progress reported by the running task"""
+
+        if self.current is not None:
+            self.report(fraction)
+
+    def task_finished(self, result):
+        """Keeps the result of the running task and moves on to the next"""
+
+        task = self.tasks[self.current]
+        self.disconnect_task(task)
+        self.results[task.name] = result
+        self.done_weight += task.weight
+        self.next_task()
+
+    def task_failed(self, error):
+        """Stops running tasks after one has failed"""
+
+        self.disconnect_task(self.tasks[self.current])
+        self.current = None
+        self.failed.emit(error)
+
+    def disconnect_task(self, task):
+        """Disconnects a task's signals from the runner"""
+
+        task.signals.progress.disconnect(self.task_progress)
+        task.signals.finished.disconnect(self.task_finished)
+        task.signals.failed.disconnect(self.task_failed)
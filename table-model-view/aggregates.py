@@ -0,0 +1,386 @@
+#!/usr/bin/env python3
+#
+#   aggregates.py
+#   Totals and group-by summaries of the rows a ProxyModel accepts, kept up to date as the rows change
+#   Using Python 3.6 and PySide2 v.5.12
+#
+#   Copyright (C) 2019 Robert Parker
+#
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with this program. If not, see <https://www.gnu.org/licenses/>.
+
+
+from bisect import bisect_left, bisect_right
+from collections import Counter
+from functools import partial
+from itertools import compress
+from operator import is_not
+from PySide2.QtCore import QAbstractTableModel, Qt, QModelIndex, QTimer
+from storage import CASTS
+from filters import mask_rows
+
+AGGREGATES = ["count", "sum", "mean", "min", "max"]
+NUMERIC_TYPES = {"int", "float", "bool"}  # Column types which can be summed
+TOTAL_LABEL = "Total"
+present = partial(is_not, None)  # Tests that a value is not None, for filter()
+
+
+class Group:
+    """
+    Running totals for one group of rows: the number of rows, the sum of each summed column and, for columns whose
+    minimum or maximum is wanted, a count of each value so that removing a row never needs a rescan of the rows
+    """
+
+    __slots__ = ["count", "summed", "counted", "sums", "values", "extremes"]
+
+    def __init__(self, column_count, summed, counted):
+        """
+        :param column_count: int, number of value columns
+        :param summed: list of the value columns whose sum is kept
+        :param counted: list of the value columns whose values are counted, for their minimum and maximum
+        """
+
+        self.count = 0
+        self.summed = summed
+        self.counted = counted
+        self.sums = [0] * column_count
+        self.values = [Counter() if i in counted else None for i in range(column_count)]
+        self.extremes = {}  # (column, "min" or "max") -> cached result, dropped when the column's values change
+
+    def apply_rows(self, columns, rows, sign):
+        """
+        Adds (sign 1) or subtracts (sign -1) a set of rows, each column's values being summed and counted in one pass
+
+        :param columns: list holding a list of values per value column, indexed by row
+        :param rows: list of row numbers
+        :param sign: int, 1 or -1
+        """
+
+        self.count += sign * len(rows)
+        for i in self.summed:
+            self.sums[i] += sign * sum(filter(present, map(columns[i].__getitem__, rows)))
+        for i in self.counted:
+            counter = self.values[i]
+            values = filter(present, map(columns[i].__getitem__, rows))
+            if sign > 0:
+                counter.update(values)
+                continue
+            values = list(values)
+            counter.subtract(values)
+            for value in set(values):
+                if counter[value] <= 0:
+                    del counter[value]
+        if self.extremes:
+            self.extremes.clear()
+
+    def result(self, column, kind):
+        """Returns one aggregate of a value column: 'count', 'sum', 'mean', 'min' or 'max'"""
+
+        if kind == "count":
+            return self.count
+        if kind == "sum":
+            return self.sums[column]
+        if kind == "mean":
+            return self.sums[column] / self.count if self.count else None
+        key = (column, kind)
+        if key not in self.extremes:
+            values = self.values[column]
+            self.extremes[key] = (min(values) if kind == "min" else max(values)) if values else None
+        return self.extremes[key]
+
+
+class SummaryModel(QAbstractTableModel):
+    def __init__(self, proxy, aggregates, group_by=None, show_total=False):
+        """
+        Table model of aggregates (count, sum, mean, min, max) over the source rows a ProxyModel currently accepts,
+        either for all of them together (one row, e.g. for a footer) or for each value of a group_by column, one row
+        per group sorted by value. Show it in a QTableView.
+
+        The totals are kept up to date incrementally rather than recomputed: edits to source cells (setData(),
+        set_cells() or live updates) subtract each changed row's old values and add the new ones, and filter changes
+        and removed rows add or subtract only the rows whose accepted state changed, found by comparing accepted
+        masks. To do this the model keeps its own copy of the group and value columns and of the accepted mask.
+        Changes are collected and signalled once per pass of the event loop. Sorting the proxy changes nothing here.
+        Inserting or removing source rows updates the copies in place; a model reset recomputes everything.
+
+        :param proxy: ProxyModel object whose accepted rows are summarised
+        :param aggregates: list of (column name, aggregate) pairs, aggregate being one of AGGREGATES. 'sum' and 'mean'
+        need a column whose info 'Type' is int, float or bool
+        :param group_by: str, name of the column to group rows by, or None for a single summary of all accepted rows
+        :param show_total: bool, whether to add a last row summarising every group together, when grouping
+        """
+
+        super().__init__()
+        self.proxy = proxy
+        self.source = proxy.sourceModel()
+        self.aggregates = aggregates
+        self.group_by = group_by
+        self.show_total = show_total and group_by is not None
+        info = self.source.info
+        for column, kind in aggregates:
+            if kind not in AGGREGATES:
+                raise ValueError("Unknown aggregate {}".format(kind))
+            if kind in ("sum", "mean") and info[column]["Type"] not in NUMERIC_TYPES:
+                raise ValueError("Cannot take the {} of {} column {}".format(kind, info[column]["Type"], column))
+        self.value_columns = []  # Source column names whose values are kept, each once
+        for column, _ in aggregates:
+            if column not in self.value_columns:
+                self.value_columns.append(column)
+        self.targets = [(self.value_columns.index(column), kind) for column, kind in aggregates]
+        self.summed = sorted({self.value_columns.index(column) for column, kind in aggregates
+                              if kind in ("sum", "mean")})
+        self.counted = sorted({self.value_columns.index(column) for column, kind in aggregates
+                               if kind in ("min", "max")})
+        self.header_labels = ([info[group_by]["Label"]] if group_by is not None else []) + [
+            "{} of {}".format(kind.capitalize(), info[column]["Label"]) for column, kind in aggregates]
+        self.keys = []  # Group value of each source row
+        self.values = []  # Values of each value column, one list per column
+        self.accepted = bytearray()  # Accepted mask the totals were computed from
+        self.groups = {}  # Group value -> Group
+        self.total = None  # Group of every accepted row
+        self.group_order = []  # Group values in the order shown
+        self.dirty = set()  # Group values whose totals changed since the last update
+        self.rebuild_needed = False
+        self.update_timer = QTimer(self)  # Collects the changes of one event loop pass into one update
+        self.update_timer.setSingleShot(True)
+        self.update_timer.setInterval(0)
+        self.update_timer.timeout.connect(self.update)
+        self.rebuild()
+        self.source.dataChanged.connect(self.source_data_changed)
+        self.source.rowsInserted.connect(self.source_rows_inserted)
+        self.source.rowsRemoved.connect(self.source_rows_removed)
+        self.source.layoutChanged.connect(self.schedule_rebuild)
+        self.source.modelReset.connect(self.schedule_rebuild)
+        proxy.filter_changed.connect(self.update_timer.start)
+
+    def accepted_mask(self):
+        """Returns the proxy's accepted source rows as a row mask"""
+
+        return self.proxy.shown_mask()
+
+    def read_rows(self, rows):
+        """Returns the group values and the value column values of a sequence of source rows"""
+
+        source = self.source
+        store = source.store
+        columns = [source.columns.index(column) for column in self.value_columns]
+        if self.group_by is not None:
+            columns.append(source.columns.index(self.group_by))
+        values = store.read_columns(rows, columns)
+        if not store.typed:
+            for i, column in enumerate(columns):
+                cast = CASTS.get(source.info[source.columns[column]]["Type"])
+                if cast is not None:
+                    values[i] = [value if value is None else cast(value) for value in values[i]]
+        keys = values.pop() if self.group_by is not None else [None] * len(rows)
+        return keys, values
+
+    def group(self, key):
+        """Returns the Group for a group value, creating it if necessary"""
+
+        group = self.groups.get(key)
+        if group is None:
+            group = self.groups[key] = Group(len(self.value_columns), self.summed, self.counted)
+        return group
+
+    def apply_rows(self, rows, sign):
+        """Adds (sign 1) or subtracts (sign -1) source rows from their groups and the total, using the kept values"""
+
+        rows = list(rows)
+        if not rows:
+            return
+        if self.group_by is None:
+            by_group = {None: rows}
+        else:
+            by_group = {}
+            keys = self.keys
+            for row in rows:
+                key = keys[row]
+                if key in by_group:
+                    by_group[key].append(row)
+                else:
+                    by_group[key] = [row]
+        for key, group_rows in by_group.items():
+            self.group(key).apply_rows(self.values, group_rows, sign)
+        if self.show_total:
+            self.total.apply_rows(self.values, rows, sign)
+        self.dirty.update(by_group)
+
+    def rebuild(self):
+        """Recomputes every total from the source model and proxy"""
+
+        self.keys, self.values = self.read_rows(range(self.source.rowCount()))
+        self.accepted = self.accepted_mask()
+        self.recount()
+        self.rebuild_needed = False
+        self.group_order = self.sorted_groups()
+
+    def recount(self):
+        """Recomputes every total from the kept values and accepted mask"""
+
+        self.groups = {}
+        self.total = Group(len(self.value_columns), self.summed, self.counted)
+        if self.group_by is None:
+            self.group(None)
+        self.apply_rows(mask_rows(self.accepted, 1), 1)
+        self.dirty.clear()
+
+    def sorted_groups(self):
+        """Returns the group values of groups holding rows, sorted, with values of mixed types ordered by type name"""
+
+        keys = [key for key, group in self.groups.items() if group.count] if self.group_by is not None else [None]
+        try:
+            return sorted(keys)
+        except TypeError:
+            return sorted(keys, key=lambda key: (type(key).__name__, str(key)))
+
+    def schedule_rebuild(self, *args):
+        """Recomputes every total on the next update, e.g. after the source model is reset"""
+
+        self.rebuild_needed = True
+        self.update_timer.start()
+
+    def update(self):
+        """Applies changes in the accepted rows and signals the changed summaries. Called by the update timer."""
+
+        if self.rebuild_needed:
+            self.beginResetModel()
+            self.rebuild()
+            self.endResetModel()
+            return
+        mask = self.accepted_mask()
+        if len(mask) != len(self.accepted):  # Out of step with the source rows, which should not happen
+            self.schedule_rebuild()
+            return
+        previous = int.from_bytes(self.accepted, "little")
+        current = int.from_bytes(mask, "little")
+        added = (current & ~previous).to_bytes(len(mask), "little")
+        removed = (previous & ~current).to_bytes(len(mask), "little")
+        if added.count(1) + removed.count(1) > mask.count(1):  # Quicker to add up the accepted rows again
+            dirty = set(self.groups)
+            self.accepted = mask
+            self.recount()
+            self.dirty = dirty | set(self.groups)
+        else:
+            self.apply_rows(mask_rows(removed, 1), -1)
+            self.apply_rows(mask_rows(added, 1), 1)
+            self.accepted = mask
+        if not self.dirty:
+            return
+        order = self.sorted_groups()
+        if order != self.group_order:
+            self.beginResetModel()
+            self.group_order = order
+            self.endResetModel()
+        else:
+            positions = {key: i for i, key in enumerate(order)}
+            rows = [positions[key] for key in self.dirty if key in positions]
+            if self.show_total:
+                rows.append(len(order))
+            if rows:
+                self.dataChanged.emit(self.index(min(rows), 0), self.index(max(rows), self.columnCount() - 1),
+                                      [Qt.DisplayRole])
+        self.dirty.clear()
+
+    def source_data_changed(self, top_left, bottom_right, roles=None):
+        """
+        Replaces the kept values of edited source rows, updating the totals of those which are accepted. When the
+        change comes from TableModel.set_cells(), only the rows it changed are read, however wide the signalled range.
+        """
+
+        if self.rebuild_needed:
+            return
+        first, last = top_left.row(), min(bottom_right.row(), len(self.accepted) - 1)
+        if last < first:
+            return
+        watched = self.value_columns + ([self.group_by] if self.group_by is not None else [])
+        columns = self.source.columns[top_left.column():bottom_right.column() + 1]
+        if not any(column in watched for column in columns):
+            return
+        changed_rows = self.source.changed_rows
+        if changed_rows is None:
+            rows = range(first, last + 1)
+        else:
+            rows = changed_rows[bisect_left(changed_rows, first):bisect_right(changed_rows, last)]
+        accepted_rows = list(compress(rows, map(self.accepted.__getitem__, rows)))
+        self.apply_rows(accepted_rows, -1)
+        keys, values = self.read_rows(rows)
+        for row, key in zip(rows, keys):
+            self.keys[row] = key
+        for column, column_values in zip(self.values, values):
+            for row, value in zip(rows, column_values):
+                column[row] = value
+        self.apply_rows(accepted_rows, 1)
+        self.update_timer.start()
+
+    def source_rows_inserted(self, parent, first, last):
+        """Adds new source rows to the kept values as not yet accepted; update() adds those the proxy accepts"""
+
+        if self.rebuild_needed:
+            return
+        keys, values = self.read_rows(range(first, last + 1))
+        self.keys[first:first] = keys
+        for column, column_values in zip(self.values, values):
+            column[first:first] = column_values
+        self.accepted[first:first] = bytearray(last - first + 1)
+        self.update_timer.start()
+
+    def source_rows_removed(self, parent, first, last):
+        """Subtracts removed source rows which were accepted and drops their kept values"""
+
+        if self.rebuild_needed:
+            return
+        self.apply_rows(compress(range(first, last + 1), self.accepted[first:last + 1]), -1)
+        del self.keys[first:last + 1]
+        for column in self.values:
+            del column[first:last + 1]
+        del self.accepted[first:last + 1]
+        self.update_timer.start()
+
+    def summary(self):
+        """Returns a dictionary of group value (None when not grouping) -> list of the aggregates' results"""
+
+        return {key: [self.groups[key].result(column, kind) for column, kind in self.targets]
+                for key in self.group_order}
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.group_order) + self.show_total
+
+    def columnCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.header_labels)
+
+    def data(self, index, role):
+        """Returns each group's value and aggregates. Reimplemented from QAbstractTableModel"""
+
+        row = index.row()
+        column = index.column()
+        if role == Qt.DisplayRole or role == Qt.EditRole:
+            total = row == len(self.group_order)
+            if self.group_by is not None:
+                if column == 0:
+                    return TOTAL_LABEL if total else self.group_order[row]
+                column -= 1
+            group = self.total if total else self.groups[self.group_order[row]]
+            return group.result(*self.targets[column])
+        elif role == Qt.TextAlignmentRole:
+            if self.group_by is not None and column == 0:
+                return int(Qt.AlignLeft | Qt.AlignVCenter)
+            return int(Qt.AlignRight | Qt.AlignVCenter)
+        return None
+
+    def headerData(self, section, orientation, role):
+        """Returns the column labels. Reimplemented from QAbstractTableModel"""
+
+        if role == Qt.DisplayRole and orientation == Qt.Horizontal:
+            return self.header_labels[section]
+        return super().headerData(section, orientation, role)
@@ -0,0 +1,428 @@
+#!/usr/bin/env python3
+#
+#   benchmark.py
+#   Micro-benchmarks for the table model and delegate classes. Run directly, e.g. python benchmark.py --rows 100000
+#   Using Python 3.6 and PySide2 v.5.12
+#
+#   Copyright (C) 2019 Robert Parker
+#
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with this program. If not, see <https://www.gnu.org/licenses/>.
+
+
+import os
+import sys
+import json
+import argparse
+import platform
+import statistics
+import subprocess
+import tempfile
+import time
+import PySide2
+from PySide2.QtWidgets import QApplication, QStyledItemDelegate, QStyleOptionViewItem
+from PySide2.QtGui import QColor, QImage, QPainter
+from PySide2.QtCore import Qt, QRect, qVersion
+from table_models import TableModel, ProxyModel
+from table_view import TableView
+from delegates import FillColorDelegate, NumberDelegate, HeatMapDelegate, ProgressBarDelegate, SparklineDelegate
+
+STARTUP_SCRIPT = """
+import sys
+from startup_trace import StartupTracer
+tracer = StartupTracer({path!r}, quit_after=True)
+with tracer.span("imports"):
+    from PySide2.QtWidgets import QApplication
+    from main import {window}
+app = QApplication(sys.argv)
+window = {window}(lazy={lazy})
+window.show()
+tracer.finish_on_paint(window)
+app.exec_()
+"""  # Run in a new interpreter by startup_times(); the tracer quits once the window has painted
+TEMPLATES = {"MainFrame": os.path.dirname(os.path.abspath(__file__)),
+             "MainWindow": os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, "main-window")}
+SUITE_SIZES = [10000, 100000, 1000000]  # Rows of the synthetic tables measured by --suite
+SUITE_SAMPLE = 200000  # Most cells read, or rows painted, by one throughput measurement of the suite
+SUITE_TOLERANCE = 0.2  # Fraction by which a suite result may be worse than the baseline before it is a regression
+
+
+class UncompiledTableModel(TableModel):
+    """TableModel with the data() method as it was before per-column tables were compiled, kept for comparison"""
+
+    def data(self, index, role):
+        row = index.row()
+        column = index.column()
+        column_name = self.columns[column]
+
+        if role in [Qt.DisplayRole, Qt.EditRole]:
+            if self.info[column_name]["Type"] == "int":
+                return int(self.store.rows[row][column])
+            elif self.info[column_name]["Type"] == "float":
+                return float(self.store.rows[row][column])
+            return str(self.store.rows[row][column])
+        elif role == Qt.TextAlignmentRole:
+            if self.info[column_name]["Alignment"] == "right":
+                return Qt.AlignRight
+            elif self.info[column_name]["Alignment"] == "center":
+                return Qt.AlignCenter
+            return Qt.AlignLeft
+        return None
+
+
+class UncachedFillColorDelegate(QStyledItemDelegate):
+    """FillColorDelegate with the paint() method as it was before the render cache, kept for comparison"""
+
+    def __init__(self, model, color):
+        super().__init__()
+        self.color = color
+        self.model = model
+
+    def paint(self, painter, option, index):
+        source_index = self.model.mapToSource(index)
+        value = self.model.sourceModel().store.value(source_index.row(), source_index.column())
+        rect = QRect(option.rect.x()+1, option.rect.y()+1, option.rect.width()-2, option.rect.height()-2)
+        if value:
+            painter.save()
+            painter.setBrush(self.color)
+            painter.fillRect(rect, painter.brush())
+            painter.restore()  # Missing from the original, which left the painter's state stack growing
+
+
+def make_table(rows):
+    """Returns columns, data and info for a synthetic table shaped like the MainFrame example"""
+
+    columns = ["name", "number1", "number2", "highscore"]
+    names = ["David", "Sarah", "Evan", "Leah"]
+    data = [[names[i % 4], i % 1000, (i * 7) % 100, i % 3 == 0] for i in range(rows)]
+    info = {"name": {"Type": "str", "Label": "Name", "Alignment": "left", "Width": 120},
+            "number1": {"Type": "int", "Label": "Number 1", "Alignment": "center", "Width": 80},
+            "number2": {"Type": "int", "Label": "Number 2", "Alignment": "center", "Width": 80},
+            "highscore": {"Type": "bool", "Label": "High score?", "Alignment": "center", "Width": 80}}
+    return columns, data, info
+
+
+def calls_per_second(model, role, indexes, repeat=3):
+    """Calls model.data() for every index with the given role and returns the best rate over several repeats"""
+
+    data = model.data
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for index in indexes:
+            data(index, role)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return len(indexes) / best
+
+
+def benchmark_data_roles(rows):
+    """Measures data() calls per second for each role, before and after compiling the per-column tables"""
+
+    columns, data, info = make_table(rows)
+    models = {"before": UncompiledTableModel(columns, data, info), "after": TableModel(columns, data, info)}
+    roles = {"DisplayRole": Qt.DisplayRole, "EditRole": Qt.EditRole, "TextAlignmentRole": Qt.TextAlignmentRole}
+    results = {}
+    for name, model in models.items():
+        indexes = [model.index(row, column) for row in range(rows) for column in range(len(columns))]
+        results[name] = {role_name: calls_per_second(model, role, indexes) for role_name, role in roles.items()}
+    return results
+
+
+def paints_per_second(delegate, proxy, column, visible_rows=40, row_height=30, width=80, repeat=3, limit=None):
+    """
+    Paints one column of a view scrolled a page at a time through the whole proxy (or its first limit rows) into an
+    image, calling delegate.paint() for each cell as the view would, and returns the best rate over several repeats
+    """
+
+    image = QImage(width, visible_rows * row_height, QImage.Format_ARGB32_Premultiplied)
+    option = QStyleOptionViewItem()
+    row_count = proxy.rowCount() if limit is None else min(limit, proxy.rowCount())
+    indexes = [proxy.index(row, column) for row in range(row_count)]
+    best = None
+    for _ in range(repeat):
+        painter = QPainter(image)
+        start = time.perf_counter()
+        for row, index in enumerate(indexes):
+            option.rect = QRect(0, (row % visible_rows) * row_height, width, row_height)
+            delegate.paint(painter, option, index)
+        elapsed = time.perf_counter() - start
+        painter.end()
+        best = elapsed if best is None else min(best, elapsed)
+    return row_count / best
+
+
+def benchmark_delegate_paint(rows):
+    """Measures FillColorDelegate.paint() calls per second over a bool column, before and after the render cache"""
+
+    columns, data, info = make_table(rows)
+    proxy = ProxyModel(TableModel(columns, data, info))
+    proxy.add_filter_condition("name", ["David", "Sarah", "Evan"])  # So that proxy rows are mapped to source rows
+    color = QColor(0, 0, 255)
+    delegates = {"before": UncachedFillColorDelegate(proxy, color), "after": FillColorDelegate(proxy, color)}
+    column = columns.index("highscore")
+    return {name: paints_per_second(delegate, proxy, column) for name, delegate in delegates.items()}
+
+
+def benchmark_delegate_library(rows, visible_rows=40):
+    """
+    Measures paint() calls per second for each delegate in delegates.py over a column of every row, and the frame
+    rate that allows when a viewport of visible_rows rows of that column is repainted for every scroll step. Sparkline
+    histories are all different, so every sparkline is rendered rather than copied from the cache.
+    """
+
+    columns = ["amount", "score", "progress", "history"]
+    data = [[(i * 7919) % 20001 - 10000.5, (i * 37 % 101) / 100, i % 101, [((i + j) * 17 % 29) / 28 for j in range(30)]]
+            for i in range(rows)]
+    info = {"amount": {"Type": "float", "Label": "Amount", "Alignment": "right", "Width": 100, "Format": "{:,.2f}",
+                       "NegativeColor": "#c00000"},
+            "score": {"Type": "float", "Label": "Score", "Alignment": "center", "Width": 80, "Range": (0, 1),
+                      "Format": "{:.0%}"},
+            "progress": {"Type": "int", "Label": "Progress", "Alignment": "center", "Width": 120, "Maximum": 100},
+            "history": {"Type": "list", "Label": "History", "Alignment": "left", "Width": 120}}
+    proxy = ProxyModel(TableModel(columns, data, info))
+    delegates = {"NumberDelegate": ("amount", NumberDelegate), "HeatMapDelegate": ("score", HeatMapDelegate),
+                 "ProgressBarDelegate": ("progress", ProgressBarDelegate),
+                 "SparklineDelegate": ("history", SparklineDelegate)}
+    results = {}
+    for name, (column, delegate_class) in delegates.items():
+        rate = paints_per_second(delegate_class(info[column]), proxy, columns.index(column), visible_rows,
+                                 width=info[column]["Width"])
+        results[name] = (rate, rate / visible_rows)
+    return results
+
+
+def startup_times(window, directory, lazy, runs=5):
+    """
+    Starts a new interpreter runs times, each creating and showing a window class, and returns the median
+    milliseconds from starting the process to the end of the window's first paint, and from the tracer's start
+    (after the interpreter itself has started) to the same point. Each run is a fresh interpreter, so every module
+    is imported again, though the operating system may have the files cached.
+
+    :param window: str, name of the window class in the directory's main.py, taking a lazy argument
+    :param directory: str, folder of the template
+    :param lazy: bool, passed to the window class
+    :param runs: int, number of runs
+    """
+
+    process_times = []
+    traced_times = []
+    for _ in range(runs):
+        handle, path = tempfile.mkstemp(suffix=".json")
+        os.close(handle)
+        try:
+            script = STARTUP_SCRIPT.format(path=path, window=window, lazy=lazy)
+            start = time.time()
+            subprocess.run([sys.executable, "-c", script], cwd=directory, check=True, stderr=subprocess.DEVNULL)
+            with open(path) as file:
+                report = json.load(file)["otherData"]
+        finally:
+            os.remove(path)
+        painted = report["total_ms"]  # The first paint is the last span recorded
+        process_times.append((report["started"] - start) * 1000 + painted)
+        traced_times.append(painted)
+    return statistics.median(process_times), statistics.median(traced_times)
+
+
+def benchmark_startup(runs=5):
+    """Returns {window class: {"eager": times, "lazy": times}} of startup_times() for each template found"""
+
+    results = {}
+    for window, directory in TEMPLATES.items():
+        if os.path.exists(os.path.join(directory, "main.py")):
+            results[window] = {mode: startup_times(window, directory, mode == "lazy", runs)
+                               for mode in ["eager", "lazy"]}
+    return results
+
+
+def best_milliseconds(function, repeat=3, setup=None):
+    """Returns the shortest of several timings of function(), in milliseconds, calling setup() before each if given"""
+
+    best = None
+    for _ in range(repeat):
+        if setup is not None:
+            setup()
+        start = time.perf_counter()
+        function()
+        elapsed = (time.perf_counter() - start) * 1000
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def benchmark_suite(rows, repeat=3):
+    """
+    Measures the table model/view stack over a synthetic table of the given size, and returns {metric: value}.
+    Metric names end in "_ms" (time taken, lower is better) or "_per_sec" (rate, higher is better), which is how
+    compare_results() tells them apart. Throughputs read at most SUITE_SAMPLE cells or rows spread over the table.
+
+    :param rows: int, number of rows in the synthetic table
+    :param repeat: int, timings of each step, of which the best is kept
+    """
+
+    columns, data, info = make_table(rows)
+    info["name"]["Wrap"] = True  # So that fit_rows() measures rows rather than setting one height for all
+    results = {"model_construction_ms": best_milliseconds(lambda: TableModel(columns, data, info), repeat),
+               "columnar_model_construction_ms": best_milliseconds(
+                   lambda: TableModel(columns, data, info, columnar=True), repeat)}
+    model = TableModel(columns, data, info)
+    step = max(1, rows * len(columns) // SUITE_SAMPLE)
+    indexes = [model.index(cell // len(columns), cell % len(columns)) for cell in range(0, rows * len(columns), step)]
+    results["data_display_per_sec"] = calls_per_second(model, Qt.DisplayRole, indexes, repeat)
+    results["data_alignment_per_sec"] = calls_per_second(model, Qt.TextAlignmentRole, indexes, repeat)
+    del indexes
+
+    proxy = ProxyModel(model)
+    view = TableView(None, proxy, "benchmark")
+    view.resize(800, 600)
+    results["filter_apply_ms"] = best_milliseconds(lambda: proxy.add_filter_condition("name", ["David", "Sarah"]),
+                                                   repeat, proxy.reset_filters)
+    results["filter_reset_ms"] = best_milliseconds(
+        proxy.reset_filters, repeat, lambda: proxy.add_filter_condition("name", ["David", "Sarah"]))
+    column = columns.index("number2")
+    results["sort_ms"] = best_milliseconds(lambda: view.sortByColumn(column, Qt.DescendingOrder), repeat,
+                                           lambda: (view.sortByColumn(-1, Qt.AscendingOrder), proxy.sort_cache.clear()))
+    results["sort_cached_ms"] = best_milliseconds(lambda: view.sortByColumn(column, Qt.AscendingOrder), repeat,
+                                                  lambda: view.sortByColumn(column, Qt.DescendingOrder))
+    results["fit_rows_ms"] = best_milliseconds(view.fit_rows, repeat, lambda: setattr(view, "row_heights", {}))
+    view.selectAll()
+    results["copy_selection_ms"] = best_milliseconds(view.copy_selection, repeat)
+    view.clearSelection()
+    view.sortByColumn(-1, Qt.AscendingOrder)
+
+    proxy.add_filter_condition("name", ["David", "Sarah", "Evan"])  # So that proxy rows are mapped to source rows
+    delegate = FillColorDelegate(proxy, QColor(0, 0, 255))
+    results["fill_color_paint_per_sec"] = paints_per_second(delegate, proxy, columns.index("highscore"),
+                                                            repeat=repeat, limit=SUITE_SAMPLE)
+    return results
+
+
+def run_suite(sizes, repeat=3):
+    """Runs benchmark_suite() for each table size and returns the results with a description of the run"""
+
+    return {"created": time.time(), "python": platform.python_version(), "pyside": PySide2.__version__,
+            "qt": qVersion(), "platform": platform.platform(), "qpa": QApplication.platformName(),
+            "repeat": repeat, "results": {str(rows): benchmark_suite(rows, repeat) for rows in sizes}}
+
+
+def compare_results(baseline, current, tolerance=SUITE_TOLERANCE):
+    """
+    Compares two run_suite() results and returns a list of (rows, metric, baseline value, current value, change,
+    regressed) for every metric measured in both. change is the fraction by which the current run is better
+    (positive) or worse (negative) than the baseline, and regressed is True if it is worse by more than tolerance.
+
+    :param baseline: dict, earlier run_suite() result
+    :param current: dict, run_suite() result to check
+    :param tolerance: float, fraction worse than the baseline beyond which a result counts as a regression
+    """
+
+    changes = []
+    for rows, metrics in current["results"].items():
+        for metric, value in metrics.items():
+            before = baseline["results"].get(rows, {}).get(metric)
+            if not before or not value:
+                continue
+            change = before / value - 1 if metric.endswith("_ms") else value / before - 1
+            changes.append((rows, metric, before, value, change, change < -tolerance))
+    return changes
+
+
+def print_suite(suite):
+    """Prints run_suite() results as a table with a column per table size"""
+
+    sizes = list(suite["results"])
+    metrics = list(suite["results"][sizes[0]])
+    print("Table model/view suite, best of {} (Python {}, PySide2 {}, Qt {}, {} platform)".format(
+        suite["repeat"], suite["python"], suite["pyside"], suite["qt"], suite["qpa"]))
+    print(("{:<32}" + "{:>16}" * len(sizes)).format("Metric", *["{:,} rows".format(int(rows)) for rows in sizes]))
+    for metric in metrics:
+        print(("{:<32}" + "{:>16,.2f}" * len(sizes)).format(metric, *[suite["results"][rows][metric]
+                                                                       for rows in sizes]))
+
+
+def suite_main(args):
+    """Runs the suite for the command line arguments, and returns the process exit status"""
+
+    os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")  # Before the QApplication is created, so no display is needed
+    QApplication.instance() or QApplication([])
+    suite = run_suite(args.sizes, args.repeat)
+    print_suite(suite)
+    if args.output:
+        with open(args.output, "w") as file:
+            json.dump(suite, file, indent=1)
+    if not args.baseline:
+        return 0
+    with open(args.baseline) as file:
+        baseline = json.load(file)
+    changes = compare_results(baseline, suite, args.tolerance)
+    print()
+    print("Change from {} (positive is faster; regression beyond {:.0%} slower)".format(args.baseline,
+                                                                                      args.tolerance))
+    print("{:<12}{:<32}{:>14}{:>14}{:>10}".format("Rows", "Metric", "Baseline", "Current", "Change"))
+    for rows, metric, before, value, change, regressed in changes:
+        print("{:<12}{:<32}{:>14,.2f}{:>14,.2f}{:>+9.0%}{}".format(rows, metric, before, value, change,
+                                                                   "  REGRESSION" if regressed else ""))
+    return 1 if any(regressed for *_, regressed in changes) else 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark TableModel.data(), delegate paint and startup time")
+    parser.add_argument("--rows", type=int, default=20000, help="number of rows in the synthetic table")
+    parser.add_argument("--startup-runs", type=int, default=5, help="new interpreters started per startup timing")
+    parser.add_argument("--suite", action="store_true", help="run the headless model/view suite instead")
+    parser.add_argument("--sizes", type=lambda text: [int(size) for size in text.split(",")], default=SUITE_SIZES,
+                        help="comma separated table sizes for --suite, by default 10000,100000,1000000")
+    parser.add_argument("--repeat", type=int, default=3, help="timings of each --suite step, of which the best is kept")
+    parser.add_argument("--output", help="path of a JSON file to write the --suite results to")
+    parser.add_argument("--baseline", help="JSON file from an earlier --output run; exits with status 1 on regression")
+    parser.add_argument("--tolerance", type=float, default=SUITE_TOLERANCE,
+                        help="fraction slower than --baseline allowed before a result is a regression")
+    args = parser.parse_args()
+    if args.suite:
+        sys.exit(suite_main(args))
+
+    results = benchmark_data_roles(args.rows)
+    print("data() calls/sec over {} rows x 4 columns".format(args.rows))
+    print("{:<20}{:>14}{:>14}{:>10}".format("Role", "Before", "After", "Speedup"))
+    for role_name in results["before"]:
+        before, after = results["before"][role_name], results["after"][role_name]
+        print("{:<20}{:>14,.0f}{:>14,.0f}{:>9.2f}x".format(role_name, before, after, after / before))
+
+    QApplication.instance() or QApplication([])  # Delegates need one; set QT_QPA_PLATFORM=offscreen if headless
+    paint_rows = min(args.rows, 100000)
+    results = benchmark_delegate_paint(paint_rows)
+    print()
+    print("FillColorDelegate.paint() calls/sec over {} filtered rows".format(paint_rows))
+    print("{:<20}{:>14}{:>14}{:>10}".format("Delegate", "Before", "After", "Speedup"))
+    before, after = results["before"], results["after"]
+    print("{:<20}{:>14,.0f}{:>14,.0f}{:>9.2f}x".format("FillColorDelegate", before, after, after / before))
+
+    results = benchmark_delegate_library(paint_rows)
+    print()
+    print("Delegate paint() calls/sec over {} rows, and frames/sec repainting 40 visible rows".format(paint_rows))
+    print("{:<20}{:>14}{:>14}".format("Delegate", "Calls/sec", "Frames/sec"))
+    for name, (rate, frames) in results.items():
+        print("{:<20}{:>14,.0f}{:>14,.0f}".format(name, rate, frames))
+
+    results = benchmark_startup(args.startup_runs)
+    print()
+    print("Milliseconds to the first paint of each template window, median of {} new interpreters".format(
+        args.startup_runs))
+    print("{:<20}{:>14}{:>14}{:>14}{:>14}".format("Window", "Eager", "Lazy", "Eager (Py)", "Lazy (Py)"))
+    for window, times in results.items():
+        print("{:<20}{:>14.1f}{:>14.1f}{:>14.1f}{:>14.1f}".format(window, times["eager"][0], times["lazy"][0],
+                                                                 times["eager"][1], times["lazy"][1]))
+    print("Py: from the first line of Python run, leaving out interpreter start up")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,100 @@
+#!/usr/bin/env python3
+#
+#   deferred.py
+#   Builds the parts of a window that are not needed for its first paint afterwards, one per event loop pass
+#   Using Python 3.6 and PySide2 v.5.12
+#   Each template directory that uses this module holds an identical copy, so that every template runs on its own
+#
+#   Copyright (C) 2019 Robert Parker
+#
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with this program. If not, see <https://www.gnu.org/licenses/>.
+
+
+from PySide2.QtCore import QObject, QEvent, QTimer, Signal
+
+
+class DeferredBuilder(QObject):
+    finished = Signal()  # Emitted once every step has been built
+
+    def __init__(self, widget):
+        """
+        Holds construction steps (functions taking no arguments, e.g. building a menu or a secondary view) to run
+        once a widget has painted for the first time, so the window appears before they are built. The steps run in
+        the order added, one per pass of the event loop, so the window keeps responding between them. Call
+        build(step) or finish() to run steps early, e.g. when the user reaches for something not built yet.
+
+        :param widget: QWidget whose first paint starts the steps, usually the window
+        """
+
+        super().__init__(widget)
+        self.steps = []
+        self.painted = False
+        self.timer = QTimer(self)
+        self.timer.setSingleShot(True)
+        self.timer.setInterval(0)
+        self.timer.timeout.connect(self.build_next)
+        widget.installEventFilter(self)
+
+    def add(self, step):
+        """Adds a step to run after the first paint (or on the next pass of the event loop, if already painted)"""
+
+        self.steps.append(step)
+        if self.painted:
+            self.timer.start()
+
+    def pending(self, step):
+        """Returns True if a step has been added and not yet run"""
+
+        return step in self.steps
+
+    def eventFilter(self, watched, event):
+        """Starts running the steps after the widget's first paint. Reimplemented from QObject"""
+
+        if event.type() == QEvent.Paint and not self.painted:
+            self.painted = True
+            watched.removeEventFilter(self)
+            if self.steps:
+                self.timer.start()
+        return False
+
+    def build_next(self):
+        """Runs the next step, then queues the one after"""
+
+        if not self.steps:
+            return
+        self.steps.pop(0)()
+        if self.steps:
+            self.timer.start()
+        else:
+            self.finished.emit()
+
+    def build(self, step):
+        """Runs a step now if it is still pending, for code that needs what the step builds"""
+
+        if step in self.steps:
+            self.steps.remove(step)
+            step()
+            if not self.steps:
+                self.timer.stop()
+                self.finished.emit()
+
+    def finish(self):
+        """Runs every pending step now"""
+
+        self.timer.stop()
+        if not self.steps:
+            return
+        while self.steps:
+            self.steps.pop(0)()
+        self.finished.emit()
@@ -20,14 +20,251 @@
 #   along with this program. If not, see <https://www.gnu.org/licenses/>.
 
 
-from PySide2.QtWidgets import QStyledItemDelegate
-from PySide2.QtCore import QRect
+from array import array
+from collections import OrderedDict
+from PySide2.QtWidgets import QStyledItemDelegate, QStyle
+from PySide2.QtGui import QBrush, QColor, QPainter, QPalette, QPen, QPixmap, QPolygonF
+from PySide2.QtCore import Qt, QPointF, QRect
+from table_models import ALIGNMENTS, VALUE_ROLE, HISTORY_ROLE
+
+PIXMAP_CACHE_SIZE = 32  # Rendered cells kept by each delegate, one per cell size; the cache is emptied when full
+RENDER_CACHE_SIZE = 512  # Rendered progress bars and sparklines kept by each delegate, least recently used dropped
+HEAT_MAP_STEPS = 256  # Number of colors in a heat map's lookup table
+HEAT_MAP_COLORS = ["#3b4cc0", "#f7f7f7", "#b40426"]  # Default heat map scale, low to high
+SELECTED_TINT = 0.5  # Fraction of the highlight color mixed into the fill of selected heat map cells
+PADDING = 3  # Pixels between a cell's edge and its contents
+
+
+def blend(color_a, color_b, fraction):
+    """Returns the color fraction of the way from color_a to color_b"""
+
+    return QColor.fromRgbF(*(a + (b - a) * fraction for a, b in zip(color_a.getRgbF(), color_b.getRgbF())))
+
+
+def color_scale(colors, steps):
+    """
+    Returns a list of steps QBrush objects running evenly through a list of colors
+
+    :param colors: list of QColor objects or color names (e.g. "#ff0000"), at least two
+    :param steps: int, number of brushes
+    """
+
+    colors = [QColor(color) for color in colors]
+    brushes = []
+    for step in range(steps):
+        position = step * (len(colors) - 1) / max(1, steps - 1)
+        first = min(int(position), len(colors) - 2)
+        brushes.append(QBrush(blend(colors[first], colors[first + 1], position - first)))
+    return brushes
+
+
+def text_formatter(column_info):
+    """
+    Returns a function converting a value to the text shown for it, using the column's 'Format' (a str.format()
+    field such as "{:,.2f}") if it has one. Values which do not fit the format, and None, are shown with str().
+    """
+
+    field = column_info.get("Format")
+    if field is None:
+        return lambda value: "" if value is None else str(value)
+    format_value = field.format
+
+    def formatter(value):
+        try:
+            return format_value(value)
+        except (TypeError, ValueError):
+            return "" if value is None else str(value)
+    return formatter
+
+
+class ColumnDelegate(QStyledItemDelegate):
+    role = VALUE_ROLE  # Model role each cell's value is read with
+
+    def __init__(self, column_info):
+        """
+        Base class for delegates which draw one column's cells directly with the painter, rather than through the
+        style, reading each cell's value with the model role in the role attribute (VALUE_ROLE, the stored value,
+        unless a subclass changes it). Everything that depends only on the column (alignment, text format, colors) is
+        worked out once from the column's info dictionary when the delegate is created. Cells are not editable.
+        Subclasses reimplement paint_value().
+
+        :param column_info: dictionary of the column's information from the TableModel info dictionary
+        """
+
+        super().__init__()
+        self.info = column_info
+        self.alignment = ALIGNMENTS.get(column_info.get("Alignment"), Qt.AlignLeft) | Qt.AlignVCenter
+        self.format_text = text_formatter(column_info)
+        self.renders = OrderedDict()  # Key -> QPixmap, for subclasses caching whole rendered cells
+
+    def createEditor(self, parent, option, index):
+        return None
+
+    def cached_render(self, key, width, height, ratio, render):
+        """
+        Returns a pixmap of a cell drawn by render(painter, width, height), from the cache if the same key and size
+        were drawn before. The least recently used pixmap is dropped when the cache holds RENDER_CACHE_SIZE.
+        """
+
+        key = (key, width, height, ratio)
+        pixmap = self.renders.get(key)
+        if pixmap is not None:
+            self.renders.move_to_end(key)
+            return pixmap
+        pixmap = QPixmap(round(width * ratio), round(height * ratio))
+        pixmap.setDevicePixelRatio(ratio)
+        pixmap.fill(Qt.transparent)
+        painter = QPainter(pixmap)
+        painter.setRenderHint(QPainter.Antialiasing)
+        render(painter, width, height)
+        painter.end()
+        self.renders[key] = pixmap
+        if len(self.renders) > RENDER_CACHE_SIZE:
+            self.renders.popitem(last=False)
+        return pixmap
+
+    def paint(self, painter, option, index):
+        painter.save()
+        if option.state & QStyle.State_Selected:
+            painter.fillRect(option.rect, option.palette.highlight())
+            painter.setPen(option.palette.color(QPalette.HighlightedText))
+        else:
+            painter.setPen(option.palette.color(QPalette.Text))
+        self.paint_value(painter, option, index.data(self.role), index)
+        painter.restore()
+
+    def paint_value(self, painter, option, value, index):
+        """Draws a cell's value into option.rect. Reimplement in subclasses."""
+
+        pass
+
+
+class NumberDelegate(ColumnDelegate):
+    """
+    Shows numbers formatted with the column's 'Format' (e.g. "{:,.2f}" for thousands separators and two decimal
+    places), aligned as the column's 'Alignment'. Negative numbers are drawn in the color of the column's
+    'NegativeColor', if given.
+    """
+
+    def __init__(self, column_info):
+        super().__init__(column_info)
+        negative = column_info.get("NegativeColor")
+        self.negative_pen = None if negative is None else QPen(QColor(negative))
+
+    def paint_value(self, painter, option, value, index):
+        rect = option.rect.adjusted(PADDING, 0, -PADDING, 0)
+        if self.negative_pen is not None and isinstance(value, (int, float)) and value < 0:
+            painter.setPen(self.negative_pen)
+        painter.drawText(rect, self.alignment, self.format_text(value))
+
+
+class HeatMapDelegate(ColumnDelegate):
+    """
+    Fills each cell with a color from a scale running across the column's 'Range' (low, high), default (0, 1), and
+    shows the formatted value on top. 'Colors' lists the colors of the scale from low to high (QColor objects or
+    names such as "#ff0000"); the default runs from blue through white to red. The scale is computed once as a
+    lookup table of HEAT_MAP_STEPS brushes, so painting a cell is an index calculation and a fill. Selected cells
+    mix SELECTED_TINT of the highlight color into their fill, so the selection still shows.
+    """
+
+    def __init__(self, column_info):
+        super().__init__(column_info)
+        self.low, high = column_info.get("Range", (0, 1))
+        self.brushes = color_scale(column_info.get("Colors", HEAT_MAP_COLORS), HEAT_MAP_STEPS)
+        self.scale = (HEAT_MAP_STEPS - 1) / (high - self.low) if high != self.low else 0
+        self.show_text = column_info.get("ShowText", True)
+
+    def paint_value(self, painter, option, value, index):
+        if not isinstance(value, (int, float)):
+            return
+        step = int((value - self.low) * self.scale)
+        rect = option.rect
+        brush = self.brushes[0 if step < 0 else HEAT_MAP_STEPS - 1 if step >= HEAT_MAP_STEPS else step]
+        if option.state & QStyle.State_Selected:
+            brush = QBrush(blend(brush.color(), option.palette.color(QPalette.Highlight), SELECTED_TINT))
+        painter.fillRect(rect, brush)
+        if self.show_text:
+            painter.drawText(rect.adjusted(PADDING, 0, -PADDING, 0), self.alignment, self.format_text(value))
+
+
+class ProgressBarDelegate(ColumnDelegate):
+    """
+    Draws each value as a bar filled in proportion to the value over the column's 'Maximum' (default 100), labelled
+    with the percentage. Bars are drawn once per whole percent and cell size and then copied from the render cache.
+    'Color' sets the bar color.
+    """
+
+    def __init__(self, column_info):
+        super().__init__(column_info)
+        self.maximum = column_info.get("Maximum", 100) or 1
+        self.bar_brush = QBrush(QColor(column_info.get("Color", "#3daee9")))
+        self.track_brush = QBrush(QColor(0, 0, 0, 30))
+
+    def paint_value(self, painter, option, value, index):
+        if not isinstance(value, (int, float)):
+            return
+        percent = max(0, min(100, int(100 * value / self.maximum)))
+        rect = option.rect
+
+        def render(bar_painter, width, height):
+            track = QRect(PADDING, PADDING, width - 2 * PADDING, height - 2 * PADDING)
+            bar_painter.fillRect(track, self.track_brush)
+            bar_painter.fillRect(QRect(track.x(), track.y(), track.width() * percent // 100, track.height()),
+                                 self.bar_brush)
+            bar_painter.drawText(track, Qt.AlignCenter, "{}%".format(percent))
+
+        ratio = painter.device().devicePixelRatioF()
+        painter.drawPixmap(rect.x(), rect.y(), self.cached_render(percent, rect.width(), rect.height(), ratio, render))
+
+
+class SparklineDelegate(ColumnDelegate):
+    """
+    Draws a cell's numeric history (a list, tuple or array of numbers, read with HISTORY_ROLE) as a line scaled to
+    the cell. Cells holding anything else, such as a single number or text, are left empty. The line is scaled to
+    the column's 'Range' (low, high) if given, otherwise to each history's own minimum and maximum. 'Color' sets the
+    line color. Rendered lines are cached by their values and the cell size, so scrolling back over rows already
+    seen only copies pixmaps.
+    """
+
+    role = HISTORY_ROLE
+
+    def __init__(self, column_info):
+        super().__init__(column_info)
+        self.range = column_info.get("Range")
+        self.pen = QPen(QColor(column_info.get("Color", "#2c7fb8")), 1.5)
+
+    def paint_value(self, painter, option, history, index):
+        if not isinstance(history, (list, tuple, array)) or len(history) < 2:
+            return
+        history = tuple(history)
+        rect = option.rect
+        ratio = painter.device().devicePixelRatioF()
+        painter.drawPixmap(rect.x(), rect.y(),
+                           self.cached_render(history, rect.width(), rect.height(), ratio,
+                                              lambda line_painter, width, height:
+                                              self.render_line(line_painter, width, height, history)))
+
+    def render_line(self, painter, width, height, history):
+        """Draws a history as a polyline filling a width by height area, less padding"""
+
+        low, high = self.range or (min(history), max(history))
+        span = (high - low) or 1
+        x_step = (width - 2 * PADDING) / (len(history) - 1)
+        bottom = height - PADDING
+        y_scale = (height - 2 * PADDING) / span
+        painter.setPen(self.pen)
+        painter.drawPolyline(QPolygonF([QPointF(PADDING + i * x_step, bottom - (value - low) * y_scale)
+                                        for i, value in enumerate(history)]))
 
 
 class FillColorDelegate(QStyledItemDelegate):
     def __init__(self, model, color):
         """
-        This delegate replaces a cell's display with a solid fill color surrounded by a thin white border
+        This delegate replaces a cell's display with a solid fill color surrounded by a thin white border. Cells whose
+        value is false are left empty.
+
+        The value is read from the index with VALUE_ROLE, so paint() does no proxy mapping of its own. A filled cell
+        is drawn once per cell size into a pixmap, and later cells of that size copy the pixmap.
 
         :param model: underlying ProxyModel object
         :param color: QColor object
@@ -36,19 +273,39 @@ class FillColorDelegate(QStyledItemDelegate):
         super().__init__()
         self.color = color
         self.model = model
+        self.brush = QBrush(color)
+        self.pixmaps = {}  # (width, height, device pixel ratio) -> QPixmap of a filled cell
+
+    def set_color(self, color):
+        """Changes the fill color, dropping the cells already rendered"""
+
+        self.color = color
+        self.brush = QBrush(color)
+        self.pixmaps.clear()
 
     def createEditor(self, parent, option, index):
         return None
 
-    def paint(self, painter, option, index):
-        source_index = self.model.mapToSource(index)
-        row = source_index.row()
-        column = source_index.column()
-        value = self.model.sourceModel().dataset[row][column]
+    def filled_pixmap(self, width, height, ratio):
+        """Returns a pixmap of a filled cell of the given size, rendering it on first use"""
 
-        rect = QRect(option.rect.x()+1, option.rect.y()+1, option.rect.width()-2, option.rect.height()-2)
+        key = (width, height, ratio)
+        pixmap = self.pixmaps.get(key)
+        if pixmap is None:
+            if len(self.pixmaps) >= PIXMAP_CACHE_SIZE:
+                self.pixmaps.clear()
+            pixmap = QPixmap(round(width * ratio), round(height * ratio))
+            pixmap.setDevicePixelRatio(ratio)
+            pixmap.fill(Qt.transparent)
+            painter = QPainter(pixmap)
+            painter.fillRect(1, 1, width - 2, height - 2, self.brush)
+            painter.end()
+            self.pixmaps[key] = pixmap
+        return pixmap
 
-        if value:
-            painter.save()
-            painter.setBrush(self.color)
-            painter.fillRect(rect, painter.brush())
+    def paint(self, painter, option, index):
+        if not index.data(VALUE_ROLE):
+            return
+        rect = option.rect
+        painter.drawPixmap(rect.x(), rect.y(),
+                           self.filled_pixmap(rect.width(), rect.height(), painter.device().devicePixelRatioF()))
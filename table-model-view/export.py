@@ -0,0 +1,261 @@
+#!/usr/bin/env python3
+#
+#   export.py
+#   Writes the rows shown by a table view to CSV, TSV or a compact binary columnar file on a background thread
+#   Using Python 3.6 and PySide2 v.5.12
+#
+#   Copyright (C) 2019 Robert Parker
+#
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with this program. If not, see <https://www.gnu.org/licenses/>.
+
+
+import os
+import csv
+import sys
+import json
+import struct
+from array import array
+from storage import TYPECODES, CASTS
+from workers import Worker
+
+EXPORT_CHUNK = 50000  # Rows read from storage and written per step, between progress reports and cancellation checks
+FORMATS = {".csv": "csv", ".tsv": "tsv", ".txt": "tsv", ".tcol": "columnar"}  # File extension -> format
+MAGIC = b"TCOL"  # Columnar files: MAGIC, uint16 version, uint32 header length, JSON header, then row groups
+VERSION = 1
+INT_TYPECODES = ["b", "h", "i", "q"]  # Narrowest first
+INT_SIZES = {code: array(code).itemsize for code in INT_TYPECODES}
+
+
+def little_endian(buffer):
+    """Returns the bytes of an array in little-endian byte order"""
+
+    if sys.byteorder == "big":
+        buffer = array(buffer.typecode, buffer)
+        buffer.byteswap()
+    return buffer.tobytes()
+
+
+def from_little_endian(typecode, data):
+    """Returns an array of the given type holding little-endian data"""
+
+    buffer = array(typecode)
+    buffer.frombytes(data)
+    if sys.byteorder == "big":
+        buffer.byteswap()
+    return buffer
+
+
+def encode_strings(strings):
+    """Returns the uint32 byte lengths of each UTF-8 encoded string followed by the strings themselves"""
+
+    encoded = [string.encode("utf-8") for string in strings]
+    return little_endian(array("I", map(len, encoded))) + b"".join(encoded)
+
+
+def decode_strings(data, count, position=0):
+    """Reads count strings written by encode_strings() from data, returning them and the position after them"""
+
+    lengths = from_little_endian("I", data[position:position + 4 * count])
+    position += 4 * count
+    strings = []
+    for length in lengths:
+        strings.append(data[position:position + length].decode("utf-8"))
+        position += length
+    return strings, position
+
+
+def encode_column(kind, values):
+    """
+    Returns the bytes for one column of a columnar row group, as compact as the values in the group allow:
+
+    - int: a typecode byte then the values as the narrowest of int8, int16, int32 and int64 that holds them
+    - float: float64 values
+    - bool: int8 values (0 or 1)
+    - anything else: b"D", an index typecode byte, the number of distinct values (uint32), the distinct values as
+      strings and one index per row, when at most half the values are distinct; otherwise b"P" and every string
+    """
+
+    if kind == "int":
+        buffer = array("q", map(int, values))
+        low, high = (min(buffer), max(buffer)) if buffer else (0, 0)
+        typecode = next(code for code in INT_TYPECODES
+                        if -1 << (8 * INT_SIZES[code] - 1) <= low and high < 1 << (8 * INT_SIZES[code] - 1))
+        return typecode.encode("ascii") + little_endian(array(typecode, buffer))
+    if kind in TYPECODES:
+        return little_endian(array(TYPECODES[kind], map(CASTS[kind], values)))
+    strings = [str(value) for value in values]
+    positions = {}
+    for string in strings:
+        if string not in positions:
+            positions[string] = len(positions)
+    if len(positions) > len(strings) // 2:
+        return b"P" + encode_strings(strings)
+    typecode = "B" if len(positions) <= 1 << 8 else "H" if len(positions) <= 1 << 16 else "I"
+    return (b"D" + typecode.encode("ascii") + struct.pack("<I", len(positions)) + encode_strings(positions) +
+            little_endian(array(typecode, map(positions.__getitem__, strings))))
+
+
+def decode_column(kind, data, row_count):
+    """Converts the bytes written by encode_column() back to an array (typed columns) or a list of str"""
+
+    if kind == "int":
+        return array("q", from_little_endian(data[:1].decode("ascii"), data[1:]))
+    if kind in TYPECODES:
+        return from_little_endian(TYPECODES[kind], data)
+    if data[:1] == b"P":
+        return decode_strings(data, row_count, 1)[0]
+    typecode = data[1:2].decode("ascii")
+    count = struct.unpack("<I", data[2:6])[0]
+    strings, position = decode_strings(data, count, 6)
+    return list(map(strings.__getitem__, from_little_endian(typecode, data[position:])))
+
+
+def read_columnar(path):
+    """
+    Reads a columnar file written by export_rows(). Returns the header dictionary (keys 'columns', 'labels', 'types'
+    and 'rows') and a list holding each column's values: an array for int, float and bool columns (bool as 0/1) and
+    a list of str otherwise.
+
+    :param path: str, path of the file
+    """
+
+    with open(path, "rb") as file:
+        if file.read(4) != MAGIC:
+            raise ValueError("{} is not a columnar table file".format(path))
+        version, header_length = struct.unpack("<HI", file.read(6))
+        if version != VERSION:
+            raise ValueError("Unsupported columnar file version {}".format(version))
+        header = json.loads(file.read(header_length).decode("utf-8"))
+        columns = [array(TYPECODES[kind]) if kind in TYPECODES else [] for kind in header["types"]]
+        while True:
+            count = file.read(4)
+            if not count:
+                break
+            row_count = struct.unpack("<I", count)[0]
+            for kind, column in zip(header["types"], columns):
+                length = struct.unpack("<Q", file.read(8))[0]
+                column.extend(decode_column(kind, file.read(length), row_count))
+    return header, columns
+
+
+def export_rows(worker, path, file_format, read, stored_rows, columns, header, converters):
+    """
+    Writes table rows to a file in chunks of EXPORT_CHUNK rows, reporting progress and stopping if the worker is
+    cancelled. The file is written under a temporary name and only renamed to path once complete. Written to run on a
+    Worker (workers.py), so it takes the worker as its first argument. Returns the number of rows written, or None if
+    cancelled.
+
+    :param worker: Worker object running the export, or None when called directly
+    :param path: str, path of the file to write
+    :param file_format: str, "csv", "tsv" or "columnar"
+    :param read: callable(rows, columns) returning a list of values per column, e.g. Store.read_columns
+    :param stored_rows: sequence of stored row numbers to write, in order
+    :param columns: list of column numbers to write, in order
+    :param header: dict with lists 'columns' (column names), 'labels' (header labels, the first row of text formats)
+    and 'types' (the 'Type' of each column in the info dictionary)
+    :param converters: list of functions (or None) converting each column's stored values for text formats
+    """
+
+    temporary = path + ".part"
+    total = len(stored_rows)
+    text = file_format in ("csv", "tsv")
+    types = header["types"]
+    file = open(temporary, "w", newline="", encoding="utf-8") if text else open(temporary, "wb")
+    try:
+        with file:
+            if text:
+                writer = csv.writer(file, delimiter="," if file_format == "csv" else "\t")
+                writer.writerow(header["labels"])
+            else:
+                encoded = json.dumps(dict(header, rows=total)).encode("utf-8")
+                file.write(MAGIC + struct.pack("<HI", VERSION, len(encoded)) + encoded)
+            for start in range(0, total, EXPORT_CHUNK):
+                if worker is not None:
+                    if worker.cancelled:
+                        break
+                    worker.report(100 * start / max(1, total))
+                rows = stored_rows[start:start + EXPORT_CHUNK]
+                values = read(rows, columns)
+                if text:
+                    values = [column_values if convert is None else map(convert, column_values)
+                              for convert, column_values in zip(converters, values)]
+                    writer.writerows(zip(*values))
+                    continue
+                file.write(struct.pack("<I", len(rows)))
+                for kind, column_values in zip(types, values):
+                    data = encode_column(kind, column_values)
+                    file.write(struct.pack("<Q", len(data)) + data)
+    except BaseException:
+        os.remove(temporary)
+        raise
+    if worker is not None and worker.cancelled:
+        os.remove(temporary)
+        return None
+    os.replace(temporary, path)
+    if worker is not None:
+        worker.report(100)
+    return total
+
+
+def start_export(proxy, path, columns=None, file_format=None):
+    """
+    Exports the rows a ProxyModel currently accepts, in the order shown, on a background Worker and returns the
+    worker. Connect to worker.signals.progress, finished (with the number of rows written) and failed, and call
+    worker.cancel() to stop early. Only the list of rows to write is copied; values are read from the source model's
+    storage a chunk at a time. Editing cells while the export runs is allowed, but inserting rows part way through
+    the table, removing rows or resetting the source model cancels the export with a failed signal.
+
+    :param proxy: ProxyModel object whose accepted rows are exported
+    :param path: str, path of the file to write
+    :param columns: list of column numbers to write, or None for all columns
+    :param file_format: str, "csv", "tsv" or "columnar", or None to choose from the file extension
+    """
+
+    source = proxy.sourceModel()
+    store = source.store
+    if file_format is None:
+        file_format = FORMATS.get(os.path.splitext(path)[1].lower())
+        if file_format is None:
+            raise ValueError("Unknown export format for {}".format(path))
+    if columns is None:
+        columns = list(range(source.columnCount()))
+    rows = proxy.accepted_rows()
+    header = {"columns": [source.columns[column] for column in columns],
+              "labels": [source.header_labels[column] for column in columns],
+              "types": [source.info[source.columns[column]]["Type"] for column in columns]}
+    converters = [source.converters[column] for column in columns]
+    worker = Worker(export_rows, path, file_format, store.read_columns, rows, columns, header, converters)
+
+    def rows_inserted(parent, first, last):
+        if first != source.rowCount():
+            table_changed()
+
+    def table_changed(*args):
+        if worker.cancelled:  # Already stopped by the caller
+            return
+        worker.cancel()
+        worker.signals.failed.emit("The table changed during the export")
+
+    def disconnect():
+        source.rowsAboutToBeInserted.disconnect(rows_inserted)
+        for signal in [source.rowsAboutToBeRemoved, source.modelAboutToBeReset]:
+            signal.disconnect(table_changed)
+        worker.signals.done.disconnect(disconnect)
+
+    source.rowsAboutToBeInserted.connect(rows_inserted)
+    for signal in [source.rowsAboutToBeRemoved, source.modelAboutToBeReset]:
+        signal.connect(table_changed)
+    worker.signals.done.connect(disconnect)  # Also emitted when the caller cancels the export
+    worker.start()
+    return worker
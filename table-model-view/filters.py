@@ -0,0 +1,337 @@
+#!/usr/bin/env python3
+#
+#   filters.py
+#   Filter engine used by ProxyModel to decide which rows of a TableModel pass its filter conditions
+#   Using Python 3.6 and PySide2 v.5.12
+#
+#   Copyright (C) 2019 Robert Parker
+#
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with this program. If not, see <https://www.gnu.org/licenses/>.
+
+
+from array import array
+from bisect import bisect_left, insort
+from collections import Counter
+
+CHUNK_SIZE = 65536  # Rows tested between progress reports and cancellation checks in snapshot_mask()
+
+
+def and_masks(mask_a, mask_b):
+    """
+    Combines two row masks (one byte per row, 1 for accepted and 0 for rejected) so that only rows accepted by both
+    remain. The masks are intersected as two large integers rather than row by row.
+    """
+
+    combined = int.from_bytes(mask_a, "little") & int.from_bytes(mask_b, "little")
+    return bytearray(combined.to_bytes(len(mask_a), "little"))
+
+
+def subtract_masks(mask_a, mask_b):
+    """Returns a row mask of the rows accepted by mask_a but not by mask_b, two row masks of equal length"""
+
+    difference = int.from_bytes(mask_a, "little") & ~int.from_bytes(mask_b, "little")
+    return bytearray(difference.to_bytes(len(mask_a), "little"))
+
+
+def mask_rows(mask, state):
+    """
+    Yields the rows of a row mask which hold the given state (1 for accepted rows, 0 for rejected rows), stepping
+    over runs of other rows with bytes.find() rather than testing every row
+
+    :param mask: bytearray row mask
+    :param state: int, 1 or 0
+    """
+
+    other = 1 - state
+    start = mask.find(state)
+    while start != -1:
+        end = mask.find(other, start)
+        if end == -1:
+            end = len(mask)
+        yield from range(start, end)
+        start = mask.find(state, end)
+
+
+def snapshot_mask(worker, values, compiled):
+    """
+    Computes a row mask from copies of the filtered columns, without value indexes, so that it can run on a Worker
+    (workers.py) while the GUI thread carries on. Returns None if the worker is cancelled.
+
+    :param worker: Worker object running the function, or None when called directly
+    :param values: dict, column number -> copy of the column values in row order
+    :param compiled: list of (column number, frozenset of values) pairs as returned by FilterEngine.compile()
+    """
+
+    mask = None
+    total = max(1, sum(len(values[column]) for column, _ in compiled))
+    done = 0
+    for column, conditions in compiled:
+        column_values = values[column]
+        column_mask = bytearray()
+        for start in range(0, len(column_values), CHUNK_SIZE):
+            if worker is not None:
+                if worker.cancelled:
+                    return None
+                worker.report(100 * done / total)
+            chunk = column_values[start:start + CHUNK_SIZE]
+            column_mask.extend(value in conditions for value in chunk)
+            done += len(chunk)
+        mask = column_mask if mask is None else and_masks(mask, column_mask)
+    return mask
+
+
+class FilterEngine:
+    def __init__(self, model, use_index=True):
+        """
+        Evaluates ProxyModel filter conditions ({column name: set of accepted values}) against a TableModel and
+        produces a row mask: a bytearray holding 1 for each row that passes every condition and 0 otherwise. Masks
+        for each filtered column are combined by intersection, so ProxyModel.filterAcceptsRow() only has to look up
+        one byte per row.
+
+        When use_index is True, the first filter on a column builds a value index for it (value -> array of the rows
+        holding that value), after which a column mask is built by visiting only the rows that hold accepted values.
+        Indexes are dropped by invalidate() whenever the data they describe change.
+
+        :param model: TableModel object holding the data to filter
+        :param use_index: bool, whether to build per-column value indexes
+        """
+
+        self.model = model
+        self.use_index = use_index
+        self.column_numbers = {}  # Column name -> column number in the model
+        self.value_indexes = {}  # Column number -> {value: array of rows}
+        self.update_columns()
+
+    def update_columns(self):
+        """Rebuilds the column name map after the model's columns change"""
+
+        self.column_numbers = {column: i for i, column in enumerate(self.model.columns)}
+        self.value_indexes = {}
+
+    def invalidate(self, columns=None):
+        """
+        Drops value indexes so they are rebuilt on next use
+
+        :param columns: iterable of column numbers whose data changed, or None for all columns
+        """
+
+        if columns is None:
+            self.value_indexes = {}
+        else:
+            for column in columns:
+                self.value_indexes.pop(column, None)
+
+    def compile(self, filter_conditions):
+        """
+        Converts a filter_conditions dictionary into a list of (column number, set of values) pairs, ignoring the
+        'Remove' entry which ProxyModel handles itself and, as filterAcceptsRow() always has, columns which are not in
+        the model
+
+        :param filter_conditions: dict, column name -> set of values to be included
+        """
+
+        return [(self.column_numbers[column], conditions) for column, conditions in filter_conditions.items()
+                if column in self.column_numbers]
+
+    def accepts(self, row, compiled):
+        """
+        Tests a single row against compiled conditions. Used for rows which are not covered by a computed mask.
+
+        :param row: int, row number in the model
+        :param compiled: list of (column number, set of values) pairs as returned by compile()
+        """
+
+        value = self.model.store.value
+        for column, conditions in compiled:
+            if value(row, column) not in conditions:
+                return False
+        return True
+
+    def value_index(self, column):
+        """Returns the value index of a column, building it if necessary"""
+
+        index = self.value_indexes.get(column)
+        if index is None:
+            index = {}
+            for row, value in enumerate(self.model.store.column_values(column)):
+                rows = index.get(value)
+                if rows is None:
+                    rows = index[value] = array("q")
+                rows.append(row)
+            self.value_indexes[column] = index
+        return index
+
+    def extend_indexes(self, first):
+        """
+        Adds rows appended to the end of the model to any value indexes already built
+
+        :param first: int, first row which was appended
+        """
+
+        for column, index in self.value_indexes.items():
+            values = self.model.store.column_values(column)
+            for row in range(first, len(values)):
+                rows = index.get(values[row])
+                if rows is None:
+                    rows = index[values[row]] = array("q")
+                rows.append(row)
+
+    def column_mask(self, column, conditions):
+        """
+        Returns the row mask for a single column condition
+
+        :param column: int, column number
+        :param conditions: set of values to be included
+        """
+
+        row_count = self.model.store.row_count()
+        if not self.use_index:
+            return bytearray(value in conditions for value in self.model.store.column_values(column))
+        mask = bytearray(row_count)
+        index = self.value_index(column)
+        for value in conditions:
+            for row in index.get(value, ()):
+                mask[row] = 1
+        return mask
+
+    def narrow_mask(self, mask, column, conditions):
+        """
+        Returns the mask after adding a condition, or replacing a column's condition with a subset of its values.
+        Only rows accepted by the current mask are tested, since no rejected row can become accepted.
+
+        :param mask: current row mask, or None if no column was filtered
+        :param column: int, number of the column whose condition narrowed
+        :param conditions: set of values to be included for that column
+        """
+
+        if mask is None:
+            return self.column_mask(column, conditions)
+        if self.use_index:
+            return and_masks(mask, self.column_mask(column, conditions))
+        values = self.model.store.column_values(column)
+        for row in list(mask_rows(mask, 1)):
+            if values[row] not in conditions:
+                mask[row] = 0
+        return mask
+
+    def widen_mask(self, mask, filter_conditions):
+        """
+        Returns the mask after a condition is removed or given extra values. Only rows rejected by the current mask
+        are tested, since no accepted row can become rejected. With value indexes the whole mask is rebuilt instead,
+        which is cheaper than testing rejected rows one by one.
+
+        :param mask: current row mask, or None if no column was filtered
+        :param filter_conditions: dict, column name -> set of values to be included, after widening
+        """
+
+        compiled = self.compile(filter_conditions)
+        if mask is None or not compiled:
+            return None
+        if self.use_index:
+            return self.compute_mask(filter_conditions)
+        for row in list(mask_rows(mask, 0)):
+            if self.accepts(row, compiled):
+                mask[row] = 1
+        return mask
+
+    def compute_mask(self, filter_conditions):
+        """
+        Returns the row mask for all conditions, or None if there are no column conditions (every row accepted)
+
+        :param filter_conditions: dict, column name -> set of values to be included
+        """
+
+        mask = None
+        for column, conditions in self.compile(filter_conditions):
+            column_mask = self.column_mask(column, conditions)
+            mask = column_mask if mask is None else and_masks(mask, column_mask)
+        return mask
+
+
+class DistinctIndex:
+    def __init__(self, values):
+        """
+        Counts of each distinct value in a column, kept up to date by TableModel as cells are edited and rows are
+        inserted or removed (see TableModel.distinct_index()), so that filter pickers can be filled without scanning
+        the table. For typeahead, prefix_search() finds the values whose text starts with a prefix by binary search
+        over the values sorted by their case-folded text, built on first use and then kept up to date.
+
+        :param values: iterable of the column's values
+        """
+
+        self.counts = Counter(values)
+        self.keys = None  # Sorted list of (case-folded text, type name, value), built on first use
+
+    @staticmethod
+    def sort_key(value):
+        """Returns the key a value is kept under in the sorted text list"""
+
+        return str(value).casefold(), type(value).__name__, value
+
+    def add(self, values):
+        """Counts values added to the column"""
+
+        counts = self.counts
+        for value in values:
+            if value not in counts and self.keys is not None:
+                insort(self.keys, self.sort_key(value))
+            counts[value] += 1
+
+    def remove(self, values):
+        """Uncounts values removed from the column"""
+
+        counts = self.counts
+        for value in values:
+            counts[value] -= 1
+            if counts[value] <= 0:
+                del counts[value]
+                if self.keys is not None:
+                    key = self.sort_key(value)
+                    position = bisect_left(self.keys, key)
+                    if position < len(self.keys) and self.keys[position] == key:
+                        del self.keys[position]
+
+    def count(self, value):
+        """Returns the number of rows holding a value"""
+
+        return self.counts.get(value, 0)
+
+    def values(self):
+        """Returns the distinct values sorted by their text, e.g. to fill a combo box"""
+
+        return [key[2] for key in self.sorted_keys()]
+
+    def sorted_keys(self):
+        """Returns the sorted text list, building it if necessary"""
+
+        if self.keys is None:
+            self.keys = sorted(map(self.sort_key, self.counts))
+        return self.keys
+
+    def prefix_search(self, prefix, limit=None):
+        """
+        Returns the distinct values whose text starts with prefix, ignoring case, in text order
+
+        :param prefix: str, start of the text to match
+        :param limit: int, maximum number of values to return, or None for all
+        """
+
+        keys = self.sorted_keys()
+        prefix = prefix.casefold()
+        matches = []
+        for position in range(bisect_left(keys, (prefix,)), len(keys)):
+            if not keys[position][0].startswith(prefix) or len(matches) == limit:
+                break
+            matches.append(keys[position][2])
+        return matches
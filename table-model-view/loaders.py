@@ -0,0 +1,414 @@
+#!/usr/bin/env python3
+#
+#   loaders.py
+#   Functions to build a TableModel and its info dictionary from CSV, JSON Lines, SQLite and columnar files
+#   Using Python 3.6 and PySide2 v.5.12
+#
+#   Copyright (C) 2019 Robert Parker
+#
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with this program. If not, see <https://www.gnu.org/licenses/>.
+
+
+import gc
+import io
+import os
+import csv
+import json
+import mmap
+import sqlite3
+import threading
+from array import array
+from contextlib import contextmanager
+from itertools import chain, islice, zip_longest
+from storage import ColumnStore
+from table_models import TableModel
+from export import read_columnar
+from mapped import MappedStore, map_npy, map_binary
+from workers import Worker
+
+MMAP_THRESHOLD = 16 * 1024 * 1024  # Files at least this large are memory-mapped rather than read in one go
+READ_CHUNK = 4 * 1024 * 1024  # Bytes of a memory-mapped file decoded and parsed at a time
+FETCH_SIZE = 50000  # Rows fetched from SQLite, or parsed from CSV, at a time
+SAMPLE_SIZE = 1000  # Values per column used to infer column types and widths
+BOOL_TEXT = {"true": True, "false": False}
+ALIGNMENTS = {"int": "right", "float": "right", "bool": "center", "str": "left"}
+CHAR_WIDTH = 8  # Approximate pixels per character used to infer column widths
+MIN_WIDTH = 60
+MAX_WIDTH = 300
+LOADING = set()  # Workers started by start_load(), kept here until they are done so they are not garbage collected
+GC_PAUSES = {"count": 0, "enabled": False}  # Parses running with the cyclic GC paused, and whether it was enabled
+GC_LOCK = threading.Lock()  # Guards GC_PAUSES, as files can be parsed on several Worker threads at once
+
+
+@contextmanager
+def gc_paused():
+    """
+    Pauses the cyclic garbage collector, which otherwise runs over and over while millions of row objects are
+    created and can double the time taken to parse a large file. The collector is switched for the whole process,
+    not per thread, so pauses are counted: the first parse to start disables it, and the last to end restores it.
+    """
+
+    with GC_LOCK:
+        if GC_PAUSES["count"] == 0:
+            GC_PAUSES["enabled"] = gc.isenabled()
+            gc.disable()
+        GC_PAUSES["count"] += 1
+    try:
+        yield
+    finally:
+        with GC_LOCK:
+            GC_PAUSES["count"] -= 1
+            if GC_PAUSES["count"] == 0 and GC_PAUSES["enabled"]:
+                gc.enable()
+
+
+def read_chunks(worker, path, encoding="utf-8"):
+    """
+    Yields the text of a file in pieces which end at line breaks. Small files are read in one go; files of at least
+    MMAP_THRESHOLD bytes are memory-mapped and decoded READ_CHUNK bytes at a time, reporting progress to the worker
+    and stopping early if it is cancelled.
+
+    :param worker: Worker object running the load, or None
+    :param path: str, path of the file
+    :param encoding: str, text encoding of the file
+    """
+
+    size = os.path.getsize(path)
+    with open(path, "rb") as file:
+        if size < MMAP_THRESHOLD:
+            yield file.read().decode(encoding)
+            return
+        with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            start = 0
+            while start < size:
+                if worker is not None:
+                    if worker.cancelled:
+                        return
+                    worker.report(100 * start / size)
+                end = mapped.find(b"\n", start + READ_CHUNK)
+                end = size if end == -1 else end + 1
+                yield mapped[start:end].decode(encoding)
+                start = end
+
+
+def infer_text_type(sample):
+    """Returns 'int', 'float', 'bool' or 'str', the narrowest type every value in a sample of text values parses as"""
+
+    if not sample:
+        return "str"
+    for kind, parse in [("int", int), ("float", float)]:
+        try:
+            for value in sample:
+                parse(value)
+            return kind
+        except ValueError:
+            pass
+    if all(value.lower() in BOOL_TEXT for value in sample):
+        return "bool"
+    return "str"
+
+
+def infer_value_type(sample):
+    """Returns 'int', 'float', 'bool' or 'str', the narrowest type that holds every value in a sample of values"""
+
+    if not sample:
+        return "str"
+    kinds = {type(value) for value in sample}
+    if kinds == {bool}:
+        return "bool"
+    if kinds == {int}:
+        return "int"
+    if kinds <= {int, float}:
+        return "float"
+    return "str"
+
+
+def cast_column(kind, values, text=False):
+    """
+    Converts a column's values to its type in one pass, returning the type and the values (an array for 'int',
+    'float' and 'bool', a list otherwise). If a value outside the sample the type was inferred from does not convert,
+    the column is returned as 'str' with its values unchanged.
+
+    :param kind: str, inferred column type
+    :param values: sequence of the column's values
+    :param text: bool, True if the values are text to be parsed (e.g. read from CSV)
+    """
+
+    try:
+        if kind == "int":
+            return kind, array("q", map(int, values))
+        if kind == "float":
+            return kind, array("d", map(float, values))
+        if kind == "bool" and text:
+            return kind, array("b", map(BOOL_TEXT.__getitem__, map(str.lower, values)))
+        if kind == "bool":
+            return kind, array("b", values)
+    except (ValueError, TypeError, KeyError, OverflowError):
+        pass
+    return "str", values if isinstance(values, list) else list(values)
+
+
+def make_info(columns, types, values, sample_size=SAMPLE_SIZE):
+    """
+    Returns an info dictionary for the columns, with each column's 'Type', its name as 'Label', an 'Alignment' by
+    type, and a 'Width' from the longest of its label and a sample of its values
+
+    :param columns: list of column names (str)
+    :param types: list of column types
+    :param values: list holding a sequence of values for each column
+    :param sample_size: int, number of values per column measured for the width
+    """
+
+    info = {}
+    for column, kind, column_values in zip(columns, types, values):
+        longest = max([len(str(value)) for value in column_values[:sample_size]] + [len(str(column))])
+        info[column] = {"Type": kind, "Label": str(column), "Alignment": ALIGNMENTS[kind],
+                        "Width": min(MAX_WIDTH, max(MIN_WIDTH, CHAR_WIDTH * (longest + 2)))}
+    return info
+
+
+def infer_info(columns, dataset, sample_size=SAMPLE_SIZE):
+    """
+    Returns an info dictionary inferred from a sample of a dataset already held as a list of row lists
+
+    :param columns: list of column names (str)
+    :param dataset: list of lists containing table data, organized as row[column]
+    :param sample_size: int, number of rows used to infer types and widths
+    """
+
+    sample = [list(column) for column in zip(*dataset[:sample_size])] or [[] for _ in columns]
+    return make_info(columns, [infer_value_type(values) for values in sample], sample, sample_size)
+
+
+def finish_columns(columns, values, text, sample_size):
+    """Infers each column's type from a sample, converts the columns, and returns (columns, values, info)"""
+
+    typed = [cast_column(infer_text_type(column_values[:sample_size]) if text
+                         else infer_value_type(column_values[:sample_size]), column_values, text)
+             for column_values in values]
+    types = [kind for kind, _ in typed]
+    values = [column_values for _, column_values in typed]
+    return columns, values, make_info(columns, types, values, sample_size)
+
+
+def read_csv(worker, path, delimiter=",", header=True, encoding="utf-8", sample_size=SAMPLE_SIZE):
+    """
+    Reads a CSV file into typed columns. Returns (columns, values, info): the column names, a list holding each
+    column's values (see cast_column()) and an inferred info dictionary, or None if the worker is cancelled. Written
+    to run on a Worker (workers.py), so it takes the worker as its first argument.
+
+    :param worker: Worker object running the load, or None when called directly
+    :param path: str, path of the file
+    :param delimiter: str, field delimiter, e.g. a tab for TSV
+    :param header: bool, True if the first row holds the column names
+    :param encoding: str, text encoding of the file
+    :param sample_size: int, number of rows used to infer column types and widths
+    """
+
+    lines = chain.from_iterable(io.StringIO(text, newline="") for text in read_chunks(worker, path, encoding))
+    reader = csv.reader(lines, delimiter=delimiter)
+    columns = next(reader, []) if header else None
+    values = None
+    row_count = 0
+    with gc_paused():
+        for rows in iter(lambda: list(islice(reader, FETCH_SIZE)), []):  # Rows are moved into columns a batch at a time
+            if columns is None:
+                columns = ["column{}".format(i + 1) for i in range(len(rows[0]))]
+            if values is None:
+                values = [[] for _ in columns]
+            row_count += len(rows)
+            for column_values, batch_values in zip(values, zip_longest(*rows, fillvalue="")):
+                column_values.extend(batch_values)
+            for column_values in values:  # Columns missing from every row of the batch
+                column_values.extend([""] * (row_count - len(column_values)))
+    if worker is not None and worker.cancelled:
+        return None
+    columns = columns or []
+    return finish_columns(columns, values or [[] for _ in columns], True, sample_size)
+
+
+def read_jsonl(worker, path, encoding="utf-8", sample_size=SAMPLE_SIZE):
+    """
+    Reads a JSON Lines file (one JSON object per line) into typed columns. The columns are the keys found in the
+    first sample_size objects, in the order first seen; missing keys give None. Each piece of the file is parsed
+    with a single json.loads() call rather than one per line. Returns (columns, values, info) as read_csv() does.
+
+    :param worker: Worker object running the load, or None when called directly
+    :param path: str, path of the file
+    :param encoding: str, text encoding of the file
+    :param sample_size: int, number of objects used to find the columns and infer their types and widths
+    """
+
+    records = []
+    with gc_paused():
+        for text in read_chunks(worker, path, encoding):
+            lines = [line for line in text.splitlines() if line.strip()]
+            if lines:
+                records.extend(json.loads("[" + ",".join(lines) + "]"))
+        if worker is not None and worker.cancelled:
+            return None
+        columns = list(dict.fromkeys(key for record in records[:sample_size] for key in record))
+        values = [[record.get(column) for record in records] for column in columns]
+    return finish_columns(columns, values, False, sample_size)
+
+
+def read_sqlite(worker, path, table=None, query=None, sample_size=SAMPLE_SIZE):
+    """
+    Reads a table or query result from a SQLite database into typed columns, FETCH_SIZE rows at a time. Returns
+    (columns, values, info) as read_csv() does.
+
+    :param worker: Worker object running the load, or None when called directly
+    :param path: str, path of the database file
+    :param table: str, name of the table to read, or None for the first table in the database
+    :param query: str, SQL query to read instead of a table
+    :param sample_size: int, number of rows used to infer column types and widths
+    """
+
+    connection = sqlite3.connect(path)
+    try:
+        total = None
+        if query is None:
+            if table is None:
+                table = connection.execute("SELECT name FROM sqlite_master WHERE type = 'table' ORDER BY rowid"
+                                           ).fetchone()[0]
+            name = '"{}"'.format(table.replace('"', '""'))
+            query = "SELECT * FROM " + name
+            total = connection.execute("SELECT COUNT(*) FROM " + name).fetchone()[0]
+        cursor = connection.execute(query)
+        columns = [description[0] for description in cursor.description]
+        values = [[] for _ in columns]
+        with gc_paused():
+            while True:
+                if worker is not None:
+                    if worker.cancelled:
+                        return None
+                    if total:
+                        worker.report(100 * len(values[0]) / total)
+                batch = cursor.fetchmany(FETCH_SIZE)
+                if not batch:
+                    break
+                for column_values, batch_values in zip(values, zip(*batch)):
+                    column_values.extend(batch_values)
+    finally:
+        connection.close()
+    return finish_columns(columns, values, False, sample_size)
+
+
+def read_tcol(worker, path, sample_size=SAMPLE_SIZE):
+    """
+    Reads a columnar file written by export.py. The column types and labels are taken from the file; alignments and
+    widths are inferred. Returns (columns, values, info) as read_csv() does.
+    """
+
+    header, values = read_columnar(path)
+    info = make_info(header["columns"], header["types"], values, sample_size)
+    for column, label in zip(header["columns"], header["labels"]):
+        info[column]["Label"] = label
+    return header["columns"], values, info
+
+
+def read_npy(worker, path, columns=None, sample_size=SAMPLE_SIZE):
+    """
+    Memory-maps a NumPy .npy file, without NumPy, and returns (columns, values, info) as read_csv() does, the values
+    as zero-copy views of the file wherever possible (see mapped.map_npy())
+
+    :param columns: list of column names (str), or None for the field names of a structured array or "0", "1", ...
+    """
+
+    columns, types, values = map_npy(path, columns)
+    return columns, values, make_info(columns, types, values, sample_size)
+
+
+def read_binary(worker, path, fields, layout="rows", offset=0, byte_order="=", sample_size=SAMPLE_SIZE):
+    """
+    Memory-maps a fixed-width binary dump and returns (columns, values, info) as read_npy() does. See
+    mapped.map_binary() for the fields, layout, offset and byte_order arguments, e.g.
+    load_table("prices.bin", fields=[("time", "q"), ("price", "d")]).
+    """
+
+    columns, types, values = map_binary(path, fields, layout, offset, byte_order)
+    return columns, values, make_info(columns, types, values, sample_size)
+
+
+READERS = {".csv": (read_csv, {}), ".tsv": (read_csv, {"delimiter": "\t"}), ".txt": (read_csv, {"delimiter": "\t"}),
+           ".jsonl": (read_jsonl, {}), ".ndjson": (read_jsonl, {}), ".db": (read_sqlite, {}),
+           ".sqlite": (read_sqlite, {}), ".sqlite3": (read_sqlite, {}), ".tcol": (read_tcol, {}),
+           ".npy": (read_npy, {}), ".bin": (read_binary, {})}
+
+
+def reader_for(path, options):
+    """Returns the reader function for a file, by its extension, and its keyword arguments updated with options"""
+
+    extension = os.path.splitext(path)[1].lower()
+    if extension not in READERS:
+        raise ValueError("No loader for {} files".format(extension))
+    function, defaults = READERS[extension]
+    return function, dict(defaults, **options)
+
+
+def make_model(result, columnar=True, batch_size=1000):
+    """
+    Builds a TableModel from the (columns, values, info) returned by a reader. Call on the GUI thread, e.g. from a
+    slot connected to the finished signal of the worker returned by start_load().
+
+    :param result: tuple of column names, list of column values, and info dictionary
+    :param columnar: bool, True to keep the typed columns in a ColumnStore (no copy; a MappedStore for memory-mapped
+    columns), False to build a list of rows
+    :param batch_size: int, see TableModel
+    """
+
+    columns, values, info = result
+    if columnar:
+        mapped = any(isinstance(column_values, memoryview) for column_values in values)
+        store = (MappedStore if mapped else ColumnStore).from_columns(columns, info, values)
+        return TableModel(columns, store, info, batch_size=batch_size)
+    decoded = [map(bool, column_values) if info[column]["Type"] == "bool" else column_values
+               for column, column_values in zip(columns, values)]
+    return TableModel(columns, [list(row) for row in zip(*decoded)], info, batch_size=batch_size)
+
+
+def load_table(path, columnar=True, **options):
+    """
+    Reads a .csv, .tsv/.txt, .jsonl/.ndjson, SQLite (.db/.sqlite/.sqlite3), columnar (.tcol), NumPy (.npy) or
+    fixed-width binary (.bin, given fields=) file and returns a TableModel holding it, with an inferred info
+    dictionary (model.info). Keyword options are passed to the reader, e.g. table="scores" for SQLite or header=False
+    for CSV.
+
+    :param path: str, path of the file
+    :param columnar: bool, see make_model()
+    """
+
+    function, options = reader_for(path, options)
+    return make_model(function(None, path, **options), columnar)
+
+
+def start_load(path, **options):
+    """
+    Reads a file as load_table() does, but on a background Worker which it returns. Connect worker.signals.finished
+    to a slot which passes the result to make_model(); progress and failed report as for any Worker. The worker is
+    kept referenced until it emits done, even if it is cancelled, so the caller need not hold on to it.
+
+    :param path: str, path of the file
+    """
+
+    function, options = reader_for(path, options)
+    worker = Worker(lambda worker: function(worker, path, **options))
+
+    def release():
+        LOADING.discard(worker)
+
+    LOADING.add(worker)
+    worker.signals.done.connect(release)
+    worker.start()
+    return worker
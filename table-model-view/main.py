@@ -20,19 +20,22 @@
 #   along with this program. If not, see <https://www.gnu.org/licenses/>.
 
 
-from PySide2.QtWidgets import QFrame, QVBoxLayout, QComboBox, QPushButton
-from PySide2.QtGui import QColor
+from PySide2.QtWidgets import QFrame, QVBoxLayout, QComboBox, QPushButton, QTableView, QHeaderView
 from table_models import TableModel, ProxyModel
 from table_view import TableView
-from delegates import FillColorDelegate
+from search import SearchBox
+from deferred import DeferredBuilder
 
 
 class MainFrame(QFrame):
-    def __init__(self):
+    def __init__(self, lazy=True):
         """
         Basic widget to display an example of a table view with underlying model and proxy model
         Either read or directly define: a list of column names, a list of lists (row[column]) holding table data, and
         a dict of dicts holding information (Type, Label, Alignment, Width, and other other info) for each column name.
+
+        :param lazy: bool, True to show the table first and build the summary, delegates and filter choices once the
+        frame has painted (see deferred.py); False to build everything before the frame is shown
         """
 
         super().__init__()
@@ -46,22 +49,36 @@ class MainFrame(QFrame):
         self.table_model = TableModel(columns, data, info)
         self.proxy_model = ProxyModel(self.table_model)
         self.table_view = TableView(self, self.proxy_model, "My table")
+        self.search_box = SearchBox(self.proxy_model, self.table_view, mode="tokens")
+        self.summary_model = None
+        self.summary_view = QTableView()
         self.filter_combo = QComboBox()
         self.reset_button = QPushButton("Reset filters")
-        self.setup(data)
+        self.delegates = {}
+        self.setup()
         self.filter_combo.currentTextChanged.connect(self.apply_filter)
         self.reset_button.clicked.connect(self.proxy_model.reset_filters)
-        self.delegates = {}
-        self.setup_delegates()
+        self.builder = DeferredBuilder(self)
+        for step in [self.setup_summary, self.setup_delegates, self.setup_filter_combo]:
+            self.builder.add(step)
+        if not lazy:
+            self.builder.finish()
+
+    def setup_summary(self):
+        """Creates the summary model shown below the table"""
+
+        from aggregates import SummaryModel
+        self.summary_model = SummaryModel(self.proxy_model, [("number1", "sum"), ("number2", "mean")], "name",
+                                          show_total=True)
+        self.summary_view.setModel(self.summary_model)
 
     def setup_delegates(self):
         """Store delegates in self.delegates dictionary by column name and apply delegates to table view"""
 
+        from PySide2.QtGui import QColor
+        from delegates import FillColorDelegate
         self.delegates["highscore"] = FillColorDelegate(self.proxy_model, QColor(0, 0, 255))
-        for column_name, delegate in self.delegates.items():
-            for i, column in enumerate(self.table_model.columns):
-                if column == column_name:
-                    self.table_view.setItemDelegateForColumn(i, delegate)
+        self.table_view.set_delegates(self.delegates)
 
     def apply_filter(self):
         """Simple method to read the example combo box and filter the proxy model by the selected name"""
@@ -70,17 +87,25 @@ class MainFrame(QFrame):
         if name != "Select name":
             self.proxy_model.add_filter_condition("name", name)
 
-    def setup(self, data):
-        """Setup layout and populate the filter combo box"""
+    def setup(self):
+        """Setup layout"""
 
         self.setFixedWidth(400)
         layout = QVBoxLayout(self)
+        layout.addWidget(self.search_box)
         layout.addWidget(self.table_view)
+        layout.addWidget(self.summary_view)
         layout.addWidget(self.filter_combo)
         layout.addWidget(self.reset_button)
-
-        names_list = []
-        [names_list.append(row[0]) for row in data if row[0] not in names_list]
+        self.summary_view.verticalHeader().hide()
+        self.summary_view.horizontalHeader().setSectionResizeMode(QHeaderView.Stretch)
         self.filter_combo.addItem("Select name")
+
+    def setup_filter_combo(self):
+        """Populates the filter combo box with the distinct names"""
+
+        names_list = self.table_model.distinct_index(self.table_model.columns.index("name")).values()
+        self.filter_combo.blockSignals(True)  # Adding items must not filter the table
         self.filter_combo.addItems(names_list)
         self.filter_combo.setCurrentText("Select name")
+        self.filter_combo.blockSignals(False)
@@ -0,0 +1,259 @@
+#!/usr/bin/env python3
+#
+#   mapped.py
+#   Memory-mapped, zero-copy columns from NumPy .npy files and fixed-width binary dumps
+#   Using Python 3.6 and PySide2 v.5.12
+#
+#   Copyright (C) 2019 Robert Parker
+#
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with this program. If not, see <https://www.gnu.org/licenses/>.
+
+
+import ast
+import sys
+import mmap
+import struct
+from array import array
+from storage import ColumnStore
+
+FORMATS = {"b": "int", "B": "int", "h": "int", "H": "int", "i": "int", "I": "int", "q": "int", "Q": "int",
+           "f": "float", "d": "float", "?": "bool"}  # struct format character -> column type
+ARRAY_CODES = {"?": "b"}  # struct formats without an array typecode of their own
+NPY_MAGIC = b"\x93NUMPY"
+NPY_FORMATS = {"i1": "b", "u1": "B", "i2": "h", "u2": "H", "i4": "i", "u4": "I", "i8": "q", "u8": "Q", "f4": "f",
+               "f8": "d", "b1": "?"}  # .npy dtype kind and size -> struct format character
+NATIVE = "<" if sys.byteorder == "little" else ">"
+
+
+def map_file(path):
+    """Returns a read-only memoryview of a whole file, memory-mapped so that its pages are read only when used"""
+
+    with open(path, "rb") as file:
+        if not file.seek(0, 2):
+            return memoryview(b"")  # An empty file cannot be mapped
+        return memoryview(mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ))
+
+
+def column_view(buffer, start, count, stride, fmt, swap=False):
+    """
+    Returns the values of one column held in a buffer, as a memoryview of the buffer itself where possible. That
+    is when the values are in native byte order and the distance between them (stride) is a whole number of values,
+    which covers columns stored one after another and records whose fields are laid out in order of size. Otherwise
+    the values are copied out, a byte position at a time rather than value by value, into an array.
+
+    :param buffer: memoryview of bytes
+    :param start: int, byte position of the column's first value
+    :param count: int, number of values
+    :param stride: int, bytes from the start of one value to the start of the next
+    :param fmt: str, struct format character of the values (see FORMATS)
+    :param swap: bool, True if the values are not in native byte order
+    """
+
+    size = struct.calcsize(fmt)
+    swap = swap and size > 1
+    end = start + (count - 1) * stride + size if count else start
+    if not swap and stride % size == 0:
+        values = buffer[start:end].cast(fmt)
+        return values if stride == size else values[::stride // size]
+    data = bytearray(count * size)
+    for byte in range(size):
+        data[size - 1 - byte if swap else byte::size] = buffer[start + byte:end:stride]
+    values = array(ARRAY_CODES.get(fmt, fmt))
+    values.frombytes(data)
+    return values
+
+
+def parse_npy_type(descr):
+    """Returns the struct format character and whether the values need byte swapping, for a .npy type string"""
+
+    order, code = descr[0], descr[1:]
+    if code not in NPY_FORMATS:
+        raise ValueError("Unsupported .npy type {}".format(descr))
+    return NPY_FORMATS[code], order not in ("|", "=", NATIVE)
+
+
+def read_npy_header(buffer):
+    """
+    Reads the header of a .npy file (format versions 1 to 3) without NumPy. Returns a list of (name, struct format,
+    byte position within a row, swap) tuples for the fields of each row, the size of a row in bytes, the shape, whether
+    the array is in Fortran (column major) order, and the byte position of the data.
+
+    :param buffer: memoryview of the file
+    """
+
+    if bytes(buffer[:6]) != NPY_MAGIC:
+        raise ValueError("Not a .npy file")
+    major = buffer[6]
+    length_format, start = ("<H", 10) if major == 1 else ("<I", 12)
+    length, = struct.unpack_from(length_format, buffer, 8)
+    header = ast.literal_eval(bytes(buffer[start:start + length]).decode("utf-8" if major >= 3 else "latin1"))
+    descr = header["descr"]
+    fields = []
+    position = 0
+    if isinstance(descr, str):
+        fmt, swap = parse_npy_type(descr)
+        fields.append(("value", fmt, 0, swap))
+        position = struct.calcsize(fmt)
+    else:  # Structured type: a list of (name, type) pairs, where unnamed void fields are padding
+        for field in descr:
+            name, field_type = field[0], field[1]
+            if len(field) > 2 or not isinstance(field_type, str):
+                raise ValueError("Unsupported .npy field {}".format(name))
+            if field_type[1:2] == "V":
+                position += int(field_type[2:])
+                continue
+            fmt, swap = parse_npy_type(field_type)
+            fields.append((name, fmt, position, swap))
+            position += struct.calcsize(fmt)
+    return fields, position, tuple(header["shape"]), header["fortran_order"], start + length
+
+
+def map_npy(path, columns=None):
+    """
+    Maps a .npy file and returns (column names, column types, column values), the values as memoryviews of the
+    mapping wherever column_view() allows. A one dimensional array gives one column, or one per field of a
+    structured (record) array; a two dimensional array gives one column per array column, in either order.
+
+    :param path: str, path of the file
+    :param columns: list of column names (str) to use instead of the field names or "0", "1", ...
+    """
+
+    buffer = map_file(path)
+    fields, row_size, shape, fortran_order, offset = read_npy_header(buffer)
+    if len(shape) == 2 and len(fields) == 1:
+        rows, width = shape
+        _, fmt, _, swap = fields[0]
+        size = struct.calcsize(fmt)
+        names = [str(column) for column in range(width)]
+        if fortran_order:
+            values = [column_view(buffer, offset + column * rows * size, rows, size, fmt, swap)
+                      for column in range(width)]
+        else:
+            values = [column_view(buffer, offset + column * size, rows, width * size, fmt, swap)
+                      for column in range(width)]
+        fields = [(name, fmt, 0, swap) for name in names]
+    elif len(shape) == 1:
+        names = [name for name, _, _, _ in fields]
+        values = [column_view(buffer, offset + position, shape[0], row_size, fmt, swap)
+                  for _, fmt, position, swap in fields]
+    else:
+        raise ValueError("Only one and two dimensional .npy arrays can be loaded, not shape {}".format(shape))
+    return columns or names, [FORMATS[fmt] for _, fmt, _, _ in fields], values
+
+
+def map_binary(path, fields, layout="rows", offset=0, byte_order="="):
+    """
+    Maps a fixed-width binary dump and returns (column names, column types, column values) as map_npy() does. The
+    number of rows is the size of the data divided by the size of a row.
+
+    :param path: str, path of the file
+    :param fields: list of (column name, struct format character) pairs, e.g. [("time", "q"), ("price", "d")]
+    :param layout: str, "rows" if the file holds one record after another with the fields packed in order, or
+    "columns" if it holds every value of the first column, then every value of the second, and so on
+    :param offset: int, bytes of header before the data
+    :param byte_order: str, "<" little-endian, ">" big-endian or "=" native
+    """
+
+    if layout not in ("rows", "columns"):
+        raise ValueError("Unknown binary layout {}".format(layout))
+    for name, fmt in fields:
+        if fmt not in FORMATS:
+            raise ValueError("Unsupported format {} for column {}".format(fmt, name))
+    buffer = map_file(path)
+    sizes = [struct.calcsize(fmt) for _, fmt in fields]
+    row_size = sum(sizes)
+    rows = (len(buffer) - offset) // row_size
+    swap = byte_order not in ("=", NATIVE)
+    values = []
+    position = offset
+    for (_, fmt), size in zip(fields, sizes):
+        if layout == "rows":
+            values.append(column_view(buffer, position, rows, row_size, fmt, swap))
+            position += size
+        else:
+            values.append(column_view(buffer, position, rows, size, fmt, swap))
+            position += rows * size
+    return [name for name, _ in fields], [FORMATS[fmt] for _, fmt in fields], values
+
+
+class MappedStore(ColumnStore):
+    """
+    ColumnStore whose columns may be memoryviews of a memory-mapped file (see map_npy() and map_binary()). The
+    mapping is read-only, so the operating system loads pages only as they are read and shares them between every
+    process mapping the same file. data(), sorting and ProxyModel's filters read the mapped values directly. A
+    column is copied into an array the first time one of its cells is edited, and every column the first time rows
+    are inserted or removed; edits are never written to the file.
+    """
+
+    @classmethod
+    def from_columns(cls, columns, info, values):
+        """As ColumnStore.from_columns(), but memoryviews are also used as they are"""
+
+        mapped = [isinstance(column_values, memoryview) for column_values in values]
+        store = super().from_columns(columns, info, [() if is_mapped else column_values
+                                                     for is_mapped, column_values in zip(mapped, values)])
+        for i, (is_mapped, column_values) in enumerate(zip(mapped, values)):
+            if is_mapped:
+                store.columns[i] = column_values
+        return store
+
+    def mapped_columns(self):
+        """Returns the numbers of the columns still read from the mapping"""
+
+        return [i for i, values in enumerate(self.columns) if isinstance(values, memoryview)]
+
+    def copy_column(self, column):
+        """Copies a mapped column into an array, so that it can be changed"""
+
+        values = self.columns[column]
+        if isinstance(values, memoryview):
+            self.columns[column] = array(ARRAY_CODES.get(values.format, values.format), values)
+
+    def copy_columns(self):
+        """Copies every mapped column into an array, before rows are inserted or removed"""
+
+        for column in self.mapped_columns():
+            self.copy_column(column)
+
+    def set_value(self, row, column, value):
+        """As ColumnStore.set_value(), copying the column out of the mapping first"""
+
+        self.copy_column(column)
+        super().set_value(row, column, value)
+
+    def append_rows(self, rows):
+        """As ColumnStore.append_rows(), copying the mapped columns first"""
+
+        rows = rows if isinstance(rows, (list, tuple)) else list(rows)
+        if rows:
+            self.copy_columns()
+        super().append_rows(rows)
+
+    def insert_stored(self, position, rows):
+        """As ColumnStore.insert_stored(), copying the mapped columns first"""
+
+        self.copy_columns()
+        super().insert_stored(position, rows)
+
+    def remove_stored(self, position, count):
+        """As ColumnStore.remove_stored(), copying the mapped columns first"""
+
+        self.copy_columns()
+        super().remove_stored(position, count)
+
+    def keep_stored(self, keep):
+        """As ColumnStore.keep_stored(), copying the mapped columns first"""
+
+        self.copy_columns()
+        super().keep_stored(keep)
@@ -21,12 +21,25 @@
 
 
 import sys
-from PySide2.QtWidgets import QApplication
-from main import MainFrame
+from startup_trace import StartupTracer
+
+tracer = StartupTracer.from_arguments(sys.argv)  # Opt in with --trace-startup[=path] or STARTUP_TRACE=path
+with tracer.span("imports"):
+    from PySide2.QtWidgets import QApplication
+    from main import MainFrame
+    from table_models import TableModel, ProxyModel
+    from table_view import TableView
 
 
 if __name__ == '__main__':
-    app = QApplication(sys.argv)
-    ex = MainFrame()
-    ex.show()
+    tracer.trace_methods(TableModel, ["__init__"])
+    tracer.trace_methods(ProxyModel, ["__init__"])
+    tracer.trace_methods(TableView, ["__init__", "set_widths", "fit_rows"])
+    with tracer.span("QApplication"):
+        app = QApplication(sys.argv)
+    with tracer.span("MainFrame"):
+        ex = MainFrame()
+    with tracer.span("show"):
+        ex.show()
+    tracer.finish_on_paint(ex)
     sys.exit(app.exec_())
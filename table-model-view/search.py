@@ -0,0 +1,271 @@
+#!/usr/bin/env python3
+#
+#   search.py
+#   Substring, token and regular expression search across the columns of a table, and a debounced search box
+#   Using Python 3.6 and PySide2 v.5.12
+#
+#   Copyright (C) 2019 Robert Parker
+#
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with this program. If not, see <https://www.gnu.org/licenses/>.
+
+
+import re
+from array import array
+from bisect import bisect_right
+from itertools import accumulate, chain
+from PySide2.QtWidgets import QLineEdit
+from PySide2.QtCore import QTimer
+
+MODES = ["substring", "tokens", "regex"]
+SEPARATOR = "\x1f"  # Placed between the columns of a row's text, so a search term cannot join two cells by accident
+DENSE_FRACTION = 16  # Once 1/DENSE_FRACTION of the rows match, the rest are tested row by row instead of searched
+SEARCH_DELAY = 150  # Milliseconds SearchBox waits after the last keystroke before searching
+
+
+def compile_query(query, mode):
+    """
+    Returns a compiled regular expression for a search query and a quicker one which every matching row also
+    matches, for finding candidate rows (the same expression unless a faster one exists), or (None, None) if the
+    query is empty
+
+    - substring: the query text anywhere in a row, ignoring case
+    - tokens: every word of the query, in any order, each at the start of a word in the row (so "da sm" finds
+      "David Smith")
+    - regex: a regular expression, ignoring case
+
+    Raises re.error for an invalid regular expression.
+    """
+
+    if mode not in MODES:
+        raise ValueError("Unknown search mode {}".format(mode))
+    empty = not query if mode == "substring" else not query.strip()
+    if empty:
+        return None, None
+    if mode == "substring":
+        pattern = re.compile(re.escape(query.casefold()))
+        return pattern, pattern
+    if mode == "tokens":
+        words = query.casefold().split()
+        tokens = [r"(?<!\w){}".format(re.escape(word)) for word in words]
+        prefilter = re.compile(re.escape(max(words, key=len)))  # Plain text is found far faster than a lookbehind
+        if len(tokens) == 1:
+            return re.compile(tokens[0]), prefilter
+        return re.compile("^" + "".join("(?=.*{})".format(token) for token in tokens), re.MULTILINE), prefilter
+    pattern = re.compile(query, re.IGNORECASE | re.MULTILINE)
+    return pattern, pattern
+
+
+def narrows(previous, query, mode):
+    """Returns True if every row matching query must also match previous, so only previous matches need testing"""
+
+    if previous is None or mode == "regex":
+        return False
+    previous_query, previous_mode = previous
+    if previous_mode != mode or not previous_query:
+        return False
+    if mode == "substring":
+        return previous_query.casefold() in query.casefold()
+    words = query.casefold().split()
+    return all(any(word.startswith(token) for word in words) for token in previous_query.casefold().split())
+
+
+class SearchIndex:
+    def __init__(self, model, columns):
+        """
+        Lowercase (case-folded) text of every row of a TableModel, as the model displays it, for searching across
+        columns. Each row's cells are joined into one string; the strings are also joined into one large text with
+        the position of each row's start, so a rare term is found with a few scans of that text (regular expression
+        searches in C) rather than a test of every row. Once matches are common, the remaining rows are tested one
+        by one instead, which is then quicker. ProxyModel keeps the index in step with the model (see
+        ProxyModel.set_search()).
+
+        :param model: TableModel object to search
+        :param columns: list of the column numbers to search
+        """
+
+        self.model = model
+        self.columns = columns
+        self.texts = None  # Text of each row, built on first use
+        self.blob = None  # All the row texts joined by newlines, built on first use after any change
+        self.starts = None  # array of the position of each row's text in blob
+        self.pattern = None  # Compiled current query
+        self.query = None  # (query, mode) of the current search, for narrowing the next one
+        self.rows = []  # Rows matching the current query
+
+    def row_texts(self, rows):
+        """Returns the case-folded search text of the given rows"""
+
+        values = self.model.display_columns(rows, self.columns)
+        join = SEPARATOR.join
+        return [join(map(str, cells)).replace("\n", " ").casefold() for cells in zip(*values)]
+
+    def all_texts(self):
+        """Returns the text of every row, building them if necessary"""
+
+        if self.texts is None:
+            self.texts = self.row_texts(range(self.model.rowCount()))
+            self.blob = None
+        return self.texts
+
+    def joined(self):
+        """Returns the joined text and the start position of each row in it, building them if necessary"""
+
+        if self.blob is None:
+            texts = self.all_texts()
+            self.blob = "\n".join(texts)
+            self.starts = array("q", accumulate(chain([0], (len(text) + 1 for text in texts[:-1]))))
+        return self.blob, self.starts
+
+    def changed(self):
+        """Drops the joined text and the result the next search would narrow from, after the rows change"""
+
+        self.blob = None
+        self.starts = None
+        self.query = None
+
+    def update_rows(self, first, last):
+        """Re-reads the text of rows first to last, inclusive, after their cells were edited"""
+
+        if self.texts is not None:
+            self.texts[first:last + 1] = self.row_texts(range(first, last + 1))
+        self.changed()
+
+    def insert_rows(self, first, last):
+        """Adds the text of rows first to last, inclusive, inserted into the model"""
+
+        if self.texts is not None:
+            self.texts[first:first] = self.row_texts(range(first, last + 1))
+        self.changed()
+
+    def remove_rows(self, first, last):
+        """Drops the text of rows first to last, inclusive, removed from the model"""
+
+        if self.texts is not None:
+            del self.texts[first:last + 1]
+        self.changed()
+
+    def invalidate(self):
+        """Drops every row text, to be read again on the next search, e.g. after a model reset"""
+
+        self.texts = None
+        self.changed()
+
+    def accepts(self, row):
+        """Tests a single row against the current query"""
+
+        return self.pattern is None or self.pattern.search(self.all_texts()[row]) is not None
+
+    def search(self, query, mode="substring"):
+        """
+        Returns a sorted list of the rows matching a query (see compile_query()). If the query only narrows the
+        previous one, e.g. more letters were typed, only the previous matches are tested.
+
+        :param query: str, text to search for
+        :param mode: str, "substring", "tokens" or "regex"
+        """
+
+        pattern, prefilter = compile_query(query, mode)
+        texts = self.all_texts()
+        if pattern is None:
+            rows = list(range(len(texts)))
+        elif narrows(self.query, query, mode):
+            search = pattern.search
+            rows = [row for row in self.rows if search(texts[row])]
+        else:
+            rows = self.scan(prefilter)
+            if prefilter is not pattern:
+                search = pattern.search
+                rows = [row for row in rows if search(texts[row])]
+        self.pattern = pattern
+        self.query = (query, mode)
+        self.rows = rows
+        return rows
+
+    def scan(self, pattern):
+        """Returns the rows matching a compiled query, searching the joined text"""
+
+        blob, starts = self.joined()
+        texts = self.texts
+        row_count = len(texts)
+        search = pattern.search
+        dense = max(1, row_count // DENSE_FRACTION)
+        rows = []
+        match = search(blob) if row_count else None
+        while match is not None:
+            row = bisect_right(starts, match.start()) - 1
+            end = starts[row + 1] - 1 if row + 1 < row_count else len(blob)
+            if match.end() <= end or search(texts[row]):  # A match running into the next row is checked again
+                rows.append(row)
+            if row + 1 >= row_count:
+                break
+            if len(rows) >= dense:
+                rows.extend(row for row in range(row + 1, row_count) if search(texts[row]))
+                break
+            match = search(blob, starts[row + 1])
+        return rows
+
+    def mask(self, rows):
+        """Returns a row mask with 1 for each of the given rows"""
+
+        mask = bytearray(len(self.all_texts()))
+        for row in rows:
+            mask[row] = 1
+        return mask
+
+
+class SearchBox(QLineEdit):
+    def __init__(self, proxy, view=None, mode="substring", delay=SEARCH_DELAY):
+        """
+        Line edit which filters a ProxyModel to the rows matching the text typed, across every column (or every
+        column the view shows). The search runs once typing pauses for delay milliseconds, rather than on every
+        keystroke. An invalid regular expression is shown by a tooltip and leaves the previous results in place.
+
+        :param proxy: ProxyModel object to filter
+        :param view: TableView object whose visible columns are searched, or None for all columns
+        :param mode: str, "substring", "tokens" or "regex"
+        :param delay: int, milliseconds to wait after the last keystroke
+        """
+
+        super().__init__()
+        self.proxy = proxy
+        self.view = view
+        self.mode = mode
+        self.setPlaceholderText("Search")
+        self.setClearButtonEnabled(True)
+        self.timer = QTimer(self)
+        self.timer.setSingleShot(True)
+        self.timer.setInterval(delay)
+        self.timer.timeout.connect(self.search)
+        self.textChanged.connect(self.timer.start)
+
+    def set_mode(self, mode):
+        """Changes the search mode and searches again"""
+
+        self.mode = mode
+        self.search()
+
+    def search(self):
+        """Filters the proxy model by the current text"""
+
+        self.timer.stop()
+        columns = None
+        if self.view is not None:
+            columns = [column for column in range(self.proxy.sourceModel().columnCount())
+                       if not self.view.isColumnHidden(column)]
+        try:
+            self.proxy.set_search(self.text(), self.mode, columns)
+        except re.error as error:
+            self.setToolTip("Invalid regular expression: {}".format(error))
+            return
+        self.setToolTip("")
@@ -0,0 +1,430 @@
+#!/usr/bin/env python3
+#
+#   sqlite_model.py
+#   Table model whose rows stay in a SQLite database and are read a page at a time as the view needs them
+#   Using Python 3.6 and PySide2 v.5.12
+#
+#   Copyright (C) 2019 Robert Parker
+#
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with this program. If not, see <https://www.gnu.org/licenses/>.
+
+
+import math
+import sqlite3
+import threading
+from collections import OrderedDict
+from PySide2.QtCore import Qt
+from storage import Store, CASTS
+from table_models import TableModel, row_ranges
+from loaders import SAMPLE_SIZE, infer_value_type, make_info
+from search import SEPARATOR, compile_query
+
+PAGE_SIZE = 500  # Rows read by each page query
+CACHE_PAGES = 64  # Pages kept in memory, least recently used dropped first
+MAX_BOUNDARIES = 100000  # Page boundaries remembered for keyset queries before the record is cleared
+
+
+def quote_name(name):
+    """Returns a table or column name quoted for use in SQL"""
+
+    return '"{}"'.format(str(name).replace('"', '""'))
+
+
+def sql_literal(value):
+    """
+    Returns a value written as a SQL literal, so that filter conditions do not depend on one connection's bound
+    parameters or on the limit on the number of parameters in a statement
+    """
+
+    if value is None:
+        return "NULL"
+    if isinstance(value, (bool, int)):
+        return str(int(value))
+    if isinstance(value, float):
+        return repr(value) if math.isfinite(value) else ("9e999" if value > 0 else "-9e999")
+    if isinstance(value, bytes):
+        return "X'{}'".format(value.hex())
+    return "'{}'".format(str(value).replace("'", "''"))
+
+
+class SqliteStore(Store):
+    def __init__(self, path, table=None, page_size=PAGE_SIZE, cache_pages=CACHE_PAGES):
+        """
+        Storage for TableModel which leaves the rows in a SQLite table. The rows presented are the result of a query
+        on the table (see set_query()), read PAGE_SIZE rows at a time into a least recently used cache of CACHE_PAGES
+        pages, so memory use depends on the page settings rather than the size of the table. The row count is
+        counted once per query and cached.
+
+        A page following one already read is fetched with a keyset query (continuing after the last sort key and
+        rowid of the previous page), which costs the same wherever it is in the table; other pages use LIMIT and
+        OFFSET. Each thread reading the store gets its own connection, so exports can run on a Worker.
+
+        A text search is applied in the query too, through a SQL function, search_matches(), registered on each
+        connection, which tests the text of a row's searched columns as SearchIndex (search.py) would. SQLite calls
+        it for every row the query visits, so a search costs a pass over the table each time the query is set.
+
+        :param path: str, path of the database file
+        :param table: str, name of the table, or None for the first table in the database
+        :param page_size: int, rows per page
+        :param cache_pages: int, number of pages kept in memory
+        """
+
+        self.path = path
+        self.local = threading.local()  # Holds each thread's connection
+        if table is None:
+            table = self.connection().execute("SELECT name FROM sqlite_master WHERE type = 'table' ORDER BY rowid"
+                                              ).fetchone()[0]
+        self.table = table
+        self.column_names = [row[1] for row in self.connection().execute(
+            "PRAGMA table_info({})".format(quote_name(table)))]
+        self.page_size = page_size
+        self.cache_pages = cache_pages
+        self.casts = [None] * len(self.column_names)
+        self.decoders = [None] * len(self.column_names)
+        self.typed = True  # SQLite returns values with their stored types
+        self.where = ""  # SQL condition built by set_query(), "" for every row
+        self.sort_column = -1  # Column number the query sorts by, -1 for rowid order
+        self.descending = False
+        self.search_pattern = None  # Compiled search tested by search_matches(), None when not searching
+        self.search_decoders = []  # Decoders of the searched columns, in the order they are passed to search_matches()
+        self.count = None  # Cached row count of the current query
+        self.pages = OrderedDict()  # Page number -> list of [rowid, value, value, ...] rows
+        self.boundaries = {}  # Page number -> (sort key, rowid) of the page's last row, for keyset queries
+
+    def connection(self):
+        """Returns the calling thread's connection to the database, opening it if necessary"""
+
+        connection = getattr(self.local, "connection", None)
+        if connection is None:
+            connection = self.local.connection = sqlite3.connect(self.path)
+            connection.create_function("search_matches", -1, self.search_matches)
+        return connection
+
+    def search_matches(self, *values):
+        """
+        SQL function returning 1 if the values of a row's searched columns, joined into one case-folded text as
+        SearchIndex joins them, match the current search
+        """
+
+        text = SEPARATOR.join(str(value if decode is None or value is None else decode(value))
+                              for decode, value in zip(self.search_decoders, values))
+        return self.search_pattern.search(text.replace("\n", " ").casefold()) is not None
+
+    def set_types(self, types):
+        """
+        Sets the column types ('Type' in the info dictionary) so that values written are cast to them and bool
+        columns, stored by SQLite as 0 and 1, are read back as bools
+
+        :param types: list of column types, one per column
+        """
+
+        self.casts = [CASTS.get(kind) for kind in types]
+        self.decoders = [bool if kind == "bool" else None for kind in types]
+
+    def set_query(self, conditions=None, excluded=(), sort_column=-1, descending=False, search=None):
+        """
+        Sets which rows are presented and in what order, clearing the cached pages and count. Raises re.error for a
+        search with an invalid regular expression.
+
+        :param conditions: dict, column number -> set of values to be included, combined with AND
+        :param excluded: iterable of rowids to leave out
+        :param sort_column: int, column number to sort by, or -1 for rowid order
+        :param descending: bool, True to sort from largest to smallest
+        :param search: (query, mode, list of column numbers) of a text search as for ProxyModel.set_search(), or None
+        """
+
+        pattern = None if search is None else compile_query(search[0], search[1])[0]
+
+        clauses = []
+        for column, values in sorted((conditions or {}).items()):
+            clauses.append("{} IN ({})".format(quote_name(self.column_names[column]),
+                                               ", ".join(map(sql_literal, values)) or "NULL"))
+        excluded = list(excluded)
+        if excluded:
+            clauses.append("rowid NOT IN ({})".format(", ".join(map(sql_literal, excluded))))
+        self.search_pattern = pattern
+        if pattern is not None:
+            columns = search[2]
+            self.search_decoders = [self.decoders[column] for column in columns]
+            clauses.append("search_matches({})".format(", ".join(quote_name(self.column_names[column])
+                                                                 for column in columns)))
+        self.where = " AND ".join(clauses)
+        self.sort_column = sort_column
+        self.descending = descending
+        self.clear_cache()
+
+    def clear_cache(self):
+        """Drops cached pages, page boundaries and the row count, e.g. after the table is changed"""
+
+        self.count = None
+        self.pages.clear()
+        self.boundaries.clear()
+
+    def select(self, extra_condition=""):
+        """Returns a SELECT statement for rowid and every column of the current query, sorted, without a LIMIT"""
+
+        conditions = " AND ".join(clause for clause in [self.where, extra_condition] if clause)
+        direction = " DESC" if self.descending else ""
+        order = "rowid" + direction
+        if self.sort_column >= 0:
+            order = quote_name(self.column_names[self.sort_column]) + direction + ", " + order
+        return "SELECT rowid, {} FROM {}{} ORDER BY {}".format(", ".join(map(quote_name, self.column_names)),
+                                                              quote_name(self.table),
+                                                              " WHERE " + conditions if conditions else "", order)
+
+    def query_rows(self, first, count, connection=None):
+        """Returns count rows of the current query from row number first, as lists, using LIMIT and OFFSET"""
+
+        connection = connection or self.connection()
+        return [list(row) for row in connection.execute(self.select() + " LIMIT ? OFFSET ?", (count, first))]
+
+    def load_page(self, page):
+        """Reads a page of rows into the cache, dropping the least recently used page if the cache is full"""
+
+        boundary = self.boundaries.get(page - 1)
+        if boundary is not None and (self.sort_column < 0 or boundary[0] is not None):
+            key, rowid = boundary
+            after = "<" if self.descending else ">"
+            if self.sort_column < 0:
+                condition = "rowid {} {}".format(after, rowid)
+            else:
+                column = quote_name(self.column_names[self.sort_column])
+                condition = "({0} {1} {2} OR ({0} = {2} AND rowid {1} {3}){4})".format(
+                    column, after, sql_literal(key), rowid, " OR {} IS NULL".format(column) if self.descending else "")
+            rows = [list(row) for row in self.connection().execute(self.select(condition) + " LIMIT ?",
+                                                                     (self.page_size,))]
+        else:
+            rows = self.query_rows(page * self.page_size, self.page_size)
+        if rows:
+            if len(self.boundaries) >= MAX_BOUNDARIES:
+                self.boundaries.clear()
+            last = rows[-1]
+            self.boundaries[page] = (last[self.sort_column + 1] if self.sort_column >= 0 else last[0], last[0])
+        self.pages[page] = rows
+        if len(self.pages) > self.cache_pages:
+            self.pages.popitem(last=False)
+        return rows
+
+    def stored_row(self, row):
+        """Returns the cached [rowid, values...] list for a row, reading its page if necessary"""
+
+        page, offset = divmod(row, self.page_size)
+        rows = self.pages.get(page)
+        if rows is None:
+            rows = self.load_page(page)
+        else:
+            self.pages.move_to_end(page)
+        return rows[offset]
+
+    def rowid(self, row):
+        """Returns the SQLite rowid of a row"""
+
+        return self.stored_row(row)[0]
+
+    def row_count(self):
+        """Returns the number of rows the current query presents, counted once per query"""
+
+        if self.count is None:
+            conditions = " WHERE " + self.where if self.where else ""
+            self.count = self.connection().execute("SELECT COUNT(*) FROM {}{}".format(quote_name(self.table),
+                                                                                      conditions)).fetchone()[0]
+        return self.count
+
+    def column_count(self):
+        """Returns the number of columns held"""
+
+        return len(self.column_names)
+
+    def value(self, row, column):
+        """Returns the stored value of a single cell"""
+
+        value = self.stored_row(row)[column + 1]
+        decode = self.decoders[column]
+        return value if decode is None or value is None else decode(value)
+
+    def set_value(self, row, column, value):
+        """
+        Writes the value of a single cell to the table, casting it to the column type. Raises ValueError or TypeError
+        if the value cannot be cast. Call commit() afterwards. The row keeps its place until the query is set again,
+        even if the new value no longer matches the query's filter or sort order.
+        """
+
+        cast = self.casts[column]
+        if cast is not None:
+            value = cast(value)
+        stored = self.stored_row(row)
+        if column == self.sort_column:
+            self.boundaries.clear()  # Sort keys read for keyset queries may no longer hold
+        self.connection().execute("UPDATE {} SET {} = ? WHERE rowid = ?".format(
+            quote_name(self.table), quote_name(self.column_names[column])), (value, stored[0]))
+        stored[column + 1] = value
+
+    def commit(self):
+        """Commits changes made through the calling thread's connection"""
+
+        self.connection().commit()
+
+    def read_columns(self, rows, columns):
+        """
+        Returns, for each of the given columns, a list of its values in the given rows. Each run of consecutive rows
+        is read with one query, bypassing the page cache, so this can be called from any thread.
+        """
+
+        connection = self.connection()
+        result = [[] for _ in columns]
+        for first, last in row_ranges(rows):
+            records = self.query_rows(first, last - first + 1, connection)
+            for values, column in zip(result, columns):
+                decode = self.decoders[column]
+                values.extend(record[column + 1] if decode is None or record[column + 1] is None
+                              else decode(record[column + 1]) for record in records)
+        return result
+
+    def column_values(self, column):
+        """Returns a list holding every value of a column in the current query, in row order (reads the whole column)"""
+
+        values = [record[column + 1] for record in self.connection().execute(self.select())]
+        decode = self.decoders[column]
+        return values if decode is None else [value if value is None else decode(value) for value in values]
+
+    def append_rows(self, rows):
+        """Inserts rows (any iterable of row sequences) into the table and commits. The sort decides their place"""
+
+        statement = "INSERT INTO {} ({}) VALUES ({})".format(quote_name(self.table),
+                                                            ", ".join(map(quote_name, self.column_names)),
+                                                            ", ".join("?" * len(self.column_names)))
+        casts = self.casts
+        self.connection().executemany(statement, ([value if cast is None else cast(value)
+                                                   for cast, value in zip(casts, row)] for row in rows))
+        self.commit()
+        self.clear_cache()
+
+    def insert_rows(self, position, rows):
+        """Inserts rows into the table. Their place follows from the query's sort order, so position is unused"""
+
+        self.append_rows(rows)
+
+    def remove_rows(self, position, count):
+        """Deletes count rows starting at row number position from the table"""
+
+        self.discard_rows(range(position, position + count))
+
+    def discard_rows(self, rows):
+        """Deletes any set of rows from the table and commits"""
+
+        rowids = [self.rowid(row) for row in rows]
+        if rowids:
+            self.connection().execute("DELETE FROM {} WHERE rowid IN ({})".format(
+                quote_name(self.table), ", ".join(map(str, rowids))))
+            self.commit()
+        self.clear_cache()
+
+    def sample(self, count=SAMPLE_SIZE):
+        """Returns a list holding, for each column, its values in the first count rows of the table"""
+
+        records = self.connection().execute("SELECT {} FROM {} LIMIT ?".format(
+            ", ".join(map(quote_name, self.column_names)), quote_name(self.table)), (count,)).fetchall()
+        return [list(values) for values in zip(*records)] or [[] for _ in self.column_names]
+
+
+class SqliteTableModel(TableModel):
+    pushdown = True  # ProxyModel passes filters, sorts and removed rows to set_query() instead of applying them itself
+
+    def __init__(self, path, table=None, info=None, page_size=PAGE_SIZE, cache_pages=CACHE_PAGES):
+        """
+        TableModel whose rows stay in a SQLite table (SqliteStore) and are read a page at a time as the view shows
+        them, for tables too large to hold in memory. A ProxyModel over this model hands its filter conditions,
+        removed rows and sorts to set_query(), which turns them into the WHERE and ORDER BY clauses of the query the
+        model presents, so rows are never filtered or sorted in Python. A text search set with
+        ProxyModel.set_search() is handed over the same way. Changing the query resets the model.
+
+        Editing cells (setData(), set_cells()) updates the table and commits. insert_rows() and remove_rows() change
+        the table and then reset the model, since SQLite decides where new rows appear. Call refresh() if the
+        database is changed by anything else.
+
+        :param path: str, path of the database file
+        :param table: str, name of the table, or None for the first table in the database
+        :param info: dictionary of column information as for TableModel, or None to infer it from the first rows
+        :param page_size: int, rows read by each query
+        :param cache_pages: int, number of pages kept in memory
+        """
+
+        store = SqliteStore(path, table, page_size, cache_pages)
+        columns = store.column_names
+        if info is None:
+            sample = store.sample()
+            types = [infer_value_type([value for value in values if value is not None]) for values in sample]
+            info = make_info(columns, types, sample)
+        store.set_types([info[column]["Type"] for column in columns])
+        super().__init__(columns, store, info)
+
+    def set_query(self, filter_conditions=None, excluded=(), sort_column=-1, descending=False, search=None):
+        """
+        Presents the rows matching filter conditions and a text search, in sorted order, resetting the model. Raises
+        re.error, without changing the query, for a search with an invalid regular expression.
+
+        :param filter_conditions: dict, column name -> set of values to be included
+        :param excluded: iterable of rowids to leave out
+        :param sort_column: int, column number to sort by, or -1 for rowid order
+        :param descending: bool, True to sort from largest to smallest
+        :param search: (query, mode, list of column numbers) of a text search as for ProxyModel.set_search(), or None
+        """
+
+        conditions = {self.columns.index(column): values for column, values in (filter_conditions or {}).items()}
+        if search is not None:
+            compile_query(search[0], search[1])  # Raises re.error before the reset starts
+        self.beginResetModel()
+        self.store.set_query(conditions, excluded, sort_column, descending, search)
+        self.distinct_indexes = {}
+        self.endResetModel()
+
+    def refresh(self):
+        """Re-reads the table after it has been changed outside the model"""
+
+        self.beginResetModel()
+        self.store.clear_cache()
+        self.distinct_indexes = {}
+        self.endResetModel()
+
+    def setData(self, index, value, role=Qt.EditRole):
+        """Writes an edited cell to the table and commits. Reimplemented from TableModel"""
+
+        changed = super().setData(index, value, role)
+        if changed:
+            self.store.commit()
+        return changed
+
+    def set_cells(self, changes):
+        """Writes many cells to the table in one transaction. Reimplemented from TableModel"""
+
+        applied = super().set_cells(changes)
+        self.store.commit()
+        return applied
+
+    def insert_rows(self, position, rows):
+        """Inserts rows into the table and resets the model. Reimplemented from TableModel"""
+
+        self.beginResetModel()
+        self.store.append_rows(rows)
+        self.distinct_indexes = {}
+        self.endResetModel()
+
+    def remove_rows(self, rows):
+        """Deletes rows from the table and resets the model. Reimplemented from TableModel"""
+
+        self.beginResetModel()
+        self.store.discard_rows(sorted(set(rows)))
+        self.distinct_indexes = {}
+        self.rows_discarded.emit(None)
+        self.endResetModel()
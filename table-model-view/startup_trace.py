@@ -0,0 +1,224 @@
+#!/usr/bin/env python3
+#
+#   startup_trace.py
+#   Opt-in tracer recording where program startup time goes, written as a JSON trace (flame chart) report
+#   Using Python 3.6 and PySide2 v.5.12
+#   Each template directory that uses this module holds an identical copy, so that every template runs on its own
+#
+#   Copyright (C) 2019 Robert Parker
+#
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with this program. If not, see <https://www.gnu.org/licenses/>.
+
+
+import os
+import sys
+import json
+import time
+import atexit
+import builtins
+import threading
+from functools import wraps
+from contextlib import contextmanager
+
+FLAG = "--trace-startup"  # Command line flag, optionally followed by =<report path>
+ENVIRONMENT_VARIABLE = "STARTUP_TRACE"  # Set to the report path to trace without the flag
+DEFAULT_PATH = "startup_trace.json"
+SLOWEST_IMPORTS = 25  # Imports listed in the report summary
+
+
+class StartupTracer:
+    def __init__(self, path=None, quit_after=False):
+        """
+        Records timed spans of program startup: every module import, and any step wrapped in span() or traced by
+        trace_methods(), nested as they happen. The report is a Chrome trace event file, which chrome://tracing,
+        Perfetto or speedscope show as a flame chart, with a summary of the top-level steps and the slowest imports
+        under "otherData". A tracer created without a path does nothing, so run scripts can use one unconditionally.
+
+        :param path: str, path of the JSON report to write, or None to leave tracing off
+        :param quit_after: bool, True to quit the application once the report is written, e.g. for benchmarks
+        """
+
+        self.path = path
+        self.enabled = path is not None
+        self.quit_after = quit_after
+        self.started = time.time()  # Wall clock time the tracer was created, to compare with other processes
+        self.origin = time.perf_counter()
+        self.events = []
+        self.stacks = threading.local()  # Per thread list of the child time of each open span
+        self.original_import = None
+        self.traced_import = None
+        self.shown = 0  # Time finish_on_paint() was called
+        self.watcher = None
+        self.written = False
+        if self.enabled:
+            self.trace_imports()
+            atexit.register(self.write)  # In case the window is never painted
+
+    @classmethod
+    def from_arguments(cls, argv):
+        """
+        Returns a tracer writing to the path given by --trace-startup=<path> (or startup_trace.json for a bare
+        --trace-startup) or by the STARTUP_TRACE environment variable, or a disabled tracer if neither is set. The
+        flag is removed from argv so that QApplication does not see it.
+
+        :param argv: list of command line arguments, e.g. sys.argv
+        """
+
+        path = os.environ.get(ENVIRONMENT_VARIABLE) or None
+        for argument in list(argv[1:]):
+            if argument == FLAG or argument.startswith(FLAG + "="):
+                argv.remove(argument)
+                path = argument[len(FLAG) + 1:] or DEFAULT_PATH
+        return cls(path)
+
+    def now(self):
+        """Returns microseconds since the tracer was created"""
+
+        return (time.perf_counter() - self.origin) * 1e6
+
+    @contextmanager
+    def span(self, name, category="startup"):
+        """Context manager recording the time taken by the code inside it as a span named name"""
+
+        if not self.enabled:
+            yield
+            return
+        stack = self.stack()
+        start = self.now()
+        stack.append(0)
+        try:
+            yield
+        finally:
+            children = stack.pop()
+            self.add_span(name, category, start, self.now() - start, children)
+
+    def stack(self):
+        """Returns the calling thread's stack of open spans"""
+
+        stack = getattr(self.stacks, "spans", None)
+        if stack is None:
+            stack = self.stacks.spans = []
+        return stack
+
+    def add_span(self, name, category, start, duration, children=0):
+        """Records a finished span, and adds its duration to the child time of the span enclosing it"""
+
+        stack = self.stack()
+        if stack:
+            stack[-1] += duration
+        self.events.append({"name": name, "cat": category, "ph": "X", "ts": round(start), "dur": round(duration),
+                            "pid": os.getpid(), "tid": threading.get_ident(),
+                            "args": {"self_ms": round((duration - children) / 1000, 3), "depth": len(stack)}})
+
+    def trace_imports(self):
+        """Replaces the import statement's function with one recording a span for each module not yet imported"""
+
+        original = self.original_import = builtins.__import__
+        modules = sys.modules
+
+        def traced_import(name, globals=None, locals=None, fromlist=(), level=0):
+            if level or name in modules:
+                return original(name, globals, locals, fromlist, level)
+            with self.span(name, "import"):
+                return original(name, globals, locals, fromlist, level)
+
+        builtins.__import__ = self.traced_import = traced_import
+
+    def trace_methods(self, cls, names, category="startup"):
+        """
+        Wraps methods of a class so that every call records a span named "<class>.<method>", e.g.
+        tracer.trace_methods(TableView, ["set_widths", "fit_rows"]). Does nothing when tracing is off.
+
+        :param cls: class whose methods to wrap
+        :param names: list of method names (str)
+        :param category: str, category of the spans
+        """
+
+        if not self.enabled:
+            return
+        for name in names:
+            method = getattr(cls, name)
+            setattr(cls, name, self.traced(method, "{}.{}".format(cls.__name__, name), category))
+
+    def traced(self, function, name, category):
+        """Returns function wrapped to record a span for every call"""
+
+        @wraps(function)
+        def wrapper(*args, **kwargs):
+            with self.span(name, category):
+                return function(*args, **kwargs)
+        return wrapper
+
+    def finish_on_paint(self, widget):
+        """
+        Records the first paint of a widget (usually the main window, just after show()) and writes the report once
+        it is done. The event loop must be running for the paint to happen.
+        """
+
+        if not self.enabled:
+            return
+        from PySide2.QtCore import QObject, QEvent, QTimer
+
+        tracer = self
+
+        class PaintWatcher(QObject):
+            def eventFilter(self, watched, event):
+                """Notes the first paint event and writes the report on the next pass of the event loop"""
+
+                if event.type() == QEvent.Paint:
+                    watched.removeEventFilter(self)
+                    start = tracer.now()
+                    tracer.add_span("show until first paint", "startup", tracer.shown, start - tracer.shown)
+                    QTimer.singleShot(0, lambda: tracer.add_span("first paint", "startup", start, tracer.now() - start))
+                    QTimer.singleShot(0, tracer.write)
+                return False
+
+        self.shown = self.now()
+        self.watcher = PaintWatcher(widget)
+        widget.installEventFilter(self.watcher)
+
+    def summary(self):
+        """
+        Returns the total time, the top-level spans and the slowest imports (with their own time, leaving out the
+        imports they made), in milliseconds
+        """
+
+        if not self.events:
+            return {"total_ms": 0, "steps": [], "slowest_imports": []}
+        events = sorted(self.events, key=lambda event: event["ts"])
+        end = max(event["ts"] + event["dur"] for event in events)
+        imports = sorted((event for event in events if event["cat"] == "import"), key=lambda event: -event["dur"])
+        return {"total_ms": round(end / 1000, 3),
+                "steps": [[event["name"], round(event["dur"] / 1000, 3)] for event in events
+                          if event["args"]["depth"] == 0],
+                "slowest_imports": [[event["name"], round(event["dur"] / 1000, 3), event["args"]["self_ms"]]
+                                    for event in imports[:SLOWEST_IMPORTS]]}
+
+    def write(self):
+        """Writes the report (once) and stops tracing imports"""
+
+        if not self.enabled or self.written:
+            return
+        self.written = True
+        if builtins.__import__ is self.traced_import:
+            builtins.__import__ = self.original_import
+        report = {"traceEvents": sorted(self.events, key=lambda event: event["ts"]), "displayTimeUnit": "ms",
+                  "otherData": dict(self.summary(), started=self.started, argv=sys.argv,
+                                    python=sys.version.split()[0])}
+        with open(self.path, "w") as file:
+            json.dump(report, file, indent=1)
+        sys.stderr.write("Startup trace written to {} ({:.0f} ms)\n".format(self.path, report["otherData"]["total_ms"]))
+        if self.quit_after:
+            from PySide2.QtCore import QCoreApplication
+            QCoreApplication.quit()
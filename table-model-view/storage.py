@@ -0,0 +1,355 @@
+#!/usr/bin/env python3
+#
+#   storage.py
+#   Row and column storage backends used by TableModel to hold table data
+#   Using Python 3.6 and PySide2 v.5.12
+#
+#   Copyright (C) 2019 Robert Parker
+#
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with this program. If not, see <https://www.gnu.org/licenses/>.
+
+
+from array import array
+from itertools import compress
+
+TYPECODES = {"int": "q", "float": "d", "bool": "b"}  # Column types held in typed arrays, anything else uses a list
+CASTS = {"int": int, "float": float, "bool": bool}
+
+
+def sort_permutation(worker, keys, descending=False):
+    """
+    Returns the stored rows as an array ordered by their sort keys, using one sorted() pass. Equal keys keep their
+    stored order in either direction. Written to run on a Worker (workers.py), so it takes the worker as its first
+    argument.
+
+    :param worker: Worker object running the sort, or None when called directly
+    :param keys: sequence of sort keys, one per stored row
+    :param descending: bool, True to sort from largest to smallest
+    """
+
+    return array("q", sorted(range(len(keys)), key=keys.__getitem__, reverse=descending))
+
+
+class Store:
+    """
+    Base class for TableModel storage. Rows are kept, and numbered, in the order they were stored. Sorting never
+    reorders a store: each ProxyModel keeps its own sorted order of the row numbers, so a row number keeps referring
+    to the same record however the views over the model are sorted.
+    """
+
+    typed = False
+
+    def rows_view(self):
+        """Returns a RowsView which reads and writes the table as row[column]"""
+
+        return RowsView(self)
+
+    def insert_rows(self, position, rows):
+        """
+        Inserts rows (any iterable of row sequences) so that the first of them becomes row number position
+
+        :param position: int, row number the first new row takes
+        :param rows: iterable of rows organized as row[column]
+        """
+
+        rows = rows if isinstance(rows, (list, tuple)) else list(rows)
+        if position < self.row_count():
+            self.insert_stored(position, rows)
+        else:
+            self.append_rows(rows)
+
+    def remove_rows(self, position, count):
+        """
+        Removes count rows starting at row number position
+
+        :param position: int, first row to remove
+        :param count: int, number of rows to remove
+        """
+
+        self.remove_stored(position, count)
+
+    def discard_rows(self, rows):
+        """
+        Removes any set of rows, contiguous or not, in one pass over the storage. Rows after those removed keep their
+        relative order.
+
+        :param rows: iterable of row numbers
+        """
+
+        keep = bytearray(b"\x01") * self.row_count()
+        for row in rows:
+            keep[row] = 0
+        self.keep_stored(keep)
+
+
+class RowStore(Store):
+    def __init__(self, dataset):
+        """
+        Default storage for TableModel. Holds the table data exactly as given, as a list of lists organized as
+        row[column], so the dataset list passed in stays shared with the caller.
+
+        :param dataset: list of lists containing table data, organized as row[column]
+        """
+
+        self.rows = dataset
+        self.typed = False  # Values are stored as given and must be cast by the model
+
+    def row_count(self):
+        """Returns the number of rows held"""
+
+        return len(self.rows)
+
+    def column_count(self):
+        """Returns the number of columns held"""
+
+        return len(self.rows[0]) if self.rows else 0
+
+    def value(self, row, column):
+        """Returns the stored value of a single cell"""
+
+        return self.rows[row][column]
+
+    def set_value(self, row, column, value):
+        """Replaces the stored value of a single cell"""
+
+        self.rows[row][column] = value
+
+    def column_values(self, column):
+        """Returns a sequence holding every value of a column, in row order"""
+
+        return [row[column] for row in self.rows]
+
+    def read_columns(self, rows, columns):
+        """
+        Returns, for each of the given columns, a list of its values in the given rows
+
+        :param rows: sequence of row numbers
+        :param columns: sequence of column numbers
+        """
+
+        stored = list(map(self.rows.__getitem__, rows))
+        return [[row[column] for row in stored] for column in columns]
+
+    def append_rows(self, rows):
+        """Adds rows (any iterable of row sequences) to the end of the table"""
+
+        self.rows.extend(list(row) for row in rows)
+
+    def insert_stored(self, position, rows):
+        """Inserts rows into storage at a stored row number"""
+
+        self.rows[position:position] = [list(row) for row in rows]
+
+    def remove_stored(self, position, count):
+        """Removes a block of stored rows"""
+
+        del self.rows[position:position + count]
+
+    def keep_stored(self, keep):
+        """Removes every stored row whose entry in the keep mask is 0"""
+
+        self.rows[:] = compress(self.rows, keep)
+
+    def rows_view(self):
+        """Returns the table as a list of row lists. For this store it is the dataset list itself."""
+
+        return self.rows
+
+
+class ColumnStore(Store):
+    def __init__(self, columns, info, dataset=()):
+        """
+        Columnar storage for TableModel. Each 'int', 'float' and 'bool' column (by its info 'Type') is held in a typed
+        array ('q', 'd' and 'b' respectively) and every other column in a plain list, which keeps large numeric tables
+        far smaller in memory than a list of row lists and stores values already cast to their column type. Use
+        rows_view() to read or edit the data as row[column] for code written against the row-of-lists dataset.
+
+        :param columns: list of column names (str)
+        :param info: dictionary of column information, each column name must have a 'Type' entry
+        :param dataset: iterable of rows organized as row[column], copied into the columns
+        """
+
+        self.types = [info[column]["Type"] for column in columns]
+        self.columns = [array(TYPECODES[kind]) if kind in TYPECODES else [] for kind in self.types]
+        self.casts = [CASTS.get(kind) for kind in self.types]
+        self.decoders = [bool if kind == "bool" else None for kind in self.types]  # bool columns are stored as 0/1
+        self.typed = True
+        self.append_rows(dataset)
+
+    @classmethod
+    def from_columns(cls, columns, info, values):
+        """
+        Creates a ColumnStore from one sequence of values per column, already cast to the column types, without
+        going through rows. Arrays of the right type are used as they are, without copying.
+
+        :param columns: list of column names (str)
+        :param info: dictionary of column information, each column name must have a 'Type' entry
+        :param values: list holding a sequence of values for each column, all of the same length
+        """
+
+        store = cls(columns, info)
+        for i, (kind, column_values) in enumerate(zip(store.types, values)):
+            if kind not in TYPECODES:
+                store.columns[i] = column_values if isinstance(column_values, list) else list(column_values)
+            elif isinstance(column_values, array) and column_values.typecode == TYPECODES[kind]:
+                store.columns[i] = column_values
+            else:
+                store.columns[i] = array(TYPECODES[kind], column_values)
+        return store
+
+    def row_count(self):
+        """Returns the number of rows held"""
+
+        return len(self.columns[0]) if self.columns else 0
+
+    def column_count(self):
+        """Returns the number of columns held"""
+
+        return len(self.columns)
+
+    def value(self, row, column):
+        """Returns the stored value of a single cell, already cast to the column type"""
+
+        decode = self.decoders[column]
+        if decode is None:
+            return self.columns[column][row]
+        return decode(self.columns[column][row])
+
+    def set_value(self, row, column, value):
+        """
+        Replaces the stored value of a single cell, casting it to the column type. Raises ValueError or TypeError if
+        the value cannot be cast.
+        """
+
+        cast = self.casts[column]
+        self.columns[column][row] = value if cast is None else cast(value)
+
+    def column_values(self, column):
+        """
+        Returns the buffer holding a column, in row order, itself rather than a copy. Note bool columns hold 0 and 1
+        rather than bools.
+        """
+
+        return self.columns[column]
+
+    def read_columns(self, rows, columns):
+        """
+        Returns, for each of the given columns, a list of its values in the given rows, already cast to the column type
+
+        :param rows: sequence of row numbers
+        :param columns: sequence of column numbers
+        """
+
+        result = []
+        for column in columns:
+            values = list(map(self.columns[column].__getitem__, rows))
+            decode = self.decoders[column]
+            result.append(values if decode is None else list(map(decode, values)))
+        return result
+
+    def append_rows(self, rows):
+        """Adds rows (any iterable of row sequences) to the end of the table, casting values to the column types"""
+
+        rows = rows if isinstance(rows, (list, tuple)) else list(rows)
+        if not rows:
+            return
+        for column, cast, values in zip(self.columns, self.casts, zip(*rows)):
+            if cast is None:
+                column.extend(values)
+            else:
+                column.extend(map(cast, values))
+
+    def insert_stored(self, position, rows):
+        """Inserts rows into storage at a stored row number, casting values to the column types"""
+
+        for column, cast, values in zip(self.columns, self.casts, zip(*rows)):
+            if cast is not None:
+                values = map(cast, values)
+            column[position:position] = array(column.typecode, values) if isinstance(column, array) else list(values)
+
+    def remove_stored(self, position, count):
+        """Removes a block of stored rows"""
+
+        for column in self.columns:
+            del column[position:position + count]
+
+    def keep_stored(self, keep):
+        """Removes every stored row whose entry in the keep mask is 0"""
+
+        for i, column in enumerate(self.columns):
+            kept = compress(column, keep)
+            self.columns[i] = array(column.typecode, kept) if isinstance(column, array) else list(kept)
+
+
+class RowsView:
+    def __init__(self, store):
+        """
+        Compatibility adapter that presents a store as a list of rows, so that dataset[row][column] reads and writes
+        go to the underlying storage, in stored order. Rows are produced on demand; nothing is copied.
+
+        :param store: RowStore or ColumnStore object
+        """
+
+        self.store = store
+
+    def __len__(self):
+        return self.store.row_count()
+
+    def __getitem__(self, row):
+        if isinstance(row, slice):
+            return [RowView(self.store, i) for i in range(*row.indices(len(self)))]
+        if row < 0:
+            row += len(self)
+        if not 0 <= row < len(self):
+            raise IndexError("row index out of range")
+        return RowView(self.store, row)
+
+    def __iter__(self):
+        for row in range(len(self)):
+            yield RowView(self.store, row)
+
+    def append(self, row):
+        self.store.append_rows([row])
+
+    def extend(self, rows):
+        self.store.append_rows(rows)
+
+
+class RowView:
+    def __init__(self, store, row):
+        """A single row of a store, indexed by column number"""
+
+        self.store = store
+        self.row = row
+
+    def __len__(self):
+        return self.store.column_count()
+
+    def __getitem__(self, column):
+        if isinstance(column, slice):
+            return [self.store.value(self.row, i) for i in range(*column.indices(len(self)))]
+        return self.store.value(self.row, column)
+
+    def __setitem__(self, column, value):
+        self.store.set_value(self.row, column, value)
+
+    def __iter__(self):
+        for column in range(len(self)):
+            yield self.store.value(self.row, column)
+
+    def __eq__(self, other):
+        return list(self) == list(other)
+
+    def __repr__(self):
+        return repr(list(self))
@@ -20,11 +20,51 @@
 #   along with this program. If not, see <https://www.gnu.org/licenses/>.
 
 
-from PySide2.QtCore import QAbstractTableModel, Qt, QSortFilterProxyModel
+from bisect import bisect_left, bisect_right
+from collections import Counter
+from itertools import islice, compress
+from operator import itemgetter
+from array import array
+from PySide2.QtCore import QAbstractTableModel, QAbstractProxyModel, QObject, Qt, QModelIndex, Signal
+from storage import CASTS, Store, RowStore, ColumnStore, sort_permutation
+from filters import FilterEngine, DistinctIndex, and_masks, subtract_masks, mask_rows, snapshot_mask
+from search import SearchIndex, compile_query
+from workers import Worker
+
+ALIGNMENTS = {"left": Qt.AlignLeft, "center": Qt.AlignCenter, "right": Qt.AlignRight}
+DISPLAY_CASTS = {kind: cast for kind, cast in CASTS.items() if kind != "bool"}  # Bool cells are shown as text
+MAX_REFILTER_RANGES = 256  # Above this many changed row ranges ProxyModel lays out the whole table again instead
+SORT_CACHE_SIZE = 4  # Number of sorted row orders ProxyModel keeps for re-use
+MAX_CHANGE_RANGES = 256  # Above this many row ranges, bulk edits signal one range (or a reset) instead
+VALUE_ROLE = Qt.UserRole  # data() role returning a cell's stored value unconverted, e.g. for delegates
+HISTORY_ROLE = Qt.UserRole + 1  # data() role returning a cell's numeric history, see TableModel.history()
+
+
+def row_ranges(rows, limit=None):
+    """
+    Returns a list of (first, last) ranges, inclusive, covering runs of consecutive row numbers. With a limit, stops
+    once the list holds more than limit ranges, for callers which only need the ranges if there are few of them.
+
+    :param rows: sorted iterable of unique row numbers
+    :param limit: int, or None for no limit
+    """
+
+    ranges = []
+    for row in rows:
+        if ranges and row == ranges[-1][1] + 1:
+            ranges[-1] = (ranges[-1][0], row)
+        elif limit is not None and len(ranges) > limit:
+            break
+        else:
+            ranges.append((row, row))
+    return ranges
 
 
 class TableModel(QAbstractTableModel):
-    def __init__(self, columns, dataset, info):
+    rows_discarded = Signal(object)  # Emitted during a model reset with the rows removed, or None if all were replaced
+    pushdown = False  # True if the model filters and sorts its own rows through set_query() (see sqlite_model.py)
+
+    def __init__(self, columns, dataset, info, columnar=False, batch_size=1000):
         """
         Subclass of the QAbstractTableModel. This class holdes the table data, list of columns, and column information,
         as well as the background methods needed to communicate display information to the table view object.
@@ -32,15 +72,93 @@ class TableModel(QAbstractTableModel):
         customize model behaviour.
 
         :param columns: list of column names (str)
-        :param dataset: list of lists containing table data, organized as row[column]
+        :param dataset: list of lists containing table data, organized as row[column]. Alternatively pass an iterator or
+        generator of rows (e.g. a csv.reader over an open file) to stream the data: only the first batch is read when
+        the model is created and further batches are read by fetchMore() as the view scrolls down. A chunked reader
+        can be streamed by flattening it first with itertools.chain.from_iterable(). A filled RowStore or ColumnStore
+        (storage.py), e.g. from one of the loaders in loaders.py, may also be passed and is used as it is.
         :param info: dictionary containing column names matching those in columns, with keys 'Label' (str), 'Width'
         (int), 'Type' (str), 'Alignment' (str), and any other column-specific info to use in model or view methods
+        :param columnar: bool, if True the data are copied into a ColumnStore holding one typed array per column,
+        which uses much less memory for large numeric tables. self.dataset then becomes a RowsView adapter, so
+        dataset[row][column] still works, but reading through self.store.value(row, column) is faster.
+        :param batch_size: int, number of rows read by each fetchMore() call when streaming
         """
 
         super().__init__()
         self.columns = columns
-        self.dataset = dataset
         self.info = info
+        self.batch_size = batch_size
+        self.pending_rows = None  # Iterator holding rows not yet read when streaming, None once all rows are loaded
+        self.store = None
+        self.distinct_indexes = {}  # Column number -> DistinctIndex, built by distinct_index()
+        self.load_dataset(dataset, columnar)
+        self.updates = None  # UpdateQueue created by start_live_updates()
+        self.changed_rows = None  # Sorted list of the rows set_cells() changed, while it emits dataChanged
+        self.converters = []  # Per-column lookup tables built from columns and info by compile_columns()
+        self.alignments = []
+        self.header_labels = []
+        self.compile_columns()
+        if self.pending_rows is not None:
+            self.fetchMore(QModelIndex())
+
+    def load_dataset(self, dataset, columnar):
+        """
+        Creates the store for a dataset list, keeps an iterator of rows to be streamed by fetchMore(), or uses a store
+        passed in as it is
+        """
+
+        self.pending_rows = None
+        self.distinct_indexes = {}
+        if isinstance(dataset, Store):
+            self.store = dataset
+            return
+        if not hasattr(dataset, "__len__"):
+            self.pending_rows = iter(dataset)
+            dataset = []
+        self.store = ColumnStore(self.columns, self.info, dataset) if columnar else RowStore(dataset)
+
+    @property
+    def dataset(self):
+        """The table as a list of rows organized as row[column], in stored order"""
+
+        return self.store.rows_view()
+
+    def compile_columns(self):
+        """
+        Reads the columns list and info dictionary once and builds the per-column tables used by data() and
+        headerData(): a converter function (None where values need no casting), a Qt alignment flag, and a header
+        label. Call this (or update_columns()) after changing columns or info, otherwise the model keeps using the
+        previous settings.
+        """
+
+        self.converters = []
+        for column_name in self.columns:
+            column_type = self.info[column_name]["Type"]
+            if column_type in DISPLAY_CASTS:
+                self.converters.append(None if self.store.typed else DISPLAY_CASTS[column_type])
+            else:
+                self.converters.append(str)
+        self.alignments = [ALIGNMENTS.get(self.info[column]["Alignment"], Qt.AlignLeft) for column in self.columns]
+        self.header_labels = [self.info[column]["Label"] for column in self.columns]
+
+    def update_columns(self, columns=None, info=None):
+        """
+        Replaces the columns list and/or info dictionary, recompiles the per-column tables, and tells any attached
+        views to refresh
+
+        :param columns: list of column names (str), or None to keep the current list
+        :param info: dictionary of column information, or None to keep the current dictionary
+        """
+
+        self.beginResetModel()
+        if columns is not None:
+            self.columns = columns
+        if info is not None:
+            self.info = info
+        self.distinct_indexes = {}
+        self.compile_columns()
+        self.endResetModel()
 
     def data(self, index, role):
         """
@@ -49,27 +167,35 @@ class TableModel(QAbstractTableModel):
         :param index: a QModelIndex object referring to an individual table cell
         :param role: a Qt role to specify what sort of information is to be returned. Roles include Qt.DisplayRole,
         Qt.EditRole, Qt.TextAlignmentRole, Qt.DecorationRole, Qt.ToolTipRole, Qt.StatusTipRole, Qt.FontRole,
-        Qt.BackgroundRole
+        Qt.BackgroundRole, VALUE_ROLE for the stored value as it is, or HISTORY_ROLE for history()
         """
 
-        row = index.row()
         column = index.column()
-        column_name = self.columns[column]
-
-        if role in [Qt.DisplayRole, Qt.EditRole]:
-            if self.info[column_name]["Type"] == "int":
-                return int(self.dataset[row][column])
-            elif self.info[column_name]["Type"] == "float":
-                return float(self.dataset[row][column])
-            return str(self.dataset[row][column])
+
+        if role == Qt.DisplayRole or role == Qt.EditRole:
+            value = self.store.value(index.row(), column)
+            converter = self.converters[column]
+            return value if converter is None else converter(value)
+        elif role == VALUE_ROLE:
+            return self.store.value(index.row(), column)
+        elif role == HISTORY_ROLE:
+            return self.history(index.row(), column)
         elif role == Qt.TextAlignmentRole:
-            if self.info[column_name]["Alignment"] == "right":
-                return Qt.AlignRight
-            elif self.info[column_name]["Alignment"] == "center":
-                return Qt.AlignCenter
-            return Qt.AlignLeft
+            return self.alignments[column]
         return None
 
+    def history(self, row, column):
+        """
+        Returns the sequence of numbers a SparklineDelegate (delegates.py) draws for a cell. By default the cell's
+        stored value is taken to be the sequence, e.g. a list of recent prices held in the cell. Reimplement this to
+        read histories kept elsewhere.
+
+        :param row: int, row number
+        :param column: int, column number
+        """
+
+        return self.store.value(row, column)
+
     def setData(self, index, value, role=Qt.EditRole):
         """
         Relays changes made via the table view to the underlying dataset. Reimplemented frrom QAbstractTableModel
@@ -82,10 +208,138 @@ class TableModel(QAbstractTableModel):
         if role == Qt.EditRole:
             row = index.row()
             column = index.column()
-            self.dataset[row][column] = value
+            distinct = self.distinct_indexes.get(column)
+            previous = None if distinct is None else self.store.value(row, column)
+            try:
+                self.store.set_value(row, column, value)
+            except (TypeError, ValueError):  # Value could not be cast to the type of a typed column
+                return False
+            if distinct is not None:
+                distinct.remove([previous])
+                distinct.add([self.store.value(row, column)])
+            self.dataChanged.emit(index, index, [Qt.DisplayRole, Qt.EditRole])
             return True
         return False
 
+    def set_cells(self, changes):
+        """
+        Sets many cells at once. Use this rather than setData() in a loop: dataChanged is emitted once for each run of
+        consecutive changed rows, spanning the changed columns, instead of once per cell, and once for the whole
+        changed area if the rows are very scattered. Returns the number of cells set; values which cannot be cast to
+        the type of a typed column are skipped. While the signals are emitted, changed_rows holds the sorted changed
+        rows, so that a slot given one wide range can visit only the rows that changed.
+
+        :param changes: iterable of (row, column, value) triples. Rows are model (stored) row numbers, which do not
+        change when a ProxyModel sorts or filters; use ProxyModel.source_rows() or mapToSource() to convert view rows.
+        """
+
+        set_value = self.store.set_value
+        get_value = self.store.value
+        indexes = self.distinct_indexes
+        rows = set()
+        columns = set()
+        applied = 0
+        for row, column, value in changes:
+            distinct = indexes.get(column) if indexes else None
+            previous = None if distinct is None else get_value(row, column)
+            try:
+                set_value(row, column, value)
+            except (TypeError, ValueError):
+                continue
+            if distinct is not None:
+                distinct.remove([previous])
+                distinct.add([get_value(row, column)])
+            applied += 1
+            rows.add(row)
+            columns.add(column)
+        if rows:
+            self.changed_rows = sorted(rows)
+            ranges = row_ranges(self.changed_rows)
+            if len(ranges) > MAX_CHANGE_RANGES:
+                ranges = [(ranges[0][0], ranges[-1][1])]
+            first_column, last_column = min(columns), max(columns)
+            try:
+                for first, last in ranges:
+                    self.dataChanged.emit(self.index(first, first_column), self.index(last, last_column), [])
+            finally:
+                self.changed_rows = None
+        return applied
+
+    def start_live_updates(self, interval=16):
+        """
+        Creates (on first call) and starts the model's UpdateQueue (updates.py) and returns it. Producer threads push
+        cell updates into the queue, which applies them in batches every interval milliseconds on the GUI thread.
+        Call from the GUI thread.
+
+        :param interval: int, milliseconds between batches
+        """
+
+        if self.updates is None:
+            from updates import UpdateQueue  # Imported on first use, to keep it out of startup
+            self.updates = UpdateQueue(self, interval)
+        else:
+            self.updates.set_interval(interval)
+        self.updates.start()
+        return self.updates
+
+    def insert_rows(self, position, rows):
+        """
+        Inserts rows into the table, so that the first new row becomes row number position, with one rowsInserted
+        signal for the whole block. Pass position=rowCount() to append. Rows are model (stored) row numbers, however
+        the proxies over the model are sorted; each ProxyModel places the new rows in its own order.
+
+        :param position: int, model row number for the first new row
+        :param rows: iterable of rows organized as row[column]
+        """
+
+        rows = list(rows)
+        if not rows:
+            return
+        self.beginInsertRows(QModelIndex(), position, position + len(rows) - 1)
+        self.store.insert_rows(position, rows)
+        self.count_distinct(range(position, position + len(rows)), 1)
+        self.endInsertRows()
+
+    def remove_rows(self, rows):
+        """
+        Deletes rows from the table (unlike ProxyModel.remove_row(), which only hides a row). Each run of consecutive
+        rows is removed with one rowsRemoved signal, last run first. If the rows form too many runs, they are instead
+        removed in a single pass over the storage inside a model reset, with rows_discarded reporting which rows went.
+
+        :param rows: iterable of model (stored) row numbers, not proxy rows; see ProxyModel.source_rows()
+        """
+
+        rows = sorted(set(rows))
+        ranges = row_ranges(rows)
+        self.count_distinct(rows, -1)
+        if len(ranges) > MAX_CHANGE_RANGES:
+            self.beginResetModel()
+            self.store.discard_rows(rows)
+            self.rows_discarded.emit(rows)
+            self.endResetModel()
+            return
+        for first, last in reversed(ranges):
+            self.beginRemoveRows(QModelIndex(), first, last)
+            self.store.remove_rows(first, last - first + 1)
+            self.endRemoveRows()
+
+    def replace_dataset(self, dataset):
+        """
+        Replaces every row of the table with a new dataset, keeping the columns, info and kind of storage, with one
+        model reset. As when creating the model, the dataset may be a list of row lists, an iterator of rows to
+        stream, or a store.
+
+        :param dataset: list of lists containing table data, organized as row[column], an iterator of rows, or a store
+        """
+
+        self.beginResetModel()
+        self.load_dataset(dataset, self.store.typed)
+        self.compile_columns()
+        self.rows_discarded.emit(None)
+        self.endResetModel()
+        if self.pending_rows is not None:
+            self.fetchMore(QModelIndex())
+
     def headerData(self, section, orientation, role):
         """
         Determines the data to display in each row or column header, and its general format. Reimplemented frrom
@@ -99,8 +353,7 @@ class TableModel(QAbstractTableModel):
 
         if role == Qt.DisplayRole:
             if orientation == Qt.Horizontal:
-                column_name = self.columns[section]
-                return self.info[column_name]["Label"]
+                return self.header_labels[section]
             elif orientation == Qt.Vertical:
                 pass  # Replace with any instructions to display a either row number or a particular column as header
         elif role == Qt.TextAlignmentRole:
@@ -108,10 +361,94 @@ class TableModel(QAbstractTableModel):
                 return Qt.AlignCenter
         return None
 
+    def distinct_index(self, column):
+        """
+        Returns the DistinctIndex (filters.py) of a column: the count of each distinct value, with sorted values and
+        prefix search for filter pickers. Built from the column on first use and then kept up to date by setData(),
+        set_cells(), insert_rows(), remove_rows() and fetchMore(). Cells changed directly through the store are not
+        seen; call update_columns() or replace_dataset() to start again after that.
+
+        :param column: int, column number
+        """
+
+        index = self.distinct_indexes.get(column)
+        if index is None:
+            index = self.distinct_indexes[column] = DistinctIndex(
+                self.store.read_columns(range(self.store.row_count()), [column])[0])
+        return index
+
+    def count_distinct(self, rows, sign):
+        """Adds (sign 1) or removes (sign -1) the values in the given rows from the distinct indexes built so far"""
+
+        if not self.distinct_indexes:
+            return
+        columns = list(self.distinct_indexes)
+        for column, values in zip(columns, self.store.read_columns(rows, columns)):
+            if sign > 0:
+                self.distinct_indexes[column].add(values)
+            else:
+                self.distinct_indexes[column].remove(values)
+
+    def display_columns(self, rows, columns):
+        """
+        Returns, for each of the given columns, a list of the values data() would display for the given rows. Reads
+        the storage a column at a time, so it is much faster than calling data() for each cell of a large block.
+
+        :param rows: sequence of row numbers
+        :param columns: sequence of column numbers
+        """
+
+        values = self.store.read_columns(rows, columns)
+        converters = self.converters
+        return [column_values if converters[column] is None else list(map(converters[column], column_values))
+                for column, column_values in zip(columns, values)]
+
+    def sort_keys(self, column):
+        """
+        Returns a copy of a column's values in stored order, cast to the column type, for use as sort keys
+
+        :param column: int, column number
+        """
+
+        values = self.store.column_values(column)
+        converter = self.converters[column]
+        if converter is None or self.store.typed:
+            return values[:]
+        return list(map(converter, values))
+
     def rowCount(self, parent=None):
         """Returns the number of rows in the model. Leave this."""
 
-        return len(self.dataset)
+        return self.store.row_count()
+
+    def canFetchMore(self, parent=QModelIndex()):
+        """Returns True while a streamed dataset still has rows to read. Reimplemented from QAbstractTableModel"""
+
+        return self.pending_rows is not None and not parent.isValid()
+
+    def fetchMore(self, parent=QModelIndex()):
+        """
+        Reads the next batch of rows from a streamed dataset and appends them to the model. Called by the view when
+        the user scrolls to the end of the rows loaded so far. Reimplemented from QAbstractTableModel
+        """
+
+        if not self.canFetchMore(parent):
+            return
+        rows = list(islice(self.pending_rows, self.batch_size))
+        if len(rows) < self.batch_size:
+            self.pending_rows = None
+        if rows:
+            first = self.store.row_count()
+            self.beginInsertRows(QModelIndex(), first, first + len(rows) - 1)
+            self.store.append_rows(rows)
+            self.count_distinct(range(first, first + len(rows)), 1)
+            self.endInsertRows()
+
+    def fetch_all(self):
+        """Reads every remaining row of a streamed dataset, e.g. before an operation that needs the whole table"""
+
+        while self.canFetchMore():
+            self.fetchMore()
 
     def columnCount(self, parent=None):
         """Returns the number of columns in the model. Leave this."""
@@ -128,22 +465,223 @@ class TableModel(QAbstractTableModel):
         return Qt.ItemIsEnabled | Qt.ItemIsSelectable
 
 
-class ProxyModel(QSortFilterProxyModel):
-    def __init__(self, model):
+def filter_worker(worker, values, compiled):
+    """Worker function computing a filter mask, returned with the conditions it was computed from"""
+
+    mask = snapshot_mask(worker, values, compiled)
+    return None if worker.cancelled else (mask, compiled)
+
+
+class ProxyModel(QAbstractProxyModel):
+    busy_changed = Signal(bool)  # True while background filtering or sorting is running, asynchronous mode only
+    progress = Signal(int)  # Percent complete of the running background filter
+    filter_changed = Signal()  # Emitted after a change of filters or removed rows has been applied
+
+    def __init__(self, model, use_index=True, asynchronous=False):
         """
-        Subclass of the QSortFilterProxyModel. This class allows the table view to interact with the model indirectly
-        via a middle-mas proxy that sorts or filters the table. It reimplements the filterAcceptsRow method to allow
+        Subclass of the QAbstractProxyModel. This class allows the table view to interact with the model indirectly
+        via a middle-man proxy that sorts or filters the table. It reimplements the filterAcceptsRow method to allow
         flexibility on how data are filtered, including filtering base on multiple columns. Reimplement
-        filterAcceptsRow() method as desired. Use self.sourceModel() to refer to the underlying table model. Use
-        mapToSource(index) to convert an index in the proxy model to an index in the underlying model, allowing you to
-        access the respective dataset via row and column index methods.
+        filterAcceptsRow() method as desired, and call invalidate() when the conditions it reads change. Use
+        self.sourceModel() to refer to the underlying table model. Use mapToSource(index) to convert an index in the
+        proxy model to an index in the underlying model, allowing you to access the respective dataset via row and
+        column index methods.
+
+        The proxy keeps its own array of the source rows it shows, in the order shown (proxy_rows), and a row mask of
+        the same rows (shown). Filtering and sorting never change the source model, so its row numbers keep
+        referring to the same records, and several proxies can show one model filtered and sorted differently.
+
+        Filter conditions are evaluated by a FilterEngine (filters.py) into a row mask each time they change, so
+        filterAcceptsRow() is a set and mask lookup rather than a scan of the conditions and columns. If you edit
+        filter_conditions directly, call apply_filters() afterwards.
+
+        add_filter_condition(), reset_filters() and remove_row() update the table incrementally: the mask is
+        narrowed or widened rather than rebuilt where possible, and only the proxy rows whose state changed are
+        removed or inserted, with one signal for each run of rows.
+
+        Sorting does not go through lessThan(). sort() builds the column's typed sort keys (TableModel.sort_keys()),
+        orders the source rows with one sorted() pass, and shows the accepted rows in that order. The last few row
+        orders are cached by column and direction until the data change. Rows added to the source model are placed
+        in order, but edited rows keep their place until the table is sorted or re-filtered.
+
+        In asynchronous mode, add_filter_condition() and sort() (called by the view when a header is clicked) hand
+        copies of the columns they need to a Worker (workers.py) and return at once. The mask, or the sorted row
+        order, replaces the current one when the worker finishes. A new filter or sort cancels the previous one still
+        running, and results computed from data that has since changed are recomputed. busy_changed and progress let
+        the view show that work is under way.
+
+        If the source model sets pushdown (e.g. SqliteTableModel, sqlite_model.py), filter conditions, removed rows,
+        the text search and sorts are instead handed to its set_query(), which applies them to the data itself, and
+        the proxy shows every row the source presents, in the source's order.
 
         :param model: TableModel object holding the underlying model
+        :param use_index: bool, whether the filter engine builds per-column value indexes to speed up filtering
+        :param asynchronous: bool, whether to filter and sort on a background thread
         """
 
         super().__init__()
+        self.filter_conditions = {"Remove": set()}  # Can be changed, added to and used for filterAcceptsRow filtering
+        self.engine = FilterEngine(model, use_index)
+        self.compiled_conditions = []  # (column number, set of values) pairs for rows not covered by filter_mask
+        self.filter_mask = None  # bytearray with one byte per source row, or None when no column is filtered
+        self.mask_stale = False  # Set when the source data change in a way that needs the mask to be rebuilt
+        self.asynchronous = asynchronous
+        self.workers = {}  # "filter" or "sort" -> Worker currently running
+        self.source_version = 0  # Incremented whenever the source data change, to detect out of date worker results
+        self.sort_column = -1
+        self.sort_order = Qt.AscendingOrder
+        self.sort_cache = {}  # (column number, descending) -> array of source rows in sorted order
+        self.order_stale = False  # Set when cells of the sort column are edited, until the rows are sorted again
+        self.pushdown = False  # Set from the source model: filters and sorts are applied by the model's set_query()
+        self.excluded = set()  # Row keys (e.g. SQLite rowids) hidden by remove_row() when pushing down
+        self.search_index = None  # SearchIndex (search.py) created by set_search()
+        self.search_mask = None  # Row mask of the rows matching the search, or None when not searching
+        self.search_stale = False  # Set when the search must be run again, e.g. after the model is reset
+        self.search_query = None  # (query, mode) of the current search
+        self.search_columns = None  # Columns searched, kept for push_query() when the source pushes filters down
+        self.proxy_rows = array("q")  # Source row shown as each proxy row, in the order shown
+        self.shown = bytearray()  # Row mask of the source rows in proxy_rows
+        self.positions = None  # Proxy row of each source row (-1 if not shown), built by source_positions()
         self.setSourceModel(model)
-        self.filter_conditions = {"Remove": []}  # Can be changed, added to and used for filterAcceptsRow filtering
+
+    def source_signals(self, model):
+        """Returns the (signal, slot) pairs connecting a source model's change signals to the proxy"""
+
+        return [(model.dataChanged, self.source_data_changed),
+                (model.headerDataChanged, self.source_header_changed),
+                (model.rowsInserted, self.source_rows_inserted),
+                (model.rowsAboutToBeRemoved, self.source_rows_about_to_be_removed),
+                (model.rowsRemoved, self.source_rows_removed),
+                (model.rows_discarded, self.source_rows_discarded),
+                (model.layoutAboutToBeChanged, self.source_about_to_be_reset),
+                (model.layoutChanged, self.source_reset),
+                (model.modelAboutToBeReset, self.source_about_to_be_reset),
+                (model.modelReset, self.source_reset)]
+
+    def setSourceModel(self, model):
+        """
+        Sets the source model and shows its rows, connecting the filter engine to its change signals first so that
+        the mask is up to date before the proxy re-filters changed rows. Reimplemented from QAbstractProxyModel
+
+        :param model: TableModel object holding the underlying model
+        """
+
+        self.beginResetModel()
+        previous = self.sourceModel()
+        if previous is not None:
+            for signal, slot in self.source_signals(previous):
+                signal.disconnect(slot)
+        for signal, slot in self.source_signals(model):
+            signal.connect(slot)
+        self.engine.model = model
+        self.engine.update_columns()
+        self.pushdown = model.pushdown
+        self.excluded = set()
+        self.search_index = None
+        self.search_mask = None
+        self.search_query = None
+        self.search_columns = None
+        self.mask_stale = True
+        self.sort_cache.clear()
+        super().setSourceModel(model)
+        self.rebuild_rows()
+        self.endResetModel()
+
+    def index(self, row, column, parent=QModelIndex()):
+        """Returns the index of a proxy cell. Reimplemented from QAbstractProxyModel"""
+
+        if parent.isValid() or not 0 <= row < len(self.proxy_rows) or not 0 <= column < self.columnCount():
+            return QModelIndex()
+        return self.createIndex(row, column)
+
+    def parent(self, index=None):
+        """Returns an invalid index, as table rows have no parent, or the parent QObject if called without an index"""
+
+        if index is None:
+            return QObject.parent(self)
+        return QModelIndex()
+
+    def sibling(self, row, column, index):
+        """Returns the index of another cell. Reimplemented from QAbstractProxyModel"""
+
+        return self.index(row, column)
+
+    def rowCount(self, parent=QModelIndex()):
+        """Returns the number of rows shown"""
+
+        return 0 if parent.isValid() else len(self.proxy_rows)
+
+    def columnCount(self, parent=QModelIndex()):
+        """Returns the number of columns of the source model"""
+
+        return 0 if parent.isValid() else self.sourceModel().columnCount()
+
+    def hasChildren(self, parent=QModelIndex()):
+        """Returns True for the table itself while it shows rows. Reimplemented from QAbstractProxyModel"""
+
+        return not parent.isValid() and len(self.proxy_rows) > 0
+
+    def mapToSource(self, proxy_index):
+        """Returns the source model index of a proxy index. Reimplemented from QAbstractProxyModel"""
+
+        if not proxy_index.isValid():
+            return QModelIndex()
+        return self.sourceModel().index(self.proxy_rows[proxy_index.row()], proxy_index.column())
+
+    def mapFromSource(self, source_index):
+        """
+        Returns the proxy index showing a source model index, or an invalid index if its row is not shown.
+        Reimplemented from QAbstractProxyModel
+        """
+
+        if not source_index.isValid():
+            return QModelIndex()
+        positions = self.source_positions()
+        row = source_index.row()
+        if row >= len(positions) or positions[row] < 0:
+            return QModelIndex()
+        return self.createIndex(positions[row], source_index.column())
+
+    def source_positions(self):
+        """Returns the proxy row of each source row, -1 for rows not shown, building it after the rows shown change"""
+
+        if self.positions is None:
+            if len(self.proxy_rows) == len(self.shown) and (self.sort_column < 0 or self.pushdown):
+                self.positions = range(len(self.shown))  # Every row shown, in source order
+            else:
+                positions = array("q", bytes([255]) * (8 * len(self.shown)))
+                for position, row in enumerate(self.proxy_rows):
+                    positions[row] = position
+                self.positions = positions
+        return self.positions
+
+    def data(self, index, role=Qt.DisplayRole):
+        """Returns the source model's data for a proxy cell. Reimplemented from QAbstractProxyModel"""
+
+        if not index.isValid():
+            return None
+        source = self.sourceModel()
+        return source.data(source.index(self.proxy_rows[index.row()], index.column()), role)
+
+    def headerData(self, section, orientation, role=Qt.DisplayRole):
+        """
+        Returns the source model's header data: the same column headers, and the row header of the source row shown
+        as each proxy row. Reimplemented from QAbstractProxyModel
+        """
+
+        if orientation == Qt.Vertical:
+            if not 0 <= section < len(self.proxy_rows):
+                return None
+            section = self.proxy_rows[section]
+        return self.sourceModel().headerData(section, orientation, role)
+
+    def source_header_changed(self, orientation, first, last):
+        """Passes on a change of the source model's header data"""
+
+        if orientation == Qt.Horizontal:
+            self.headerDataChanged.emit(orientation, first, last)
+        elif self.proxy_rows:
+            self.headerDataChanged.emit(orientation, 0, len(self.proxy_rows) - 1)
 
     def filterAcceptsRow(self, source_row, source_parent):
         """
@@ -153,17 +691,583 @@ class ProxyModel(QSortFilterProxyModel):
         :param source_parent: parent object of source model
         """
 
+        if self.pushdown:  # The source model presents only accepted rows
+            return True
         if source_row in self.filter_conditions["Remove"]:
             return False
-        for column, conditions in self.filter_conditions.items():
-            if column == "Remove":
-                if source_row in conditions:
-                    return False
-            for i, column_name in enumerate(self.sourceModel().columns):
-                if column_name == column:
-                    if self.sourceModel().dataset[source_row][i] not in conditions:
-                        return False
-        return True
+        if self.search_mask is not None and not self.search_accepts(source_row):
+            return False
+        if self.mask_stale:
+            self.update_mask()
+        mask = self.filter_mask
+        if mask is None:
+            return True
+        if source_row < len(mask):
+            return mask[source_row] == 1
+        return self.engine.accepts(source_row, self.compiled_conditions)
+
+    def update_mask(self):
+        """Recomputes the row mask from the current filter conditions"""
+
+        self.compiled_conditions = self.engine.compile(self.filter_conditions)
+        self.filter_mask = self.engine.compute_mask(self.filter_conditions)
+        self.mask_stale = False
+
+    def apply_filters(self):
+        """Recomputes the row mask and re-filters the table. Call this after editing filter_conditions directly."""
+
+        if self.pushdown:
+            self.push_query()
+            return
+        self.update_mask()
+        self.refilter()
+
+    def push_query(self):
+        """Hands the filter conditions, rows hidden by remove_row(), text search and sort to a pushdown source model"""
+
+        columns = self.sourceModel().columns
+        conditions = {column: values for column, values in self.filter_conditions.items() if column in columns}
+        search = None if self.search_query is None else self.search_query + (self.search_columns,)
+        self.sourceModel().set_query(conditions, self.excluded, self.sort_column,
+                                     self.sort_order == Qt.DescendingOrder, search)
+
+    def accepted_mask(self):
+        """Returns a row mask of the source rows currently accepted, combining the filter mask and removed rows"""
+
+        if self.pushdown:
+            return bytearray(b"\x01") * self.sourceModel().rowCount()
+        if self.mask_stale:
+            self.update_mask()
+        row_count = self.sourceModel().rowCount()
+        if self.filter_mask is None:
+            mask = bytearray(b"\x01") * row_count
+        else:
+            mask = bytearray(self.filter_mask)
+            for row in range(len(mask), row_count):  # Rows appended since the mask was computed
+                mask.append(self.engine.accepts(row, self.compiled_conditions))
+        for row in self.filter_conditions["Remove"]:
+            if row < row_count:
+                mask[row] = 0
+        if self.search_mask is not None:
+            if self.search_stale:
+                self.update_search()
+            mask = and_masks(mask, self.search_mask)
+        return mask
+
+    def current_mask(self):
+        """
+        Returns a row mask of the source rows filterAcceptsRow() accepts, read from accepted_mask() unless
+        filterAcceptsRow() has been reimplemented
+        """
+
+        if type(self).filterAcceptsRow is ProxyModel.filterAcceptsRow:
+            return self.accepted_mask()
+        accepts = self.filterAcceptsRow
+        parent = QModelIndex()
+        return bytearray(1 if accepts(row, parent) else 0 for row in range(self.sourceModel().rowCount()))
+
+    def shown_mask(self):
+        """Returns a copy of the row mask of the source rows shown"""
+
+        return bytearray(self.shown)
+
+    def ordered_rows(self, mask):
+        """
+        Returns an array of the source rows set in a row mask in the order to show them, and whether they have been
+        sorted again since cells of the sort column were edited. While an asynchronous sort has still to finish, the
+        rows already shown keep their order and are followed by the others in source order.
+
+        :param mask: row mask of the source rows to show
+        """
+
+        if self.sort_column < 0 or self.pushdown:
+            return array("q", mask_rows(mask, 1)), False
+        descending = self.sort_order == Qt.DescendingOrder
+        permutation = self.sort_cache.get((self.sort_column, descending))
+        if permutation is None and not self.asynchronous:
+            permutation = sort_permutation(None, self.sourceModel().sort_keys(self.sort_column), descending)
+            self.cache_sort(permutation)
+        if permutation is None:
+            if "sort" not in self.workers:
+                self.start_sort()
+            if len(self.shown) != len(mask):
+                return array("q", mask_rows(mask, 1)), False
+            rows = self.kept_rows(mask)
+            rows.extend(mask_rows(subtract_masks(mask, self.shown), 1))
+            return rows, False
+        resorted = self.order_stale
+        self.order_stale = False
+        return array("q", compress(permutation, map(mask.__getitem__, permutation))), resorted
+
+    def kept_rows(self, mask):
+        """Returns an array of the source rows shown which are set in a row mask, in the order shown"""
+
+        rows = self.proxy_rows
+        return array("q", compress(rows, map(mask.__getitem__, rows)))
+
+    def rebuild_rows(self):
+        """Works out the rows to show from scratch, without signalling the views, e.g. inside a model reset"""
+
+        self.proxy_rows = array("q")
+        self.shown = bytearray()
+        mask = self.current_mask()
+        self.proxy_rows = self.ordered_rows(mask)[0]
+        self.shown = mask
+        self.positions = None
+
+    def show_rows(self, mask, rows=None):
+        """
+        Changes the source rows shown to those set in a row mask. The proxy rows no longer shown are removed, and the
+        new ones inserted, with one signal for each run of proxy rows, which relies on the rows kept staying in the
+        same order. Past MAX_REFILTER_RANGES runs, or if the rows have been sorted again, the whole table is laid out
+        again instead.
+
+        :param mask: row mask of the source rows to show, the same length as shown
+        :param rows: array of the same source rows in the order to show them, or None for ordered_rows(mask)
+        """
+
+        resorted = False
+        if rows is None:
+            rows, resorted = self.ordered_rows(mask)
+        if resorted:
+            self.relayout(rows, mask)
+            return
+        previous = self.proxy_rows
+        removed = subtract_masks(self.shown, mask)
+        added = subtract_masks(mask, self.shown)
+        removed_ranges = row_ranges(compress(range(len(previous)), map(removed.__getitem__, previous)),
+                                    MAX_REFILTER_RANGES)
+        added_ranges = row_ranges(compress(range(len(rows)), map(added.__getitem__, rows)), MAX_REFILTER_RANGES)
+        if not removed_ranges and not added_ranges:
+            return
+        if len(removed_ranges) + len(added_ranges) > MAX_REFILTER_RANGES:
+            self.relayout(rows, mask)
+            return
+        parent = QModelIndex()
+        for first, last in reversed(removed_ranges):
+            self.beginRemoveRows(parent, first, last)
+            del self.proxy_rows[first:last + 1]
+            self.positions = None
+            self.endRemoveRows()
+        for first, last in added_ranges:
+            self.beginInsertRows(parent, first, last)
+            self.proxy_rows[first:first] = rows[first:last + 1]
+            self.positions = None
+            self.endInsertRows()
+        self.shown = mask
+        self.filter_changed.emit()
+
+    def relayout(self, rows, mask):
+        """
+        Replaces the rows shown in one layout change, moving persistent indexes (e.g. the selection) with their rows
+
+        :param rows: array of source rows in the order to show them
+        :param mask: row mask of the same source rows
+        """
+
+        filtered = mask != self.shown
+        self.layoutAboutToBeChanged.emit()
+        persistent = self.persistentIndexList()
+        previous = self.proxy_rows
+        source_rows = [previous[index.row()] for index in persistent]
+        self.proxy_rows = rows
+        self.shown = mask
+        self.positions = None
+        if persistent:
+            positions = self.source_positions()
+            self.changePersistentIndexList(persistent, [
+                self.createIndex(positions[row], index.column()) if positions[row] >= 0 else QModelIndex()
+                for row, index in zip(source_rows, persistent)])
+        self.layoutChanged.emit()
+        if filtered:
+            self.filter_changed.emit()
+
+    def refilter(self):
+        """Shows the rows now accepted, removing and inserting only the proxy rows whose state changed"""
+
+        self.show_rows(self.current_mask())
+
+    def invalidate(self):
+        """
+        Filters and sorts every row again, e.g. after the conditions read by a reimplemented filterAcceptsRow() change
+        or cells were edited directly through the store
+        """
+
+        self.source_version += 1
+        self.sort_cache.clear()
+        self.engine.invalidate()
+        self.mask_stale = True
+        self.invalidate_search()
+        mask = self.current_mask()
+        self.relayout(self.ordered_rows(mask)[0], mask)
+
+    def set_search(self, query, mode="substring", columns=None):
+        """
+        Shows only the rows matching a text search across columns, on top of the column filters: "substring" finds
+        the text anywhere in a row, "tokens" finds rows containing every word of the query at the start of a word,
+        and "regex" matches a regular expression. Case is ignored. An empty query ends the search. Each row's text is
+        read once into a SearchIndex (search.py), which is then kept up to date as the source model changes, and a
+        query that extends the previous one only tests the previous matches. Raises re.error for an invalid regular
+        expression. See search.SearchBox for a search box that calls this as the user types. A pushdown source model
+        is handed the search with the filters instead, and searches its own rows.
+
+        :param query: str, text to search for
+        :param mode: str, "substring", "tokens" or "regex"
+        :param columns: list of the column numbers to search, or None for every column
+        """
+
+        source = self.sourceModel()
+        if columns is None:
+            columns = list(range(source.columnCount()))
+        if self.pushdown:
+            compile_query(query, mode)  # Raises re.error before anything changes
+            self.search_query = (query, mode)
+            self.search_columns = columns
+            self.push_query()
+            return
+        if self.search_index is None or self.search_index.columns != columns:
+            self.search_index = SearchIndex(source, columns)
+        self.search_query = (query, mode)
+        self.update_search()
+        self.refilter()
+
+    def update_search(self):
+        """Runs the current search, e.g. again after the source model is reset"""
+
+        index = self.search_index
+        rows = index.search(*self.search_query)
+        self.search_mask = index.mask(rows) if index.pattern is not None else None
+        self.search_stale = False
+
+    def search_accepts(self, source_row):
+        """Returns True if a source row matches the current search"""
+
+        if self.search_stale:
+            self.update_search()
+            if self.search_mask is None:
+                return True
+        if source_row < len(self.search_mask):
+            return self.search_mask[source_row] == 1
+        return self.search_index.accepts(source_row)
+
+    def changed_source_rows(self, first, last):
+        """
+        Returns the source rows first to last, inclusive, narrowed to the rows TableModel.set_cells() changed while it
+        signals one wide range
+        """
+
+        last = min(last, len(self.shown) - 1)
+        changed_rows = self.sourceModel().changed_rows
+        if changed_rows is None:
+            return range(first, last + 1)
+        return changed_rows[bisect_left(changed_rows, first):bisect_right(changed_rows, last)]
+
+    def source_data_changed(self, top_left, bottom_right, roles=None):
+        """
+        Updates the value indexes, mask and search for edited cells in the source model, shows or hides the edited
+        rows whose filter state changed, and passes the change on for the edited rows shown
+        """
+
+        self.source_version += 1
+        first, last = top_left.row(), bottom_right.row()
+        columns = range(top_left.column(), bottom_right.column() + 1)
+        self.engine.invalidate(columns)
+        refilter = type(self).filterAcceptsRow is not ProxyModel.filterAcceptsRow
+        if self.search_index is not None and any(column in self.search_index.columns for column in columns):
+            self.search_index.update_rows(first, last)
+            if self.search_mask is not None and not self.search_stale:
+                for row in range(first, min(last + 1, len(self.search_mask))):
+                    self.search_mask[row] = self.search_index.accepts(row)
+                refilter = True
+        for key in [key for key in self.sort_cache if key[0] in columns]:
+            del self.sort_cache[key]
+        if self.sort_column in columns and not self.pushdown:
+            self.order_stale = True
+        if self.filter_mask is not None and not self.mask_stale:
+            if any(column in columns for column, _ in self.compiled_conditions):
+                for row in range(first, min(last + 1, len(self.filter_mask))):
+                    self.filter_mask[row] = self.engine.accepts(row, self.compiled_conditions)
+                refilter = True
+        elif self.mask_stale and len(self.filter_conditions) > 1:
+            refilter = True
+        rows = self.changed_source_rows(first, last)
+        if refilter and not self.pushdown:
+            accepts = self.filterAcceptsRow
+            parent = QModelIndex()
+            mask = None
+            for row in rows:
+                state = 1 if accepts(row, parent) else 0
+                if state != self.shown[row]:
+                    if mask is None:
+                        mask = bytearray(self.shown)
+                    mask[row] = state
+            if mask is not None:
+                self.show_rows(mask)
+        if not self.proxy_rows or not rows:
+            return
+        if len(rows) >= len(self.proxy_rows):
+            proxy_first, proxy_last = 0, len(self.proxy_rows) - 1
+        else:
+            positions = self.source_positions()
+            shown = [positions[row] for row in rows if positions[row] >= 0]
+            if not shown:
+                return
+            proxy_first, proxy_last = min(shown), max(shown)
+        self.dataChanged.emit(self.index(proxy_first, top_left.column()),
+                              self.index(proxy_last, bottom_right.column()), roles or [])
+
+    def source_rows_inserted(self, parent, first, last):
+        """
+        Extends the value indexes and mask for rows appended to the source model (e.g. by fetchMore), or splices the
+        mask and renumbers the removed and shown rows for rows inserted part way through the table, then shows the
+        new rows which are accepted
+        """
+
+        self.source_version += 1
+        self.sort_cache.clear()
+        count = last - first + 1
+        mask_valid = self.filter_mask is not None and not self.mask_stale
+        if self.search_index is not None:
+            self.search_index.insert_rows(first, last)
+            if self.search_mask is not None and not self.search_stale:
+                self.search_mask[first:first] = bytearray(map(self.search_index.accepts, range(first, last + 1)))
+        if first < len(self.shown):  # Rows inserted part way through the table
+            self.engine.invalidate()
+            removed = self.filter_conditions["Remove"]
+            if removed:
+                moved = {row + count if row >= first else row for row in removed}
+                removed.clear()
+                removed.update(moved)
+            if mask_valid:
+                compiled = self.compiled_conditions
+                self.filter_mask[first:first] = bytearray(self.engine.accepts(row, compiled)
+                                                          for row in range(first, last + 1))
+            self.proxy_rows = array("q", [row + count if row >= first else row for row in self.proxy_rows])
+        else:
+            self.engine.extend_indexes(first)
+            if mask_valid and first == len(self.filter_mask):
+                compiled = self.compiled_conditions
+                self.filter_mask.extend(self.engine.accepts(row, compiled) for row in range(first, last + 1))
+        self.shown[first:first] = bytearray(count)
+        self.positions = None
+        accepts = self.filterAcceptsRow
+        new_rows = [row for row in range(first, last + 1) if accepts(row, parent)]
+        if new_rows:
+            mask = bytearray(self.shown)
+            for row in new_rows:
+                mask[row] = 1
+            self.show_rows(mask, self.merged_rows(new_rows))
+
+    def sort_key(self, row):
+        """Returns the sort key of a source row for the current sort column, as TableModel.sort_keys() gives it"""
+
+        source = self.sourceModel()
+        value = source.store.value(row, self.sort_column)
+        converter = source.converters[self.sort_column]
+        return value if converter is None or source.store.typed else converter(value)
+
+    def merged_rows(self, new_rows):
+        """
+        Returns an array of the source rows shown with new rows added: by source row if the table is not sorted, or
+        else each where a binary search on the sort keys places it. While the rows shown are out of order (cells of
+        the sort column were edited, or an asynchronous sort has still to finish) the new rows go at the end.
+
+        :param new_rows: ascending list of source rows not yet shown
+        """
+
+        rows = self.proxy_rows
+        if self.sort_column < 0 or self.pushdown:
+            position = bisect_left(rows, new_rows[0])
+            return rows[:position] + array("q", new_rows) + rows[position:]
+        if self.order_stale or "sort" in self.workers:
+            return rows + array("q", new_rows)
+        descending = self.sort_order == Qt.DescendingOrder
+        key = self.sort_key
+        keyed = sorted(((key(row), row) for row in new_rows), key=itemgetter(0), reverse=descending)
+        merged = array("q")
+        start = 0
+        for value, row in keyed:  # Equal keys are ordered by source row, as in sort_permutation()
+            low, high = start, len(rows)
+            while low < high:
+                middle = (low + high) // 2
+                other = rows[middle]
+                other_value = key(other)
+                before = other_value > value if descending else other_value < value
+                if before or (other_value == value and other < row):
+                    low = middle + 1
+                else:
+                    high = middle
+            merged.extend(rows[start:low])
+            merged.append(row)
+            start = low
+        merged.extend(rows[start:])
+        return merged
+
+    def source_rows_about_to_be_removed(self, parent, first, last):
+        """Removes the proxy rows showing source rows which are about to be removed"""
+
+        mask = bytearray(self.shown)
+        mask[first:last + 1] = bytearray(last - first + 1)
+        if mask != self.shown:
+            self.show_rows(mask, self.kept_rows(mask))
+
+    def source_rows_removed(self, parent, first, last):
+        """Cuts removed rows out of the masks and renumbers the shown and removed rows which follow them"""
+
+        self.source_version += 1
+        self.sort_cache.clear()
+        self.engine.invalidate()
+        count = last - first + 1
+        if self.search_index is not None:
+            self.search_index.remove_rows(first, last)
+            if self.search_mask is not None and not self.search_stale:
+                del self.search_mask[first:last + 1]
+        removed = self.filter_conditions["Remove"]
+        if removed:
+            moved = {row - count if row > last else row for row in removed if not first <= row <= last}
+            removed.clear()
+            removed.update(moved)
+        if self.filter_mask is not None and not self.mask_stale:
+            del self.filter_mask[first:last + 1]
+        del self.shown[first:last + 1]
+        if first < len(self.shown):
+            self.proxy_rows = array("q", [row - count if row > last else row for row in self.proxy_rows])
+        self.positions = None
+
+    def source_rows_discarded(self, rows):
+        """
+        Renumbers the rows hidden by remove_row() after TableModel.remove_rows() deleted scattered rows, or forgets
+        them after TableModel.replace_dataset(). The mask is rebuilt by the model reset which follows.
+        """
+
+        removed = self.filter_conditions["Remove"]
+        if rows is None or not removed:
+            removed.clear()
+            return
+        discarded = set(rows)
+        moved = {row - bisect_left(rows, row) for row in removed if row not in discarded}
+        removed.clear()
+        removed.update(moved)
+
+    def source_about_to_be_reset(self, *args):
+        """Starts a reset of the proxy when the source model is reset, or its rows are moved"""
+
+        self.beginResetModel()
+
+    def source_reset(self, *args):
+        """Drops the value indexes, mask and sort cache after the source model is reset, and shows its rows again"""
+
+        self.source_version += 1
+        self.sort_cache.clear()
+        self.engine.update_columns()
+        self.mask_stale = True
+        self.invalidate_search()
+        self.rebuild_rows()
+        self.endResetModel()
+
+    def invalidate_search(self):
+        """Rebuilds the search index and runs the search again when next needed"""
+
+        index = self.search_index
+        if index is not None:
+            column_count = self.sourceModel().columnCount()
+            if any(column >= column_count for column in index.columns):  # The columns changed
+                index.columns = list(range(column_count))
+            index.invalidate()
+            self.search_stale = self.search_mask is not None
+
+    def start_worker(self, kind, function, *args):
+        """
+        Runs function(worker, *args) on a background Worker, cancelling any worker of the same kind still running
+
+        :param kind: str, "filter" or "sort"
+        :param function: callable to run, see workers.Worker
+        :param args: further arguments for the function, which must be copies of any data it reads
+        """
+
+        previous = self.workers.get(kind)
+        if previous is not None:
+            previous.cancel()
+        worker = Worker(function, *args)
+        worker.version = self.source_version
+        worker.signals.finished.connect(lambda result: self.worker_finished(kind, worker, result))
+        worker.signals.failed.connect(lambda message: self.worker_finished(kind, worker, None))
+        worker.signals.progress.connect(self.progress)
+        was_busy = bool(self.workers)
+        self.workers[kind] = worker
+        worker.start()
+        if not was_busy:
+            self.busy_changed.emit(True)
+
+    def worker_finished(self, kind, worker, result):
+        """Applies the result of a background filter or sort, unless it has been superseded or is out of date"""
+
+        if self.workers.get(kind) is not worker:
+            return
+        del self.workers[kind]
+        if result is not None:
+            if worker.version != self.source_version and kind == "filter":  # Data changed while the worker ran
+                self.start_filter()
+            elif worker.version != self.source_version:
+                self.start_sort()
+            elif kind == "filter":
+                self.filter_mask, self.compiled_conditions = result
+                self.refilter()
+            else:
+                self.cache_sort(result)
+                self.relayout(self.ordered_rows(self.shown)[0], self.shown)
+        if not self.workers:
+            self.busy_changed.emit(False)
+
+    def cancel_worker(self, kind):
+        """Cancels a running background filter or sort, if any"""
+
+        worker = self.workers.pop(kind, None)
+        if worker is not None:
+            worker.cancel()
+            if not self.workers:
+                self.busy_changed.emit(False)
+
+    def start_filter(self):
+        """Computes the mask for the current filter conditions on a background worker"""
+
+        compiled = [(column, frozenset(values)) for column, values in self.engine.compile(self.filter_conditions)]
+        store = self.sourceModel().store
+        values = {column: store.column_values(column)[:] for column, _ in compiled}
+        self.start_worker("filter", filter_worker, values, compiled)
+
+    def start_sort(self):
+        """Computes the row order for the current sort column and order on a background worker"""
+
+        keys = self.sourceModel().sort_keys(self.sort_column)
+        self.start_worker("sort", sort_permutation, keys, self.sort_order == Qt.DescendingOrder)
+
+    def cache_sort(self, permutation):
+        """Stores the row order for the current sort column and order, dropping the oldest if the cache is full"""
+
+        if len(self.sort_cache) >= SORT_CACHE_SIZE:
+            del self.sort_cache[next(iter(self.sort_cache))]
+        self.sort_cache[(self.sort_column, self.sort_order == Qt.DescendingOrder)] = permutation
+
+    def sort(self, column, order=Qt.AscendingOrder):
+        """
+        Sorts the table by a column, re-using a cached row order if there is one. Otherwise the source rows are
+        ordered by the column's sort keys, on a background worker in asynchronous mode, and the accepted rows are
+        shown in the new order. The source model is left as it is. Reimplemented from QAbstractProxyModel
+
+        :param column: int, column number to sort by, or -1 to return to the source order
+        :param order: Qt.AscendingOrder or Qt.DescendingOrder
+        """
+
+        self.sort_column, self.sort_order = column, order
+        if self.pushdown:
+            self.push_query()
+            return
+        self.cancel_worker("sort")
+        if column >= 0 and self.asynchronous and (column, order == Qt.DescendingOrder) not in self.sort_cache:
+            self.start_sort()
+            return
+        self.relayout(self.ordered_rows(self.shown)[0], self.shown)
 
     def add_filter_condition(self, column_name, conditions):
         """
@@ -175,14 +1279,120 @@ class ProxyModel(QSortFilterProxyModel):
         including them.
 
         :param column_name: str, name of column, must be included in the columns list of the source model
-        :param conditions: list of values to be included a filter of the specified column
+        :param conditions: list or set of values to be included a filter of the specified column, or a single value
         """
 
+        if isinstance(conditions, str) or not hasattr(conditions, "__iter__"):
+            conditions = [conditions]
+        conditions = set(conditions)
+        if self.pushdown:
+            self.filter_conditions[column_name] = conditions
+            self.push_query()
+            return
+        if self.asynchronous:
+            self.filter_conditions[column_name] = conditions
+            self.start_filter()
+            return
+        previous_conditions = self.filter_conditions.get(column_name)
         self.filter_conditions[column_name] = conditions
-        self.setFilterFixedString("")
+        self.compiled_conditions = self.engine.compile(self.filter_conditions)
+        if column_name not in self.engine.column_numbers:
+            pass  # Conditions on columns which are not in the model are ignored
+        elif previous_conditions is None or conditions <= previous_conditions:
+            self.filter_mask = self.engine.narrow_mask(self.filter_mask, self.engine.column_numbers[column_name],
+                                                       conditions)
+        elif conditions >= previous_conditions:
+            self.filter_mask = self.engine.widen_mask(self.filter_mask, self.filter_conditions)
+        else:
+            self.filter_mask = self.engine.compute_mask(self.filter_conditions)
+        self.refilter()
 
     def reset_filters(self):
         """Removes all filter conditions and returns the table to its original unfiltered state"""
 
-        self.filter_conditions = {"Remove": []}
-        self.setFilterFixedString("")
+        if self.pushdown:
+            self.filter_conditions = {"Remove": set()}
+            self.excluded = set()
+            self.push_query()
+            return
+        self.cancel_worker("filter")
+        self.filter_conditions = {"Remove": set()}
+        self.compiled_conditions = []
+        self.filter_mask = None
+        self.refilter()
+
+    def distinct_counts(self, column_name, prefix=None, limit=None):
+        """
+        Returns a dictionary of the values of a column -> number of rows holding them, counting only the rows that
+        the other columns' filters and remove_row() leave, so that a filter picker for a column shows what choosing
+        each value would give. With no other filters this is read straight from the column's distinct index. A
+        pushdown source model presents only the rows its query selects, so then the counts cover those rows.
+
+        :param column_name: str, name of the column
+        :param prefix: str, only count values whose text starts with this, ignoring case (for typeahead), or None
+        :param limit: int, the most values to return when searching by prefix, or None for all
+        """
+
+        source = self.sourceModel()
+        column = source.columns.index(column_name)
+        index = source.distinct_index(column)
+        candidates = None if prefix is None else index.prefix_search(prefix, limit)
+        others = {name: values for name, values in self.filter_conditions.items()
+                  if name not in ("Remove", column_name)}
+        removed = self.filter_conditions["Remove"]
+        if self.pushdown or (not others and not removed):
+            values = index.counts.keys() if candidates is None else candidates
+            return {value: index.counts[value] for value in values}
+        mask = self.engine.compute_mask(others)
+        if mask is None:
+            mask = bytearray(b"\x01") * source.rowCount()
+        for row in removed:
+            if row < len(mask):
+                mask[row] = 0
+        values = source.store.read_columns(list(mask_rows(mask, 1)), [column])[0]
+        if candidates is not None:
+            wanted = set(candidates)
+            values = [value for value in values if value in wanted]
+        counts = Counter(values)
+        if candidates is not None:
+            return {value: counts[value] for value in candidates if value in counts}
+        return dict(counts)
+
+    def source_rows(self, first, last):
+        """
+        Returns a list of the source row numbers shown as proxy rows first to last, inclusive
+
+        :param first: int, first proxy row
+        :param last: int, last proxy row
+        """
+
+        return list(self.proxy_rows[first:last + 1])
+
+    def accepted_rows(self):
+        """
+        Returns an array of the source row numbers of every proxy row, in proxy order. When the source model pushes
+        filters down, every source row is shown in source order and a range is returned instead.
+        """
+
+        if self.pushdown:
+            return range(self.sourceModel().rowCount())
+        return array("q", self.proxy_rows)
+
+    def remove_row(self, source_row):
+        """
+        Hides a single row from the filtered table (without deleting it from the data), removing only that proxy row
+
+        :param source_row: int, the row index in the source model
+        """
+
+        if self.pushdown:
+            self.excluded.add(self.sourceModel().store.rowid(source_row))
+            self.push_query()
+            return
+        if source_row in self.filter_conditions["Remove"]:
+            return
+        self.filter_conditions["Remove"].add(source_row)
+        if source_row < len(self.shown) and self.shown[source_row]:
+            mask = bytearray(self.shown)
+            mask[source_row] = 0
+            self.show_rows(mask, self.kept_rows(mask))
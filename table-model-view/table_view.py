@@ -22,30 +22,77 @@
 
 import io
 import csv
-from PySide2.QtWidgets import QTableView, QAbstractItemView, QSizePolicy, QMenu, qApp
+from itertools import repeat
+from PySide2.QtCore import Qt, QTimer
+from PySide2.QtWidgets import QTableView, QAbstractItemView, QSizePolicy, QMenu, QStyle, qApp
+
+FIT_MARGIN = 20  # Rows above and below the viewport also fitted by fit_rows() in "visible" mode
+COPY_CHUNK = 10000  # Rows read from the source model at a time by copy_selection()
+
+
+def selection_bands(ranges):
+    """
+    Splits selection ranges into bands of consecutive rows which have the same selected columns, sweeping down the
+    rows once rather than testing every range on every row. Rows with no selected columns are left out.
+
+    :param ranges: list of (top, bottom, left, right) tuples of selected cells, inclusive
+    Returns a list of (first row, last row, sorted list of columns) tuples, in row order
+    """
+
+    starting = {}
+    ending = {}
+    for i, (top, bottom, left, right) in enumerate(ranges):
+        starting.setdefault(top, []).append(i)
+        ending.setdefault(bottom + 1, []).append(i)
+    breaks = sorted(set(starting) | set(ending))
+    active = set()
+    bands = []
+    for first, end in zip(breaks, breaks[1:]):
+        active.difference_update(ending.get(first, ()))
+        active.update(starting.get(first, ()))
+        if active:
+            columns = sorted({column for i in active for column in range(ranges[i][2], ranges[i][3] + 1)})
+            bands.append((first, end - 1, columns))
+    return bands
 
 
 class TableView(QTableView):
-    def __init__(self, parent, model, name):
+    def __init__(self, parent, model, name, row_fitting="visible"):
         """
         Subclass of QTableView. Allows setting custom column widths and a context (right click) menu to remove
         rows from the view (without deleting them from the data). Set some basic customization options which can be
         changed as desired.
 
         :param parent: parent widget which holds the table view
-        :param model: QSortFilterProxyModel object
+        :param model: ProxyModel object
         :param name: str, name of the table
+        :param row_fitting: str, how fit_rows() sizes rows to columns whose info has 'Wrap': True. "visible" fits
+        only the rows in and near the viewport, again whenever the view scrolls, resizes or its rows change; "all"
+        fits every row once. Without wrapping columns every row has the same height and neither mode measures rows.
         """
 
         super().__init__()
         self.parent = parent
         self.model = model
         self.name = name
+        self.row_fitting = row_fitting
+        self.row_heights = {}  # Measured heights, keyed by the row's wrapped values and the columns in view
+        self.delegates = {}  # Column name -> delegate assigned by set_delegates()
+        self.fit_timer = QTimer(self)  # Collects the scroll, resize and model signals of one event loop pass
+        self.fit_timer.setSingleShot(True)
+        self.fit_timer.setInterval(0)
+        self.fit_timer.timeout.connect(self.fit_rows)
         self.setup()
         self.setModel(model)
+        self.model.busy_changed.connect(self.show_busy)
         self.setSortingEnabled(True)
         self.set_widths()
         self.fit_rows()
+        if row_fitting == "visible":
+            self.verticalScrollBar().valueChanged.connect(self.fit_timer.start)
+            for signal in [model.layoutChanged, model.rowsInserted, model.modelReset, model.dataChanged]:
+                signal.connect(self.fit_timer.start)
+        self.horizontalHeader().sectionResized.connect(self.column_resized)
 
     def setup(self):
         """Sets some basic customization options"""
@@ -56,6 +103,14 @@ class TableView(QTableView):
         self.setAlternatingRowColors(True)
         self.setShowGrid(False)
 
+    def show_busy(self, busy):
+        """Shows a busy cursor over the table while the proxy model filters or sorts in the background"""
+
+        if busy:
+            self.viewport().setCursor(Qt.BusyCursor)
+        else:
+            self.viewport().unsetCursor()
+
     def set_widths(self):
         """Reads information from the info dictionary in the underlying source model (TableModel) and sets the
         specified widths for each column"""
@@ -76,17 +131,91 @@ class TableView(QTableView):
             hide = column not in columns_to_include
             self.setColumnHidden(i, hide)
     
+    def set_delegates(self, delegates):
+        """
+        Assigns delegates (see delegates.py) to columns by name in one pass over the columns. The view keeps a
+        reference to each delegate, since Qt does not take ownership of them.
+
+        :param delegates: dict, column name -> delegate object, or None to return the column to the default delegate
+        """
+
+        column_numbers = {column: i for i, column in enumerate(self.model.sourceModel().columns)}
+        for column, delegate in delegates.items():
+            self.setItemDelegateForColumn(column_numbers[column], delegate)
+            if delegate is None:
+                self.delegates.pop(column, None)
+            else:
+                self.delegates[column] = delegate
+
     def fit_rows(self):
-        """Adjusts row heights to fit all data"""
+        """
+        Adjusts row heights to fit the data. If no shown column has 'Wrap': True in its info, every row is one line
+        high, so the height is measured once and set as the default for all rows. Otherwise rows are measured with
+        resizeRowToContents() rules, either all rows or only those in and near the viewport (see row_fitting), and
+        measured heights are cached by the row's wrapped values so rows seen before are not measured again.
+        """
+
+        source = self.model.sourceModel()
+        wrap_columns = [i for i, column in enumerate(source.columns)
+                        if source.info[column].get("Wrap", False) and not self.isColumnHidden(i)]
+        self.setWordWrap(bool(wrap_columns))
+        if not wrap_columns:
+            self.fit_uniform()
+            return
+        row_count = self.model.rowCount()
+        if self.row_fitting == "all":
+            rows = range(row_count)
+        else:
+            first = self.rowAt(0)
+            last = self.rowAt(self.viewport().height() - 1)
+            first = 0 if first == -1 else first
+            last = row_count - 1 if last == -1 else last
+            rows = range(max(0, first - FIT_MARGIN), min(row_count, last + FIT_MARGIN + 1))
+        in_view = (self.columnAt(0), self.columnAt(self.viewport().width() - 1))  # sizeHintForRow() only measures these
+        for row in rows:
+            self.fit_row(row, wrap_columns, in_view)
+
+    def fit_uniform(self):
+        """Sets one height for all rows, measured from the first row (or the font if there are no rows)"""
 
-        for row in range(self.model.sourceModel().rowCount()):
-            self.resizeRowToContents(row)
+        header = self.verticalHeader()
+        if self.model.rowCount():
+            height = max(header.sectionSizeHint(0), self.sizeHintForRow(0))
+        else:
+            height = self.fontMetrics().height() + 2 * self.style().pixelMetric(QStyle.PM_FocusFrameVMargin)
+        header.setDefaultSectionSize(max(height, header.minimumSectionSize()))
+
+    def fit_row(self, row, wrap_columns, in_view):
+        """Sets the height of one row to fit its contents, using the cached height for the same contents if any"""
+
+        index = self.model.index
+        key = (in_view,) + tuple(index(row, column).data() for column in wrap_columns)
+        height = self.row_heights.get(key)
+        if height is None:
+            height = max(self.verticalHeader().sectionSizeHint(row), self.sizeHintForRow(row))
+            self.row_heights[key] = height
+        if self.rowHeight(row) != height:
+            self.setRowHeight(row, height)
+
+    def column_resized(self, column, old_width, new_width):
+        """Drops measured row heights, which depend on column widths, and re-fits the rows"""
+
+        self.row_heights = {}
+        if self.row_fitting == "visible":
+            self.fit_timer.start()
+
+    def resizeEvent(self, event):
+        """Re-fits rows after the view is resized. Reimplemented from QTableView"""
+
+        super().resizeEvent(event)
+        if self.row_fitting == "visible":
+            self.fit_timer.start()
 
     def contextMenuEvent(self, event):
         """
         Sets up the menu to show when a cell is right-clicked. This example includes a 'Remove' option which, when
-        selected, adds the clicked row to a list of rows to be filtered out and calls the filtering method for the
-        proxy model to hide the row. Different context menus can be set up for different columns if desired by reading
+        selected, adds the clicked row to the set of rows to be filtered out and re-filters that row in the proxy model
+        to hide it. Different context menus can be set up for different columns if desired by reading
         the column number from the index, cross-checking it with the columns list in the source model, and building
         the menu items under if else statements (e.g. if column_name == "Column A").
 
@@ -103,29 +232,56 @@ class TableView(QTableView):
         if selection == menu_items["Copy"]:  # Specify what happens for each item
             self.copy_selection()
         elif selection == menu_items["Remove"]:
-            self.model.filter_conditions["Remove"].append(row)
-            self.model.setFilterFixedString("")
+            self.model.remove_row(row)
 
     def copy_selection(self):
         """
         This function copies the selected cells in a table view, accounting for filters and rows as well as
         non-continuous selection ranges. The format of copied values can be pasted into Excel retaining the
-        original organization.
-        
-        Adapted from code provided by ekhumoro on StackOverflow 
+        original organization: the text covers the rectangle around the selection, with unselected cells left empty
+        and hidden columns left out.
+
+        The selection is read as ranges rather than one index per cell, split into bands of rows with the same
+        selected columns, and each band is read from the source model's storage COPY_CHUNK rows at a time and
+        written straight into the text, so large or sparse selections never build a grid of cells.
         """
-        
-        selection = self.selectedIndexes()
-        if selection:
-            rows = [index.row() for index in selection]
-            columns = [index.column() for index in selection]
-            row_count = max(rows) - min(rows) + 1
-            col_count = max(columns) - min(columns) + 1
-            table = [[""] * col_count for _ in range(row_count)]
-            for index in selection:
-                row = index.row() - min(rows)
-                column = index.column() - min(columns)
-                table[row][column] = index.data()
-            stream = io.StringIO()
-            csv.writer(stream, delimiter="\t").writerows(table)
-            qApp.clipboard().setText(stream.getvalue())
+
+        ranges = [(selected.top(), selected.bottom(), selected.left(), selected.right())
+                  for selected in self.selectionModel().selection()]
+        shown = [column for column in range(self.model.columnCount()) if not self.isColumnHidden(column)]
+        shown_set = set(shown)
+        bands = [(first, last, [column for column in columns if column in shown_set])
+                 for first, last, columns in selection_bands(ranges)]
+        bands = [band for band in bands if band[2]]
+        if not bands:
+            return
+        left = min(band[2][0] for band in bands)
+        right = max(band[2][-1] for band in bands)
+        output_columns = [column for column in shown if left <= column <= right]
+        blank_row = [""] * len(output_columns)
+        source = self.model.sourceModel()
+        stream = io.StringIO()
+        writer = csv.writer(stream, delimiter="\t")
+        next_row = bands[0][0]
+        for first, last, columns in bands:
+            writer.writerows(repeat(blank_row, first - next_row))  # Unselected rows between bands
+            for start in range(first, last + 1, COPY_CHUNK):
+                rows = self.model.source_rows(start, min(last, start + COPY_CHUNK - 1))
+                values = dict(zip(columns, source.display_columns(rows, columns)))
+                writer.writerows(zip(*[values.get(column, repeat("")) for column in output_columns]))
+            next_row = last + 1
+        qApp.clipboard().setText(stream.getvalue())
+
+    def export(self, path, file_format=None):
+        """
+        Exports the rows shown in the table, in the order shown and with only the shown columns, to a CSV (.csv),
+        TSV (.tsv or .txt) or binary columnar (.tcol) file on a background thread. Returns the Worker running the
+        export; see export.start_export().
+
+        :param path: str, path of the file to write
+        :param file_format: str, "csv", "tsv" or "columnar", or None to choose from the file extension
+        """
+
+        from export import start_export  # Imported on first use, to keep it out of startup
+        columns = [column for column in range(self.model.columnCount()) if not self.isColumnHidden(column)]
+        return start_export(self.model, path, columns, file_format)
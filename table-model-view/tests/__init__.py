@@ -0,0 +1,64 @@
+#!/usr/bin/env python3
+#
+#   __init__.py
+#   Shared set-up for the table-model-view tests
+#   Using Python 3.6 and PySide2 v.5.12
+#   Run from the table-model-view directory: python -m unittest discover tests
+#
+#   Copyright (C) 2019 Robert Parker
+#
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with this program. If not, see <https://www.gnu.org/licenses/>.
+
+
+import os
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")  # Before the QApplication is created
+from PySide2.QtWidgets import QApplication
+from table_models import TableModel
+
+ALIGNMENTS = {"str": "left", "bool": "center"}  # Columns of other types are right-aligned
+
+
+def start_application():
+    """Creates the QApplication the models need, unless a test module run earlier has created it already"""
+
+    QApplication.instance() or QApplication([])
+
+
+def column_info(columns):
+    """
+    Returns a TableModel info dictionary for test columns, labelled with the capitalized column names
+
+    :param columns: list of (column name, type) pairs
+    """
+
+    return {name: {"Label": name.capitalize(), "Width": 60, "Type": column_type,
+                   "Alignment": ALIGNMENTS.get(column_type, "right")} for name, column_type in columns}
+
+
+def make_model(columns, rows, columnar=False):
+    """
+    Returns a TableModel holding rows
+
+    :param columns: list of (column name, type) pairs
+    :param rows: list of lists containing table data, organized as row[column]
+    :param columnar: bool, whether the model copies the rows into a ColumnStore
+    """
+
+    return TableModel([name for name, column_type in columns], rows, column_info(columns), columnar=columnar)
+
+
+def shown_rows(proxy):
+    """Returns the source row shown as each row of a proxy, in the order shown"""
+
+    return [proxy.mapToSource(proxy.index(row, 0)).row() for row in range(proxy.rowCount())]
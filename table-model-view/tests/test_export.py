@@ -0,0 +1,122 @@
+#!/usr/bin/env python3
+#
+#   test_export.py
+#   Tests that exports of a filtered, sorted ProxyModel read back as the rows it shows
+#   Using Python 3.6 and PySide2 v.5.12
+#   Run from the table-model-view directory: python -m unittest discover tests
+#
+#   Copyright (C) 2019 Robert Parker
+#
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with this program. If not, see <https://www.gnu.org/licenses/>.
+
+
+import os
+import csv
+import time
+import tempfile
+import unittest
+from PySide2.QtWidgets import QApplication
+from PySide2.QtCore import Qt, QThreadPool, SIGNAL
+from tests import start_application, make_model
+from table_models import ProxyModel
+from export import EXPORT_CHUNK, export_rows, read_columnar, start_export
+from loaders import load_table
+
+COLUMNS = [("name", "str"), ("count", "int"), ("big", "int"), ("price", "float"), ("flag", "bool")]
+ROW_COUNT = EXPORT_CHUNK + 500  # More than one chunk
+
+
+def setUpModule():
+    start_application()
+
+
+def make_rows():
+    return [["item {}".format(row % 40) if row % 3 else "unique, \"quoted\" {}".format(row), row % 200,
+             row * 1000003 - 2 ** 40, row / 8, row % 4 == 0] for row in range(ROW_COUNT)]
+
+
+class ExportTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.model = make_model(COLUMNS, make_rows(), columnar=True)
+        self.proxy = ProxyModel(self.model)
+        self.proxy.add_filter_condition("count", list(range(0, 200, 3)))
+        self.proxy.sort(3, Qt.DescendingOrder)
+
+    def tearDown(self):
+        QThreadPool.globalInstance().waitForDone()
+        self.directory.cleanup()
+
+    def shown_rows(self, columns):
+        """Returns the proxy's rows as lists of stored values, in the order shown"""
+
+        return [[self.model.store.value(row, column) for column in columns] for row in self.proxy.accepted_rows()]
+
+    def export(self, name, file_format, columns):
+        path = os.path.join(self.directory.name, name)
+        names = [self.model.columns[column] for column in columns]
+        header = {"columns": names, "labels": [self.model.header_labels[column] for column in columns],
+                  "types": [self.model.info[name]["Type"] for name in names]}
+        converters = [self.model.converters[column] for column in columns]
+        written = export_rows(None, path, file_format, self.model.store.read_columns, self.proxy.accepted_rows(),
+                              columns, header, converters)
+        self.assertEqual(written, self.proxy.rowCount())
+        self.assertFalse(os.path.exists(path + ".part"))
+        return path
+
+    def test_columnar_round_trip(self):
+        columns = [4, 0, 1, 2, 3]
+        path = self.export("table.tcol", "columnar", columns)
+        header, values = read_columnar(path)
+        self.assertEqual(header["columns"], [self.model.columns[column] for column in columns])
+        self.assertEqual(header["rows"], self.proxy.rowCount())
+        rows = [[bool(row[0])] + list(row[1:]) for row in zip(*values)]
+        self.assertEqual(rows, self.shown_rows(columns))
+        model = load_table(path)
+        self.assertEqual(model.rowCount(), self.proxy.rowCount())
+        self.assertEqual(model.store.value(0, 2), self.shown_rows(columns)[0][2])
+
+    def test_csv_round_trip(self):
+        columns = [0, 1, 3]
+        path = self.export("table.csv", "csv", columns)
+        with open(path, newline="", encoding="utf-8") as file:
+            rows = list(csv.reader(file))
+        self.assertEqual(rows[0], ["Name", "Count", "Price"])
+        self.assertEqual(rows[1:], [[str(value) for value in row] for row in self.shown_rows(columns)])
+
+    def test_start_export(self):
+        path = os.path.join(self.directory.name, "table.tsv")
+        start_export(self.proxy, path)
+        deadline = time.time() + 10
+        while not os.path.exists(path) and time.time() < deadline:
+            QApplication.processEvents()
+        QThreadPool.globalInstance().waitForDone()
+        with open(path, newline="", encoding="utf-8") as file:
+            rows = list(csv.reader(file, delimiter="\t"))
+        self.assertEqual(len(rows), self.proxy.rowCount() + 1)
+        self.assertEqual(rows[1][0], str(self.shown_rows([0])[0][0]))
+
+    def test_cancelled_export_disconnects(self):
+        removed = SIGNAL("rowsAboutToBeRemoved(QModelIndex,int,int)")
+        receivers = self.model.receivers(removed)
+        worker = start_export(self.proxy, os.path.join(self.directory.name, "table.csv"))
+        self.assertGreater(self.model.receivers(removed), receivers)
+        worker.cancel()
+        QThreadPool.globalInstance().waitForDone()
+        QApplication.processEvents()
+        self.assertEqual(self.model.receivers(removed), receivers)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,112 @@
+#!/usr/bin/env python3
+#
+#   test_filters.py
+#   Tests that FilterEngine masks and ProxyModel filters match masks worked out cell by cell
+#   Using Python 3.6 and PySide2 v.5.12
+#   Run from the table-model-view directory: python -m unittest discover tests
+#
+#   Copyright (C) 2019 Robert Parker
+#
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with this program. If not, see <https://www.gnu.org/licenses/>.
+
+
+import unittest
+from tests import start_application, make_model, shown_rows
+from table_models import ProxyModel
+from filters import FilterEngine
+
+COLUMNS = [("city", "str"), ("size", "int"), ("flag", "bool")]
+CITIES = ["Cairo", "Giza", "Luxor", "Aswan", "Siwa"]
+
+
+def setUpModule():
+    start_application()
+
+
+def make_cities(columnar):
+    return make_model(COLUMNS, [[CITIES[row % 5], row % 7, row % 3 == 0] for row in range(700)], columnar)
+
+
+def expected_mask(model, conditions):
+    """Row mask worked out cell by cell, for comparison"""
+
+    columns = {name: model.columns.index(name) for name in conditions}
+    return bytearray(all(model.store.value(row, columns[name]) in values for name, values in conditions.items())
+                     for row in range(model.rowCount()))
+
+
+class FilterEngineTest(unittest.TestCase):
+    def check_engine(self, columnar, use_index):
+        model = make_cities(columnar)
+        engine = FilterEngine(model, use_index)
+        conditions = {"city": {"Cairo", "Giza", "Luxor"}}
+        mask = engine.narrow_mask(None, 0, conditions["city"])
+        self.assertEqual(mask, expected_mask(model, conditions))
+        conditions["size"] = {1, 2, 3}
+        mask = engine.narrow_mask(mask, 1, conditions["size"])
+        self.assertEqual(mask, expected_mask(model, conditions))
+        conditions["city"] = {"Cairo"}
+        mask = engine.narrow_mask(mask, 0, conditions["city"])
+        self.assertEqual(mask, expected_mask(model, conditions))
+        conditions["city"] = {"Cairo", "Siwa"}
+        mask = engine.widen_mask(mask, conditions)
+        self.assertEqual(mask, expected_mask(model, conditions))
+        del conditions["size"]
+        mask = engine.widen_mask(mask, conditions)
+        self.assertEqual(mask, expected_mask(model, conditions))
+        self.assertEqual(mask, engine.compute_mask(conditions))
+        self.assertIsNone(engine.widen_mask(mask, {}))
+
+    def test_narrow_and_widen(self):
+        for columnar in (False, True):
+            for use_index in (False, True):
+                with self.subTest(columnar=columnar, use_index=use_index):
+                    self.check_engine(columnar, use_index)
+
+    def test_index_follows_edits(self):
+        model = make_cities(True)
+        engine = FilterEngine(model)
+        engine.column_mask(0, {"Cairo"})  # Builds the value index
+        model.setData(model.index(1, 0), "Cairo")
+        engine.invalidate([0])
+        self.assertEqual(engine.column_mask(0, {"Cairo"}), expected_mask(model, {"city": {"Cairo"}}))
+
+
+class ProxyFilterTest(unittest.TestCase):
+    def test_incremental_filters_match_full_filter(self):
+        model = make_cities(True)
+        proxy = ProxyModel(model)
+        steps = [("city", ["Cairo", "Giza"]), ("size", [0, 1, 2, 3]), ("city", ["Cairo"]), ("city", CITIES),
+                 ("flag", [True]), ("size", list(range(7)))]
+        conditions = {}
+        for name, values in steps:
+            proxy.add_filter_condition(name, values)
+            conditions[name] = set(values)
+            expected = [row for row, state in enumerate(expected_mask(model, conditions)) if state]
+            self.assertEqual(shown_rows(proxy), expected)
+        proxy.remove_row(expected[0])
+        self.assertEqual(shown_rows(proxy), expected[1:])
+        proxy.reset_filters()
+        self.assertEqual(proxy.rowCount(), model.rowCount())
+
+    def test_unknown_column_is_ignored(self):
+        model = make_cities(False)
+        proxy = ProxyModel(model)
+        proxy.add_filter_condition("city", ["Cairo"])
+        proxy.add_filter_condition("country", ["Egypt"])
+        self.assertEqual(shown_rows(proxy), [row for row in range(700) if row % 5 == 0])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,122 @@
+#!/usr/bin/env python3
+#
+#   test_proxy_sort.py
+#   Tests that sorting a ProxyModel leaves the TableModel and other proxies over it unchanged
+#   Using Python 3.6 and PySide2 v.5.12
+#   Run from the table-model-view directory: python -m unittest discover tests
+#
+#   Copyright (C) 2019 Robert Parker
+#
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with this program. If not, see <https://www.gnu.org/licenses/>.
+
+
+import unittest
+from PySide2.QtCore import Qt, QPersistentModelIndex
+from tests import start_application, make_model, shown_rows
+from table_models import ProxyModel
+
+COLUMNS = [("name", "str"), ("score", "int"), ("id", "int")]
+
+
+def setUpModule():
+    start_application()
+
+
+def make_rows(count=500):
+    """Returns rows with repeated scores, so that the sort has ties, and a unique id equal to the row number"""
+
+    return [["name{}".format(row % 13), (row * 7919) % 101, row] for row in range(count)]
+
+
+def proxy_column(proxy, column):
+    """Returns a column's values in the order the proxy shows them"""
+
+    return [proxy.data(proxy.index(row, column)) for row in range(proxy.rowCount())]
+
+
+class ProxySortTest(unittest.TestCase):
+    columnar = False
+
+    def setUp(self):
+        self.rows = make_rows()
+        self.model = make_model(COLUMNS, self.rows, self.columnar)
+        self.sorted_proxy = ProxyModel(self.model)
+        self.other_proxy = ProxyModel(self.model)
+
+    def test_sort_leaves_other_proxy_unchanged(self):
+        before = proxy_column(self.other_proxy, 2)
+        self.sorted_proxy.sort(1, Qt.DescendingOrder)
+        self.assertEqual(proxy_column(self.other_proxy, 2), before)
+        self.assertEqual(before, list(range(len(self.rows))))
+
+    def test_sort_leaves_model_indexes_unchanged(self):
+        persistent = QPersistentModelIndex(self.model.index(42, 2))
+        self.sorted_proxy.sort(1)
+        for row in range(self.model.rowCount()):
+            self.assertEqual(self.model.index(row, 2).data(), row)
+        self.assertEqual(persistent.row(), 42)
+        if not self.columnar:
+            self.assertIs(self.model.dataset, self.rows)
+
+    def test_sorted_order(self):
+        for order in (Qt.AscendingOrder, Qt.DescendingOrder):
+            self.sorted_proxy.sort(1, order)
+            keys = list(zip(proxy_column(self.sorted_proxy, 1), proxy_column(self.sorted_proxy, 2)))
+            descending = order == Qt.DescendingOrder
+            expected = sorted(keys, key=lambda key: (-key[0], key[1]) if descending else key)
+            self.assertEqual(keys, expected)  # Ties keep model order in either direction
+
+    def test_edit_through_sorted_proxy(self):
+        self.sorted_proxy.sort(1, Qt.DescendingOrder)
+        index = self.sorted_proxy.index(0, 0)
+        source_row = self.sorted_proxy.mapToSource(index).row()
+        self.assertTrue(self.sorted_proxy.setData(index, "edited"))
+        self.assertEqual(self.model.index(source_row, 0).data(), "edited")
+        self.assertEqual(self.other_proxy.index(source_row, 0).data(), "edited")
+        self.assertEqual(self.sorted_proxy.index(0, 0).data(), "edited")
+
+    def test_filter_keeps_sort(self):
+        self.sorted_proxy.sort(1)
+        self.sorted_proxy.add_filter_condition("name", ["name1", "name2"])
+        expected = sorted((row for row in range(self.model.rowCount())
+                           if self.model.store.value(row, 0) in ("name1", "name2")),
+                          key=lambda row: self.model.store.value(row, 1))
+        self.assertEqual(shown_rows(self.sorted_proxy), expected)
+        self.assertEqual(self.other_proxy.rowCount(), self.model.rowCount())
+
+    def test_insert_keeps_filter_and_sort(self):
+        self.sorted_proxy.sort(1)
+        self.sorted_proxy.add_filter_condition("name", ["name1", "name2"])
+        self.model.insert_rows(10, [["name1", 50, -1], ["name2", 0, -2], ["name3", 50, -3]])
+        expected = sorted((row for row in range(self.model.rowCount())
+                           if self.model.store.value(row, 0) in ("name1", "name2")),
+                          key=lambda row: self.model.store.value(row, 1))
+        self.assertEqual(shown_rows(self.sorted_proxy), expected)
+        self.assertEqual(proxy_column(self.other_proxy, 2)[10:13], [-1, -2, -3])
+
+    def test_remove_rows_keeps_mapping(self):
+        self.sorted_proxy.sort(1)
+        self.model.remove_rows([0, 1, 2, 250, 499])
+        shown = shown_rows(self.sorted_proxy)
+        self.assertEqual(sorted(shown), list(range(self.model.rowCount())))
+        keys = [self.model.store.value(row, 1) for row in shown]
+        self.assertEqual(keys, sorted(keys))
+
+
+class ColumnarProxySortTest(ProxySortTest):
+    columnar = True
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+#
+#   test_sqlite_model.py
+#   Tests SqliteStore keyset paging and ProxyModel pushdown against SQLite's own results
+#   Using Python 3.6 and PySide2 v.5.12
+#   Run from the table-model-view directory: python -m unittest discover tests
+#
+#   Copyright (C) 2019 Robert Parker
+#
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with this program. If not, see <https://www.gnu.org/licenses/>.
+
+
+import os
+import sqlite3
+import tempfile
+import unittest
+from tests import start_application
+from table_models import ProxyModel
+from sqlite_model import SqliteStore, SqliteTableModel
+
+ROW_COUNT = 1000
+
+
+def setUpModule():
+    start_application()
+
+
+class SqlitePagingTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, "table.db")
+        connection = sqlite3.connect(self.path)
+        connection.execute("CREATE TABLE scores (name TEXT, score INTEGER)")
+        connection.executemany("INSERT INTO scores VALUES (?, ?)",
+                               [("name{}".format(row % 17), None if row % 50 == 0 else row % 23)
+                                for row in range(ROW_COUNT)])
+        connection.commit()
+        connection.close()
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def expected(self, order, where=""):
+        """Returns [rowid, name, score] rows of the table as SQLite orders them"""
+
+        connection = sqlite3.connect(self.path)
+        try:
+            return [list(row) for row in connection.execute(
+                "SELECT rowid, name, score FROM scores{} ORDER BY {}".format(where, order))]
+        finally:
+            connection.close()
+
+    def read_all(self, store):
+        """Reads every row in order, so each page after the first is fetched with a keyset query"""
+
+        return [list(store.stored_row(row)) for row in range(store.row_count())]
+
+    def test_keyset_pages_follow_query_order(self):
+        cases = [(-1, False, "rowid"), (-1, True, "rowid DESC"), (1, False, "score, rowid"),
+                 (1, True, "score DESC, rowid DESC")]
+        for sort_column, descending, order in cases:
+            with self.subTest(order=order):
+                store = SqliteStore(self.path, page_size=64, cache_pages=4)
+                store.set_query(sort_column=sort_column, descending=descending)
+                self.assertEqual(self.read_all(store), self.expected(order))
+                self.assertGreater(len(store.boundaries), 1)  # Later pages continued from a boundary
+
+    def test_keyset_with_filter_and_random_access(self):
+        store = SqliteStore(self.path, page_size=50, cache_pages=3)
+        store.set_query({0: {"name1", "name2"}}, sort_column=1)
+        expected = self.expected("score, rowid", " WHERE name IN ('name1', 'name2')")
+        self.assertEqual(store.row_count(), len(expected))
+        self.assertEqual(list(store.stored_row(len(expected) - 1)), expected[-1])  # An OFFSET query
+        self.assertEqual(self.read_all(store), expected)
+
+    def test_edit_of_sort_column_drops_boundaries(self):
+        store = SqliteStore(self.path, page_size=100)
+        store.set_query(sort_column=1)
+        self.read_all(store)
+        store.set_value(5, 1, 99)
+        self.assertEqual(store.boundaries, {})
+
+    def test_proxy_pushdown(self):
+        model = SqliteTableModel(self.path)
+        proxy = ProxyModel(model)
+        proxy.add_filter_condition("name", ["name3"])
+        proxy.sort(1)
+        scores = [proxy.index(row, 1).data() for row in range(proxy.rowCount())]
+        expected = [row[2] for row in self.expected("score, rowid", " WHERE name = 'name3'")]
+        self.assertEqual(scores, expected)
+        proxy.set_search("name3", "substring")
+        self.assertEqual(proxy.rowCount(), len(expected))
+        proxy.set_search("no such name", "substring")
+        self.assertEqual(proxy.rowCount(), 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
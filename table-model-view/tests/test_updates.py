@@ -0,0 +1,84 @@
+#!/usr/bin/env python3
+#
+#   test_updates.py
+#   Tests that UpdateQueue coalesces updates and applies them to the model in batches
+#   Using Python 3.6 and PySide2 v.5.12
+#   Run from the table-model-view directory: python -m unittest discover tests
+#
+#   Copyright (C) 2019 Robert Parker
+#
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with this program. If not, see <https://www.gnu.org/licenses/>.
+
+
+import threading
+import unittest
+from tests import start_application, make_model
+from updates import UpdateQueue
+
+COLUMNS = [("name", "str"), ("price", "float")]
+
+
+def setUpModule():
+    start_application()
+
+
+class UpdateQueueTest(unittest.TestCase):
+    def setUp(self):
+        self.model = make_model(COLUMNS, [["row{}".format(row), 0.0] for row in range(100)], columnar=True)
+        self.queue = UpdateQueue(self.model)
+        self.signals = []
+        self.model.dataChanged.connect(lambda top_left, bottom_right, roles: self.signals.append(
+            (top_left.row(), bottom_right.row())))
+
+    def test_repeated_updates_coalesce(self):
+        for value in range(10):
+            self.queue.push(5, 1, float(value))
+        self.queue.push_many([(6, 1, 1.0), (6, 1, 2.0), (5, 1, 42.0)])
+        self.assertEqual(self.queue.stats(), {"received": 13, "coalesced": 11, "applied": 0, "pending": 2})
+        self.queue.drain()
+        self.assertEqual(self.model.store.value(5, 1), 42.0)
+        self.assertEqual(self.model.store.value(6, 1), 2.0)
+        self.assertEqual(self.queue.stats(), {"received": 13, "coalesced": 11, "applied": 2, "pending": 0})
+        self.assertEqual(self.signals, [(5, 6)])  # One dataChanged for the run of changed rows
+
+    def test_push_row(self):
+        self.queue.push_row(3, ["renamed", 1.5])
+        self.queue.drain()
+        self.assertEqual([self.model.store.value(3, column) for column in range(2)], ["renamed", 1.5])
+
+    def test_out_of_range_updates_are_dropped(self):
+        self.queue.push_many([(100, 1, 1.0), (-1, 1, 1.0), (0, 2, 1.0), (0, 1, "not a number"), (1, 1, 3.0)])
+        self.queue.drain()
+        self.assertEqual(self.queue.applied, 1)
+        self.assertEqual(self.model.store.value(0, 1), 0.0)
+        self.assertEqual(self.model.store.value(1, 1), 3.0)
+
+    def test_push_from_threads(self):
+        def produce(offset):
+            for value in range(1000):
+                self.queue.push(offset, 1, float(value))
+
+        threads = [threading.Thread(target=produce, args=(row,)) for row in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(self.queue.received, 4000)
+        self.assertEqual(self.queue.coalesced, 3996)
+        self.queue.drain()
+        self.assertEqual([self.model.store.value(row, 1) for row in range(4)], [999.0] * 4)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,122 @@
+#!/usr/bin/env python3
+#
+#   updates.py
+#   Coalescing queue for applying a live feed of cell updates to a TableModel
+#   Using Python 3.6 and PySide2 v.5.12
+#
+#   Copyright (C) 2019 Robert Parker
+#
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with this program. If not, see <https://www.gnu.org/licenses/>.
+
+
+from threading import Lock
+from PySide2.QtCore import QObject, QTimer
+
+
+class UpdateQueue(QObject):
+    def __init__(self, model, interval=16):
+        """
+        Collects cell updates pushed from any thread and applies them to a TableModel on the GUI thread once per
+        interval, so that a fast feed repaints the view at most once per frame rather than once per message. Updates
+        to a cell which has not been applied yet replace the pending value, so only the latest value of each cell is
+        written. Each drain goes through TableModel.set_cells(), which emits one dataChanged per run of changed rows.
+
+        Create the queue on the GUI thread (TableModel.start_live_updates() does this) and call push(), push_row() or
+        push_many() from producer threads. Rows are stored model rows, as for set_cells(), not view rows: sorting or
+        filtering a ProxyModel never renumbers them, so a pending update always lands on the record it was pushed for.
+        Only inserting or removing model rows part way through the table renumbers the rows after them. Updates to
+        rows which no longer exist when the queue is drained are dropped.
+
+        The counters received, coalesced (replaced by a later update to the same cell before being applied) and
+        applied (written to the model) can be read at any time, or together with stats().
+
+        :param model: TableModel object to update
+        :param interval: int, milliseconds between drains, e.g. 16 for about 60 per second
+        """
+
+        super().__init__()
+        self.model = model
+        self.lock = Lock()
+        self.pending = {}  # (stored row, column) -> latest value not yet applied
+        self.received = 0
+        self.coalesced = 0
+        self.applied = 0
+        self.timer = QTimer(self)
+        self.timer.setInterval(interval)
+        self.timer.timeout.connect(self.drain)
+
+    def start(self):
+        """Starts draining the queue every interval"""
+
+        self.timer.start()
+
+    def stop(self):
+        """Stops draining the queue, after applying any updates still pending"""
+
+        self.timer.stop()
+        self.drain()
+
+    def set_interval(self, interval):
+        """Sets the number of milliseconds between drains"""
+
+        self.timer.setInterval(interval)
+
+    def push(self, row, column, value):
+        """Queues a new value for a single cell. Safe to call from any thread."""
+
+        with self.lock:
+            if (row, column) in self.pending:
+                self.coalesced += 1
+            self.pending[(row, column)] = value
+            self.received += 1
+
+    def push_row(self, row, values):
+        """Queues new values for every column of a row. Safe to call from any thread."""
+
+        self.push_many((row, column, value) for column, value in enumerate(values))
+
+    def push_many(self, updates):
+        """
+        Queues many cell updates under one lock. Safe to call from any thread.
+
+        :param updates: iterable of (row, column, value) triples
+        """
+
+        updates = list(updates)
+        with self.lock:
+            pending = self.pending
+            before = len(pending)
+            for row, column, value in updates:
+                pending[(row, column)] = value
+            self.coalesced += before + len(updates) - len(pending)
+            self.received += len(updates)
+
+    def drain(self):
+        """Applies every pending update to the model. Called by the timer on the GUI thread."""
+
+        with self.lock:
+            if not self.pending:
+                return
+            pending, self.pending = self.pending, {}
+        row_count = self.model.rowCount()
+        column_count = self.model.columnCount()
+        self.applied += self.model.set_cells((row, column, value) for (row, column), value in pending.items()
+                                             if 0 <= row < row_count and 0 <= column < column_count)
+
+    def stats(self):
+        """Returns the counters as a dictionary, with the number of updates still pending"""
+
+        with self.lock:
+            return {"received": self.received, "coalesced": self.coalesced, "applied": self.applied,
+                    "pending": len(self.pending)}
@@ -0,0 +1,84 @@
+#!/usr/bin/env python3
+#
+#   workers.py
+#   Runs long table operations (filtering, sorting, exporting, loading) on a background thread
+#   Using Python 3.6 and PySide2 v.5.12
+#
+#   Copyright (C) 2019 Robert Parker
+#
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with this program. If not, see <https://www.gnu.org/licenses/>.
+
+
+from PySide2.QtCore import QObject, QRunnable, QThreadPool, Signal
+
+
+class WorkerSignals(QObject):
+    """
+    Signals emitted by a Worker. The object is created on the GUI thread, so slots connected to it run on the GUI
+    thread even though the signals are emitted from the worker's thread.
+    """
+
+    progress = Signal(int)  # Percent complete
+    finished = Signal(object)  # Return value of the worker function, not emitted if the worker was cancelled
+    failed = Signal(str)  # Error message if the worker function raised an exception
+    done = Signal()  # Emitted last in every case, including cancellation, e.g. to release the worker
+
+
+class Worker(QRunnable):
+    def __init__(self, function, *args):
+        """
+        Subclass of QRunnable that calls function(worker, *args) on a QThreadPool thread and emits the result through
+        self.signals. The function receives the worker so it can call report() to update progress and check
+        worker.cancelled to stop early. The function must not touch Qt widgets or models; pass it copies of the data
+        it needs and apply the result in a slot connected to signals.finished.
+
+        :param function: callable to run, taking the worker as its first argument
+        :param args: further arguments for the function
+        """
+
+        super().__init__()
+        self.setAutoDelete(False)  # The Python object is kept by its owner until the result has been handled
+        self.function = function
+        self.args = args
+        self.signals = WorkerSignals()
+        self.cancelled = False
+
+    def run(self):
+        """Calls the worker function. Reimplemented from QRunnable"""
+
+        try:
+            try:
+                result = self.function(self, *self.args)
+            except Exception as error:
+                self.signals.failed.emit(str(error))
+                return
+            if not self.cancelled:
+                self.signals.finished.emit(result)
+        finally:
+            self.signals.done.emit()
+
+    def start(self, pool=None):
+        """Queues the worker on a thread pool, by default the global pool"""
+
+        (pool or QThreadPool.globalInstance()).start(self)
+
+    def cancel(self):
+        """Asks the worker function to stop. Its result, if it still returns one, is not emitted."""
+
+        self.cancelled = True
+
+    def report(self, percent):
+        """Emits the progress signal. Call from the worker function."""
+
+        self.signals.progress.emit(int(percent))